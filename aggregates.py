@@ -0,0 +1,251 @@
+# Money Track App - running ledger aggregates
+
+from datetime import date
+
+
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def month_key(month):
+    """
+    Formats a month number (year * 12 + month - 1) as 'YYYY-MM'.
+    """
+    year, index = divmod(month, 12)
+    return f"{year:04d}-{index + 1:02d}"
+
+
+def month_number(key):
+    """
+    Converts a 'YYYY-MM' key back to a month number.
+    """
+    return int(key[0:4]) * 12 + int(key[5:7]) - 1
+
+
+def day_year(day):
+    """
+    Returns the year of a day number (days since 1970-01-01).
+    """
+    return date.fromordinal(day + _EPOCH_ORDINAL).year
+
+
+class CumulativeTotals:
+    """
+    Cumulative [cents, count] per day, as two Fenwick (binary indexed)
+    trees over a range of day numbers (days since 1970-01-01).
+
+    Both adding a day's amount and summing every day before a given day
+    take O(log d) steps for a range of d days, so the ledger's balance at
+    any date and the total of any range of days are answered without
+    walking the transactions or the daily totals. The range has room for
+    a year after the last day; a day outside it cannot be added and the
+    tree has to be rebuilt (see covers()).
+    """
+
+    def __init__(self, days):
+        first = min(days, default=0)
+        span = max(days, default=0) - first + 1
+        size = 1
+        while size < span + 366:
+            size *= 2
+        self.first = first
+        self.size = size
+        self.cents = [0] * (size + 1)
+        self.counts = [0] * (size + 1)
+        for day, (cents, count) in days.items():
+            self.cents[day - first + 1] += cents
+            self.counts[day - first + 1] += count
+        # Each node passes its sum on to its parent: built in O(d).
+        for index in range(1, size + 1):
+            parent = index + (index & -index)
+            if parent <= size:
+                self.cents[parent] += self.cents[index]
+                self.counts[parent] += self.counts[index]
+
+    def covers(self, day):
+        return 0 <= day - self.first < self.size
+
+    def add(self, day, cents, count):
+        """
+        Adds 'cents' and 'count' to 'day', which must be covered.
+        """
+        index = day - self.first + 1
+        while index <= self.size:
+            self.cents[index] += cents
+            self.counts[index] += count
+            index += index & -index
+
+    def before(self, day):
+        """
+        Returns the total [cents, count] of every day before 'day'.
+        """
+        index = min(max(day - self.first, 0), self.size)
+        cents = count = 0
+        while index:
+            cents += self.cents[index]
+            count += self.counts[index]
+            index -= index & -index
+        return cents, count
+
+
+class LedgerAggregates:
+    """
+    Running totals for a ledger, kept up to date on every add and delete.
+
+    Holds the balance plus [total cents, transaction count] pairs per day,
+    month and year, per category, per type and per (month, category). Each
+    add or delete touches one entry in each table, so the balance, the
+    monthly report and the budget checks never need to rescan the
+    transactions. Groups whose count drops to zero are removed so the
+    report only lists months that still have transactions.
+
+    The daily totals are also summed up in a CumulativeTotals tree, built
+    on the first range query and kept up to date from then on, for the
+    balance at a date and the totals of a range of days (see before()).
+    """
+
+    def __init__(self):
+        self.balance = 0
+        self.count = 0
+        self.months = {}
+        self.categories = {}
+        self.types = {}
+        self.month_categories = {}
+        self.days = {}
+        self.years = {}
+        self._cumulative = None
+
+    @staticmethod
+    def _update(table, key, cents, count):
+        entry = table.get(key)
+        if entry is None:
+            entry = table[key] = [0, 0]
+        entry[0] += cents
+        entry[1] += count
+        if entry[1] <= 0:
+            del table[key]
+
+    def _update_day(self, day, cents, count):
+        self._update(self.days, day, cents, count)
+        cumulative = self._cumulative
+        if cumulative is not None:
+            if cumulative.covers(day):
+                cumulative.add(day, cents, count)
+            else:
+                self._cumulative = None
+
+    def add(self, month, t_type, category, cents, day):
+        """
+        Records a transaction of 'cents' in the given month and day
+        numbers.
+        """
+        self.balance += cents
+        self.count += 1
+        self._update(self.months, month, cents, 1)
+        self._update(self.categories, category, cents, 1)
+        self._update(self.types, t_type, cents, 1)
+        self._update(self.month_categories, (month, category), cents, 1)
+        self._update(self.years, month // 12, cents, 1)
+        self._update_day(day, cents, 1)
+
+    def remove(self, month, t_type, category, cents, day):
+        """
+        Reverses a previous add() for a deleted transaction.
+        """
+        self.balance -= cents
+        self.count -= 1
+        self._update(self.months, month, -cents, -1)
+        self._update(self.categories, category, -cents, -1)
+        self._update(self.types, t_type, -cents, -1)
+        self._update(self.month_categories, (month, category), -cents, -1)
+        self._update(self.years, month // 12, -cents, -1)
+        self._update_day(day, -cents, -1)
+
+    def merge(self, other, sign=1):
+        """
+        Adds the totals of another ledger's aggregates to these, or with
+        'sign' -1 takes them out again.
+        """
+        self.balance += sign * other.balance
+        self.count += sign * other.count
+        for table, other_table in (
+            (self.months, other.months),
+            (self.categories, other.categories),
+            (self.types, other.types),
+            (self.month_categories, other.month_categories),
+            (self.days, other.days),
+            (self.years, other.years),
+        ):
+            for key, (cents, count) in other_table.items():
+                self._update(table, key, sign * cents, sign * count)
+        self._cumulative = None
+
+    def monthly_totals(self):
+        """
+        Net amount in cents per month, keyed by 'YYYY-MM'.
+        """
+        return {
+            month_key(month): entry[0]
+            for month, entry in self.months.items()
+        }
+
+    def before(self, day):
+        """
+        Returns the total [cents, count] of the transactions before the
+        given day number, in O(log d) for a ledger spanning d days.
+        """
+        cumulative = self._cumulative
+        if cumulative is None or not cumulative.covers(day):
+            cumulative = self._cumulative = CumulativeTotals(self.days)
+        return cumulative.before(day)
+
+    def month_category_cents(self, month, category):
+        """
+        Net amount in cents of 'category' in the given month number.
+        """
+        entry = self.month_categories.get((month, category))
+        return entry[0] if entry else 0
+
+    def to_dict(self):
+        return {
+            "balance": self.balance,
+            "count": self.count,
+            "months": {
+                month_key(month): entry
+                for month, entry in self.months.items()
+            },
+            "categories": self.categories,
+            "types": self.types,
+            "month_categories": [
+                [month_key(month), category, entry]
+                for (month, category), entry in self.month_categories.items()
+            ],
+            "days": self.days,
+            "years": self.years,
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        aggregates = cls()
+        aggregates.balance = data["balance"]
+        aggregates.count = data["count"]
+        aggregates.months = {
+            month_number(key): list(entry)
+            for key, entry in data["months"].items()
+        }
+        aggregates.categories = {
+            key: list(entry) for key, entry in data["categories"].items()
+        }
+        aggregates.types = {
+            key: list(entry) for key, entry in data["types"].items()
+        }
+        aggregates.month_categories = {
+            (month_number(month), category): list(entry)
+            for month, category, entry in data["month_categories"]
+        }
+        aggregates.days = {
+            int(key): list(entry) for key, entry in data["days"].items()
+        }
+        aggregates.years = {
+            int(key): list(entry) for key, entry in data["years"].items()
+        }
+        return aggregates
@@ -0,0 +1,329 @@
+# Money Track App - compressed archive of old months
+
+import os
+import gzip
+import json
+import heapq
+from operator import attrgetter
+from collections import OrderedDict
+from aggregates import LedgerAggregates, month_key, month_number
+from store import TransactionStore, format_cents, format_timestamp
+from metrics import count
+
+
+# Segment files are gzip-compressed NDJSON, one
+# [id, type, category, cents, epoch seconds] list per line, in time order.
+SEGMENT_SUFFIX = ".ndjson.gz"
+
+# Segments kept decompressed in memory after a listing opened them.
+OPEN_SEGMENTS = 12
+
+# Columns of the segment listing, in order.
+SEGMENT_FIELDS = ("month", "file", "rows", "net", "first", "last")
+
+
+def archive_directory(filename):
+    """
+    Returns the directory the archived months of a ledger are kept in,
+    e.g. 'transactions.json' -> 'transactions.archive'.
+    """
+    root, _ = os.path.splitext(filename)
+    return root + ".archive"
+
+
+def index_path(filename):
+    """
+    Returns the index of a ledger's archive, which lists its segments
+    with their summaries.
+    """
+    return os.path.join(archive_directory(filename), "index.json")
+
+
+def segment_name(month, used):
+    """
+    Returns a file name for a new segment of the given month number that
+    is not in 'used': 'YYYY-MM.ndjson.gz', then 'YYYY-MM.2.ndjson.gz' and
+    so on for rows of the month archived by later runs.
+    """
+    name = month_key(month) + SEGMENT_SUFFIX
+    number = 1
+    while name in used:
+        number += 1
+        name = f"{month_key(month)}.{number}{SEGMENT_SUFFIX}"
+    return name
+
+
+def group_by_month(rows):
+    """
+    Groups (id, type, category, cents, epoch seconds) rows by month
+    number, keeping their order; returns {month number: rows}.
+    """
+    months = {}
+    month_of_day = {}
+    for row in rows:
+        day = row[4] // 86400
+        month = month_of_day.get(day)
+        if month is None:
+            month = month_of_day[day] = month_number(
+                format_timestamp(day * 86400)[:7]
+            )
+        months.setdefault(month, []).append(row)
+    return months
+
+
+def write_segment(file, rows):
+    """
+    Writes (id, type, category, cents, epoch seconds) rows, in time
+    order, to the binary file 'file' as a compressed segment.
+    """
+    with gzip.GzipFile(fileobj=file, mode="wb", mtime=0) as stream:
+        stream.write("".join(
+            json.dumps(row) + "\n" for row in rows
+        ).encode("utf-8"))
+
+
+def read_segment(path):
+    """
+    Yields the (id, type, category, cents, epoch seconds) rows of a
+    segment file.
+    """
+    with gzip.open(path, "rt", encoding="utf-8") as stream:
+        for line in stream:
+            transaction_id, t_type, category, cents, seconds = json.loads(
+                line
+            )
+            yield transaction_id, t_type, category, cents, seconds
+
+
+def segment_summary(name, rows):
+    """
+    Summarizes the rows of one segment, all of one month: its file name,
+    month, row count, time range [start, end), the next id after its
+    rows, its aggregates and its totals per (month number, type,
+    category) as [cents, count] (see TransactionStore.monthly_breakdown()).
+    """
+    aggregates = LedgerAggregates()
+    breakdown = {}
+    start = end = None
+    next_id = 1
+    month = None
+    for transaction_id, t_type, category, cents, seconds in rows:
+        if month is None:
+            month = month_number(format_timestamp(seconds)[:7])
+        aggregates.add(month, t_type, category, cents, seconds // 86400)
+        entry = breakdown.setdefault((month, t_type, category), [0, 0])
+        entry[0] += cents
+        entry[1] += 1
+        start = seconds if start is None else min(start, seconds)
+        end = seconds + 1 if end is None else max(end, seconds + 1)
+        next_id = max(next_id, transaction_id + 1)
+    return {
+        "file": name,
+        "month": month_key(min(aggregates.months, default=0)),
+        "rows": aggregates.count,
+        "start": start,
+        "end": end,
+        "next_id": next_id,
+        "aggregates": aggregates,
+        "breakdown": breakdown,
+    }
+
+
+def write_index(file, segments):
+    """
+    Writes the summaries of an archive's segments to its index file.
+    """
+    json.dump({"segments": [
+        dict(
+            segment,
+            aggregates=segment["aggregates"].to_dict(),
+            breakdown=[
+                [month_key(month), t_type, category, entry]
+                for (month, t_type, category), entry
+                in segment["breakdown"].items()
+            ],
+        )
+        for segment in segments
+    ]}, file)
+
+
+def read_index(filename):
+    """
+    Returns the segment summaries listed in the archive index of the
+    ledger 'filename', or an empty list if it has no archive.
+    """
+    try:
+        with open(index_path(filename), "r") as file:
+            segments = json.load(file)["segments"]
+    except FileNotFoundError:
+        return []
+    for segment in segments:
+        segment["aggregates"] = LedgerAggregates.from_dict(
+            segment["aggregates"]
+        )
+        segment["breakdown"] = {
+            (month_number(month), t_type, category): entry
+            for month, t_type, category, entry in segment["breakdown"]
+        }
+    return segments
+
+
+def unlisted_segments(filename, segments):
+    """
+    Returns the names of the segment files in the archive directory that
+    the index does not list, left by an archiving run that stopped before
+    it wrote the index.
+    """
+    try:
+        files = os.listdir(archive_directory(filename))
+    except FileNotFoundError:
+        return []
+    listed = {segment["file"] for segment in segments}
+    return sorted(
+        name for name in files
+        if name.endswith(SEGMENT_SUFFIX) and name not in listed
+    )
+
+
+def is_archived(transactions, rows):
+    """
+    Tells whether an unlisted segment's 'rows' were taken out of the
+    ledger 'transactions': if any of them is still there, the run that
+    wrote the segment stopped before deleting them, and the segment does
+    not count.
+    """
+    return not any(
+        transactions.get_by_id(row[0]) is not None for row in rows
+    )
+
+
+def load_archive(filename, transactions):
+    """
+    Returns the Archive of the ledger 'filename', or None if nothing has
+    been archived.
+
+    Only the index is read. A segment the index does not list yet (see
+    unlisted_segments()) is read and counted if its rows are no longer
+    in 'transactions', the hot part of the ledger just loaded; the next
+    archiving run adds it to the index or removes it.
+    """
+    segments = read_index(filename)
+    directory = archive_directory(filename)
+    for name in unlisted_segments(filename, segments):
+        rows = list(read_segment(os.path.join(directory, name)))
+        if is_archived(transactions, rows):
+            segments.append(segment_summary(name, rows))
+    if not segments:
+        return None
+    return Archive(directory, segments)
+
+
+def archived_aggregates(filename):
+    """
+    Returns the aggregates of every archived month of the ledger
+    'filename' from the index alone, or None if there are segments it
+    does not list yet, which need the ledger loaded (see load_archive()).
+    """
+    segments = read_index(filename)
+    if unlisted_segments(filename, segments):
+        return None
+    aggregates = LedgerAggregates()
+    for segment in segments:
+        aggregates.merge(segment["aggregates"])
+    return aggregates
+
+
+class Archive:
+    """
+    The archived months of a ledger: immutable, compressed segment files
+    of one month each, with the summary of each kept in the archive's
+    index.
+
+    A TransactionStore the archive is attached to counts the summaries
+    in its aggregates and its monthly breakdown (see
+    TransactionStore.attach_archive()), so balances and reports never
+    decompress a segment. Only listing the transactions of archived
+    months opens the segments they span (see iter_query()); the most
+    recently opened ones stay in memory.
+    """
+
+    def __init__(self, directory, segments):
+        self.directory = directory
+        self.segments = sorted(
+            segments, key=lambda segment: (segment["start"], segment["file"])
+        )
+        self.aggregates = LedgerAggregates()
+        self.breakdown = {}
+        self.next_id = 1
+        for segment in self.segments:
+            self.aggregates.merge(segment["aggregates"])
+            for key, (cents, rows) in segment["breakdown"].items():
+                entry = self.breakdown.setdefault(key, [0, 0])
+                entry[0] += cents
+                entry[1] += rows
+            self.next_id = max(self.next_id, segment["next_id"])
+        self._opened = OrderedDict()
+
+    def __len__(self):
+        return self.aggregates.count
+
+    def open(self, segment):
+        """
+        Returns the rows of 'segment' as a TransactionStore, decompressing
+        the file unless it was opened recently.
+        """
+        name = segment["file"]
+        store = self._opened.get(name)
+        if store is not None:
+            self._opened.move_to_end(name)
+            return store
+        count("archive.segments_opened")
+        store = TransactionStore()
+        store.load_values(
+            read_segment(os.path.join(self.directory, name)),
+            segment["aggregates"],
+        )
+        self._opened[name] = store
+        if len(self._opened) > OPEN_SEGMENTS:
+            self._opened.popitem(last=False)
+        return store
+
+    def iter_query(self, category=None, start=None, end=None):
+        """
+        Yields the archived rows in time order, optionally filtered like
+        TransactionStore.iter_query().
+
+        Segments outside [start, end) are skipped from their summaries,
+        and the others are opened one month at a time as the rows are
+        consumed, so a listing that stops early decompresses little.
+        """
+        months = OrderedDict()
+        for segment in self.segments:
+            if start is not None and segment["end"] <= start:
+                continue
+            if end is not None and segment["start"] >= end:
+                continue
+            if category is not None and not any(
+                name.title() == category.title()
+                for name in segment["aggregates"].categories
+            ):
+                continue
+            months.setdefault(segment["month"], []).append(segment)
+        by_time = attrgetter("epoch")
+        for segments in months.values():
+            yield from heapq.merge(*(
+                self.open(segment).iter_query(category, start, end)
+                for segment in segments
+            ), key=by_time)
+
+    def records(self):
+        """
+        Yields the segments as rows of SEGMENT_FIELDS.
+        """
+        for segment in self.segments:
+            yield (
+                segment["month"], segment["file"], str(segment["rows"]),
+                format_cents(segment["aggregates"].balance),
+                format_timestamp(segment["start"]),
+                format_timestamp(segment["end"] - 1),
+            )
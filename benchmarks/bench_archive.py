@@ -0,0 +1,107 @@
+# Money Track App - archive benchmark
+#
+# Usage: python3 benchmarks/bench_archive.py [--rows 1000000]
+#                                            [--keep-months 12]
+#                                            [--storage journal]
+#
+# Builds a synthetic ledger spread over about ten years, times loading it
+# and building the monthly report, archives every month but the last
+# '--keep-months' (see archive.py) and times the same again, and prints
+# one JSON object per step. Exits with status 1 if the balance or the
+# report differ after archiving.
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_ledger import generate_ledger, code_version  # noqa: E402
+import storage  # noqa: E402
+from storage import save_transactions, load_transactions  # noqa: E402
+from storage import archive_transactions, flush_storage  # noqa: E402
+from aggregates import month_key  # noqa: E402
+from reports import monthly_report  # noqa: E402
+from store import period_bounds  # noqa: E402
+
+
+def measure(operation, function, **fields):
+    """
+    Runs 'function', prints how long it took and returns its result.
+    """
+    started = time.perf_counter()
+    result = function()
+    print(json.dumps(dict(
+        fields, operation=operation,
+        seconds=round(time.perf_counter() - started, 6),
+    )), flush=True)
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the Money Track archive of old months."
+    )
+    parser.add_argument(
+        "--rows", type=int, default=1_000_000,
+        help="transactions in the ledger (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--keep-months", type=int, default=12,
+        help="recent months kept in the ledger (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--storage", choices=sorted(storage.BACKENDS),
+        default=storage.STORAGE_MODE,
+        help="storage backend (default: %(default)s)",
+    )
+    args = parser.parse_args(argv)
+    storage.STORAGE_MODE = args.storage
+    fields = {
+        "rows": args.rows, "storage": args.storage,
+        "version": code_version(),
+    }
+
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "transactions.json")
+        save_transactions(generate_ledger(args.rows), filename)
+        flush_storage()
+        storage._storages.clear()
+        transactions = measure(
+            "load", lambda: load_transactions(filename), **fields
+        )
+        expected = (
+            transactions.total_cents(),
+            measure("report", lambda: monthly_report(transactions), **fields),
+        )
+        months = sorted(transactions.aggregates.months)
+        keep = months[-args.keep_months:] if args.keep_months > 0 else []
+        before = period_bounds(month_key(keep[0]))[0] if keep else (
+            max(row.epoch for row in transactions) + 1
+        )
+        measure("archive", lambda: archive_transactions(
+            transactions, before, filename
+        ), **fields)
+        flush_storage()
+        storage._storages.clear()
+        transactions = measure(
+            "load_archived", lambda: load_transactions(filename),
+            hot_rows=len(transactions), **fields
+        )
+        actual = (
+            transactions.total_cents(),
+            measure(
+                "report_archived", lambda: monthly_report(transactions),
+                **fields
+            ),
+        )
+    matches = actual == expected
+    print(json.dumps(dict(fields, operation="compare", matches=matches)))
+    return 0 if matches else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,224 @@
+# Money Track App - benchmarks for the core ledger operations
+#
+# Usage: python3 benchmarks/bench_ledger.py [--sizes 10000 100000 ...]
+#
+# Generates synthetic ledgers, drives the app's functions without user
+# input and prints one JSON object per operation and ledger size with the
+# elapsed seconds and the peak memory allocated while it ran.
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import builtins
+import subprocess
+import tempfile
+import tracemalloc
+import contextlib
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import run  # noqa: E402
+import storage  # noqa: E402
+from store import TransactionStore, parse_timestamp  # noqa: E402
+from validation import (  # noqa: E402
+    VALID_INCOME_CATEGORIES, VALID_EXPENSE_CATEGORIES
+)
+
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000]
+
+# Roughly one income for every four expenses.
+INCOME_SHARE = 0.2
+
+VERSION = None
+
+
+def generate_ledger(rows, seed=0, start="2015-01-01 00:00:00"):
+    """
+    Builds a TransactionStore with 'rows' synthetic transactions.
+
+    Transactions are spread in time order over about ten years, using the
+    app's valid income and expense categories and amounts of up to 2000.
+    """
+    rng = random.Random(seed)
+    transactions = TransactionStore()
+    seconds = parse_timestamp(start)
+    step = max(1, 10 * 365 * 86400 // max(rows, 1))
+    for _ in range(rows):
+        seconds += rng.randint(0, 2 * step)
+        if rng.random() < INCOME_SHARE:
+            t_type = "income"
+            category = rng.choice(VALID_INCOME_CATEGORIES)
+            cents = rng.randint(10_000, 200_000)
+        else:
+            t_type = "expense"
+            category = rng.choice(VALID_EXPENSE_CATEGORIES)
+            cents = -rng.randint(100, 50_000)
+        transactions.append_values(t_type, category, cents, seconds)
+    return transactions
+
+
+@contextlib.contextmanager
+def scripted_input(answers):
+    """
+    Replaces input() with a function returning 'answers' in turn, and
+    discards everything printed, so interactive functions run unattended.
+    """
+    answers = iter(answers)
+    original = builtins.input
+    builtins.input = lambda prompt="": next(answers)
+    try:
+        with open(os.devnull, "w") as devnull:
+            with contextlib.redirect_stdout(devnull):
+                yield
+    finally:
+        builtins.input = original
+
+
+def code_version():
+    """
+    Returns the short git commit of the code being measured, or None.
+    """
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def measure(operation, rows, function, trace_memory=True, setup=None):
+    """
+    Runs 'function' and returns a result record for it.
+
+    The function is timed on its own; if 'trace_memory' is set it is run a
+    second time under tracemalloc to record the peak memory, so tracing
+    does not distort the timing. 'setup', if given, is called (untimed)
+    before each run, so an operation that changes the ledger is measured
+    on the same state both times.
+    """
+    if setup is not None:
+        setup()
+    started = time.perf_counter()
+    function()
+    seconds = time.perf_counter() - started
+    peak = None
+    if trace_memory:
+        if setup is not None:
+            setup()
+        tracemalloc.start()
+        try:
+            function()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return {
+        "operation": operation,
+        "rows": rows,
+        "storage": storage.STORAGE_MODE,
+        "version": VERSION,
+        "seconds": round(seconds, 6),
+        "peak_bytes": peak,
+    }
+
+
+def benchmark_size(rows, directory, trace_memory=True):
+    """
+    Benchmarks every operation on a synthetic ledger of 'rows' rows.
+    """
+    filename = os.path.join(directory, f"ledger-{rows}.json")
+    transactions = generate_ledger(rows)
+    state = {"transactions": transactions}
+
+    def save():
+        storage.save_transactions(state["transactions"], filename)
+
+    def load():
+        state["transactions"] = storage.load_transactions(filename)
+
+    def balance():
+        with scripted_input([]):
+            run.check_balance(state["transactions"])
+
+    def report():
+        with scripted_input([]):
+            run.generate_monthly_report(state["transactions"])
+
+    def by_category():
+        with scripted_input(["Food", ""]):
+            run.view_transactions_by_category(state["transactions"])
+
+    def delete():
+        with scripted_input(["1,2,3", "yes"]):
+            run.delete_transaction(state["transactions"], filename)
+        # Deletes are coalesced; include writing them out.
+        storage.flush_storage()
+
+    def restore():
+        # Puts the generated ledger back on disk and in memory.
+        storage.save_transactions(transactions, filename)
+        state["transactions"] = storage.load_transactions(filename)
+
+    results = []
+    for operation, function, setup in (
+        ("save_transactions", save, None),
+        ("load_transactions", load, None),
+        ("check_balance", balance, None),
+        ("generate_monthly_report", report, None),
+        ("view_transactions_by_category", by_category, None),
+        ("delete_transaction", delete, restore),
+    ):
+        results.append(
+            measure(operation, rows, function, trace_memory, setup)
+        )
+    storage.get_storage(filename).close()
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the Money Track ledger operations."
+    )
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+        help="ledger sizes to generate (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--storage", choices=sorted(storage.BACKENDS),
+        default=storage.STORAGE_MODE,
+        help="storage backend (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--no-memory", action="store_true",
+        help="skip the tracemalloc run for peak memory",
+    )
+    parser.add_argument(
+        "--output", "-o", help="append results to this file (JSON lines)"
+    )
+    args = parser.parse_args(argv)
+
+    global VERSION
+    VERSION = code_version()
+    storage.STORAGE_MODE = args.storage
+    out = open(args.output, "a") if args.output else sys.stdout
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            for rows in args.sizes:
+                for result in benchmark_size(
+                    rows, directory, not args.no_memory
+                ):
+                    out.write(json.dumps(result) + "\n")
+                    out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,96 @@
+# Money Track App - parallel report benchmark
+#
+# Usage: python3 benchmarks/bench_parallel.py [--rows 1000000]
+#                                             [--files 4] [--jobs 1 2 4]
+#
+# Writes a synthetic archive of NDJSON files, builds the monthly report
+# over it with 'report --input' (see parallel.py) for each number of
+# worker processes, and prints one JSON object per run with the time
+# taken. Exits with status 1 if any run's report differs from the first
+# run's.
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_ledger import generate_ledger, code_version  # noqa: E402
+from parallel import report_files  # noqa: E402
+from reports import breakdown_report  # noqa: E402
+
+
+def write_archive(directory, rows, files):
+    """
+    Writes 'rows' synthetic transactions spread over 'files' NDJSON files
+    and returns their paths.
+    """
+    transactions = generate_ledger(rows)
+    per_file = -(-rows // files) if rows else 0
+    paths = []
+    for index in range(files):
+        path = os.path.join(directory, f"archive-{index}.ndjson")
+        with open(path, "w") as file:
+            for position in range(
+                index * per_file, min(rows, (index + 1) * per_file)
+            ):
+                row = transactions[position]
+                file.write(json.dumps({
+                    "type": row["type"], "category": row["category"],
+                    "amount": row["amount"], "timestamp": row["timestamp"],
+                }) + "\n")
+        paths.append(path)
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the Money Track parallel archive report."
+    )
+    parser.add_argument(
+        "--rows", type=int, default=1_000_000,
+        help="transactions in the archive (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--files", type=int, default=4,
+        help="files the archive is split into (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--jobs", type=int, nargs="+",
+        default=sorted({1, 2, os.cpu_count() or 1}),
+        help="worker process counts to compare (default: %(default)s)",
+    )
+    args = parser.parse_args(argv)
+
+    version = code_version()
+    failed = False
+    with tempfile.TemporaryDirectory() as directory:
+        paths = write_archive(directory, args.rows, args.files)
+        expected = None
+        for jobs in args.jobs:
+            started = time.perf_counter()
+            breakdown, _ = report_files(paths, jobs)
+            report = breakdown_report(breakdown)
+            seconds = time.perf_counter() - started
+            if expected is None:
+                expected = report
+            matches = report == expected
+            failed = failed or not matches
+            print(json.dumps({
+                "operation": "report_files",
+                "rows": args.rows,
+                "files": args.files,
+                "jobs": jobs,
+                "version": version,
+                "seconds": round(seconds, 6),
+                "rows_per_second": round(args.rows / seconds),
+                "matches": matches,
+            }), flush=True)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
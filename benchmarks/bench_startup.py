@@ -0,0 +1,100 @@
+# Money Track App - startup benchmark
+#
+# Usage: python3 benchmarks/bench_startup.py [--sizes 10000 100000 ...]
+#
+# Saves synthetic ledgers with each storage backend, launches the
+# interactive app on them, picks "Exit" at the first menu and prints one
+# JSON object per backend and ledger size with the wall-clock time of the
+# whole run and the load time the app reports (MONEY_TRACK_TIMING).
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import subprocess
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_ledger import ROOT, generate_ledger, code_version  # noqa: E402
+import storage  # noqa: E402
+
+
+DEFAULT_SIZES = [0, 10_000, 100_000, 1_000_000]
+
+TIMING = re.compile(r"in ([\d.]+) ms, first menu after ([\d.]+) ms CPU")
+
+
+def launch(directory, mode, repeat):
+    """
+    Runs the app in 'directory' 'repeat' times and returns the fastest
+    (wall seconds, load milliseconds, CPU milliseconds at first menu).
+    """
+    env = dict(
+        os.environ, MONEY_TRACK_STORAGE=mode, MONEY_TRACK_TIMING="1"
+    )
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, os.path.join(ROOT, "run.py")],
+            cwd=directory, env=env, input="7\n",
+            capture_output=True, text=True, check=True,
+        )
+        seconds = time.perf_counter() - started
+        match = TIMING.search(result.stderr)
+        load_ms, menu_ms = map(float, match.groups()) if match else (
+            None, None
+        )
+        if best is None or seconds < best[0]:
+            best = (seconds, load_ms, menu_ms)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark the Money Track time to first menu."
+    )
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+        help="ledger sizes to generate (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--storage", choices=sorted(storage.BACKENDS), nargs="+",
+        default=sorted(storage.BACKENDS),
+        help="storage backends to compare (default: all)",
+    )
+    parser.add_argument(
+        "--repeat", type=int, default=3,
+        help="launches per measurement; the fastest counts (default: 3)",
+    )
+    args = parser.parse_args(argv)
+
+    version = code_version()
+    for rows in args.sizes:
+        transactions = generate_ledger(rows)
+        for mode in args.storage:
+            with tempfile.TemporaryDirectory() as directory:
+                filename = os.path.join(directory, "transactions.json")
+                backend = storage.get_storage(filename, mode)
+                backend.save(transactions)
+                backend.close()
+                seconds, load_ms, menu_ms = launch(
+                    directory, mode, args.repeat
+                )
+            print(json.dumps({
+                "operation": "time_to_first_menu",
+                "rows": rows,
+                "storage": mode,
+                "version": version,
+                "seconds": round(seconds, 6),
+                "load_ms": load_ms,
+                "first_menu_cpu_ms": menu_ms,
+            }), flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,243 @@
+# Money Track App - crash recovery and multi-process checks
+#
+# Usage: python3 benchmarks/check_recovery.py [--storage journal ...]
+#
+# Plays out the situations the storage backends have to recover from: two
+# copies of the app adding transactions with the same new id, one deleting
+# rows (or an id the other is about to reuse) while the other has changes
+# pending, one rewriting the snapshot while the other has changes pending,
+# a journal line cut off by a crash, and a snapshot write interrupted
+# half-way. Each copy is a separate backend object on the same ledger, as
+# in separate processes. Prints one JSON object per check and backend and
+# exits with status 1 if any check failed.
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import storage  # noqa: E402
+from store import format_timestamp  # noqa: E402
+
+
+def transaction(amount, minute=0):
+    """
+    Returns a new income of 'amount' (a string such as '1.00').
+    """
+    return {
+        "type": "income",
+        "category": "Salary",
+        "amount": amount,
+        "timestamp": format_timestamp(1_700_000_000 + minute * 60),
+    }
+
+
+def add(backend, transactions, amount):
+    """
+    Adds an income through 'backend' the way the app does, without
+    flushing it.
+    """
+    transactions.append(transaction(amount, len(transactions)))
+    backend.append(transactions, [transactions[-1]])
+
+
+def snapshot(transactions):
+    """
+    Returns the (id, cents) pairs of 'transactions', in id order.
+    """
+    return sorted((row.id, row.cents) for row in transactions)
+
+
+def reopen(mode, filename):
+    """
+    Loads the ledger with a new backend, as a freshly started app would.
+    """
+    backend = storage.BACKENDS[mode](filename)
+    transactions = backend.load()
+    backend.close()
+    return transactions
+
+
+def seeded(mode, filename, rows=3):
+    """
+    Saves a ledger of 'rows' incomes of 1.00, 2.00, ... with ids 1, 2, ...
+    and returns two backends (two copies of the app) with it loaded.
+    """
+    backend = storage.BACKENDS[mode](filename)
+    seed = backend.load()
+    for index in range(rows):
+        seed.append(transaction(f"{index + 1}.00", index))
+    backend.save(seed)
+    backend.close()
+    copies = []
+    for _ in range(2):
+        backend = storage.BACKENDS[mode](filename)
+        copies.append((backend, backend.load()))
+    return copies
+
+
+def consistent(mode, filename, expected, *copies):
+    """
+    Returns True if the ledger on disk holds the (id, cents) pairs
+    'expected', its totals add up, and every copy of the app sees the same
+    ledger once it has refreshed.
+    """
+    on_disk = reopen(mode, filename)
+    if snapshot(on_disk) != expected:
+        return False
+    if on_disk.total_cents() != sum(cents for _, cents in expected):
+        return False
+    for backend, transactions in copies:
+        backend.refresh(transactions)
+        if snapshot(transactions) != expected:
+            return False
+        if transactions.total_cents() != on_disk.total_cents():
+            return False
+    return True
+
+
+def check_colliding_ids(mode, filename):
+    """
+    Both copies add a transaction; both picked id 4.
+    """
+    (a, ta), (b, tb) = seeded(mode, filename)
+    add(a, ta, "10.00")
+    a.flush()
+    add(b, tb, "20.00")
+    b.flush()
+    expected = [(1, 100), (2, 200), (3, 300), (4, 1000), (5, 2000)]
+    return consistent(mode, filename, expected, (a, ta), (b, tb))
+
+
+def check_concurrent_delete(mode, filename):
+    """
+    One copy deletes rows while the other deletes one of the same rows
+    and adds a transaction.
+    """
+    (a, ta), (b, tb) = seeded(mode, filename)
+    a.delete(ta, [2, 3])
+    a.flush()
+    b.delete(tb, [3])
+    add(b, tb, "20.00")
+    b.flush()
+    expected = [(1, 100), (4, 2000)]
+    return consistent(mode, filename, expected, (a, ta), (b, tb))
+
+
+def check_deleted_colliding_id(mode, filename):
+    """
+    One copy adds a transaction and deletes it again; the other adds one
+    with the same new id, which must survive the delete.
+    """
+    (a, ta), (b, tb) = seeded(mode, filename)
+    add(a, ta, "10.00")
+    a.delete(ta, [4])
+    a.flush()
+    add(b, tb, "20.00")
+    b.flush()
+    expected = [(1, 100), (2, 200), (3, 300), (5, 2000)]
+    return consistent(mode, filename, expected, (a, ta), (b, tb))
+
+
+def check_external_compaction(mode, filename):
+    """
+    One copy rewrites the whole snapshot (as a journal compaction does)
+    while the other has an add pending.
+    """
+    (a, ta), (b, tb) = seeded(mode, filename)
+    add(a, ta, "10.00")
+    add(b, tb, "20.00")
+    b.save(tb)
+    a.flush()
+    expected = [(1, 100), (2, 200), (3, 300), (4, 2000), (5, 1000)]
+    return consistent(mode, filename, expected, (a, ta), (b, tb))
+
+
+def check_torn_journal(mode, filename):
+    """
+    The app was killed while appending a journal record: the last line
+    is incomplete. The records before it load, and later ones are not
+    glued onto it.
+    """
+    (a, ta), _ = seeded(mode, filename)
+    add(a, ta, "10.00")
+    a.flush()
+    with open(storage.journal_path(filename), "a") as file:
+        file.write('{"op": "add", "transaction": {"id": 5, "ty')
+    b = storage.BACKENDS[mode](filename)
+    tb = b.load()
+    if snapshot(tb) != [(1, 100), (2, 200), (3, 300), (4, 1000)]:
+        return False
+    add(b, tb, "20.00")
+    b.flush()
+    expected = [(1, 100), (2, 200), (3, 300), (4, 1000), (5, 2000)]
+    return consistent(mode, filename, expected, (b, tb))
+
+
+def check_interrupted_save(mode, filename):
+    """
+    Writing the snapshot fails half-way: the previous snapshot is left
+    intact and no temporary file remains.
+    """
+    (a, ta), _ = seeded(mode, filename)
+    try:
+        with storage.atomic_write(filename) as file:
+            file.write('[\n    {\n        "id": 1,')
+            raise OSError("disk full")
+    except OSError:
+        pass
+    if os.path.exists(filename + ".tmp"):
+        return False
+    expected = [(1, 100), (2, 200), (3, 300)]
+    return consistent(mode, filename, expected, (a, ta))
+
+
+# Checks, and the backends they apply to (None: all of them).
+CHECKS = (
+    ("colliding_ids", check_colliding_ids, None),
+    ("concurrent_delete", check_concurrent_delete, None),
+    ("deleted_colliding_id", check_deleted_colliding_id, None),
+    ("external_compaction", check_external_compaction, ("json", "journal")),
+    ("torn_journal", check_torn_journal, ("journal",)),
+    ("interrupted_save", check_interrupted_save, ("json", "journal")),
+)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Check crash recovery and multi-process rebasing."
+    )
+    parser.add_argument(
+        "--storage", choices=sorted(storage.BACKENDS), nargs="+",
+        default=sorted(storage.BACKENDS),
+        help="storage backends to check (default: all)",
+    )
+    args = parser.parse_args(argv)
+
+    ok = True
+    for mode in args.storage:
+        for name, check, modes in CHECKS:
+            if modes is not None and mode not in modes:
+                continue
+            with tempfile.TemporaryDirectory() as directory:
+                filename = os.path.join(directory, "transactions.json")
+                try:
+                    passed = check(mode, filename)
+                    error = None
+                except Exception as exception:
+                    passed = False
+                    error = repr(exception)
+            ok = ok and passed
+            result = {"check": name, "storage": mode, "ok": passed}
+            if error:
+                result["error"] = error
+            print(json.dumps(result), flush=True)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
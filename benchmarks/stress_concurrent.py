@@ -0,0 +1,127 @@
+# Money Track App - concurrent appender stress test
+#
+# Usage: python3 benchmarks/stress_concurrent.py [--processes 4 ...]
+#
+# Starts several processes that append transactions to the same ledger at
+# the same time, then reloads the ledger and checks that no transaction was
+# lost or given a duplicate id and that the balance adds up. Prints one
+# JSON object per storage backend with the throughput and the checks, and
+# exits with status 1 if any check failed.
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import multiprocessing
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import storage  # noqa: E402
+from store import format_timestamp  # noqa: E402
+
+
+def appender(filename, mode, worker, count, flush_every):
+    """
+    Appends 'count' incomes of (worker + 1).00 to the ledger, the way the
+    Add Transaction menu does.
+    """
+    storage.STORAGE_MODE = mode
+    storage.FLUSH_EVERY = flush_every
+    transactions = storage.load_transactions(filename)
+    amount = f"{worker + 1}.00"
+    for index in range(count):
+        transactions.append({
+            "type": "income",
+            "category": "Salary",
+            "amount": amount,
+            "timestamp": format_timestamp(1_700_000_000 + index * 60),
+        })
+        storage.append_transaction(transactions, transactions[-1], filename)
+    storage.flush_storage()
+
+
+def stress(mode, processes, count, flush_every):
+    """
+    Runs 'processes' appenders against a new ledger and returns a result
+    record.
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "transactions.json")
+        workers = [
+            multiprocessing.Process(
+                target=appender,
+                args=(filename, mode, worker, count, flush_every),
+            )
+            for worker in range(processes)
+        ]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        seconds = time.perf_counter() - started
+
+        storage.STORAGE_MODE = mode
+        transactions = storage.load_transactions(filename)
+        ids = [row.id for row in transactions]
+        storage.get_storage(filename).close()
+
+    expected_rows = processes * count
+    expected_cents = count * 100 * processes * (processes + 1) // 2
+    return {
+        "operation": "concurrent_append",
+        "storage": mode,
+        "processes": processes,
+        "appends_per_process": count,
+        "flush_every": flush_every,
+        "seconds": round(seconds, 6),
+        "appends_per_second": round(expected_rows / seconds, 1),
+        "rows": len(ids),
+        "rows_ok": len(ids) == expected_rows,
+        "ids_unique": len(set(ids)) == len(ids),
+        "balance_ok": transactions.total_cents() == expected_cents,
+        "workers_ok": all(worker.exitcode == 0 for worker in workers),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Stress test concurrent appends to one ledger."
+    )
+    parser.add_argument(
+        "--processes", type=int, default=4,
+        help="number of appending processes (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--appends", type=int, default=500,
+        help="transactions added by each process (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--storage", choices=sorted(storage.BACKENDS), nargs="+",
+        default=sorted(storage.BACKENDS),
+        help="storage backends to test (default: all)",
+    )
+    parser.add_argument(
+        "--flush-every", type=int, default=storage.FLUSH_EVERY,
+        help="changes coalesced per write (default: %(default)s)",
+    )
+    args = parser.parse_args(argv)
+
+    ok = True
+    for mode in args.storage:
+        result = stress(
+            mode, args.processes, args.appends, args.flush_every
+        )
+        ok = ok and all(
+            result[check]
+            for check in ("rows_ok", "ids_unique", "balance_ok", "workers_ok")
+        )
+        print(json.dumps(result), flush=True)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,157 @@
+# Money Track App - monthly budgets per expense category
+
+import os
+import json
+from datetime import datetime
+from storage import ledger_lock, atomic_write, file_signature
+from store import parse_cents, format_cents
+from aggregates import month_key, month_number
+from validation import VALID_EXPENSE_CATEGORIES
+
+
+# Percentage of a budget spent from which each new expense warns how
+# little is left.
+WARNING_PERCENT = 80
+
+# Columns of the budget listing, in order.
+BUDGET_FIELDS = ("month", "category", "budget", "spent", "remaining")
+
+# Budgets last read, by ledger file: (file signature, budgets).
+_loaded = {}
+
+
+def budgets_path(filename):
+    """
+    Returns the file the budgets of a ledger are kept in,
+    e.g. 'transactions.json' -> 'transactions.budgets.json'.
+    """
+    root, _ = os.path.splitext(filename)
+    return root + ".budgets.json"
+
+
+def load_budgets(filename="transactions.json"):
+    """
+    Returns the monthly budget in cents per expense category of the ledger
+    'filename', e.g. {'Food': 30000}.
+
+    The file is only read again when it has changed, so checking every
+    added expense against it stays cheap.
+    """
+    path = budgets_path(filename)
+    signature = file_signature(path)
+    cached = _loaded.get(path)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    try:
+        with open(path, "r") as file:
+            budgets = {
+                category: parse_cents(amount)
+                for category, amount in json.load(file).items()
+            }
+    except FileNotFoundError:
+        budgets = {}
+    _loaded[path] = (signature, budgets)
+    return budgets
+
+
+def set_budget(category, amount, filename="transactions.json"):
+    """
+    Sets the monthly budget of an expense category, or removes it if
+    'amount' is None. Returns the category name as stored.
+
+    Raises:
+        ValueError: If the category is not an expense category or the
+            amount is not greater than 0.
+    """
+    category = str(category).strip().title()
+    if category not in VALID_EXPENSE_CATEGORIES:
+        raise ValueError(
+            f"Invalid expense category {category!r}: "
+            f"expected one of {', '.join(VALID_EXPENSE_CATEGORIES)}"
+        )
+    if amount is not None:
+        cents = parse_cents(amount)
+        if cents <= 0:
+            raise ValueError("Budget must be greater than 0")
+    path = budgets_path(filename)
+    with ledger_lock(path):
+        budgets = dict(load_budgets(filename))
+        if amount is None:
+            budgets.pop(category, None)
+        else:
+            budgets[category] = cents
+        with atomic_write(path) as file:
+            json.dump({
+                name: format_cents(cents)
+                for name, cents in sorted(budgets.items())
+            }, file, indent=4)
+    return category
+
+
+def budget_status(aggregates, budgets, month, category):
+    """
+    Returns (budget, spent, remaining) in cents for 'category' in the
+    given month number, or None if the category has no budget.
+
+    'spent' is read from the per-month, per-category totals the ledger
+    keeps up to date (see LedgerAggregates), so this costs the same
+    however many transactions the month has. 'remaining' is negative when
+    the budget is overspent.
+    """
+    budget = budgets.get(category)
+    if budget is None:
+        return None
+    spent = -aggregates.month_category_cents(month, category)
+    return budget, spent, budget - spent
+
+
+def budget_alert(transactions, transaction, filename="transactions.json"):
+    """
+    Checks an expense just added to 'transactions' against the monthly
+    budget of its category.
+
+    Returns (message, overspent) once the category has used
+    WARNING_PERCENT of its budget for the month or more, None otherwise
+    (and for income and categories without a budget).
+    """
+    if transaction["type"] != "expense":
+        return None
+    month = month_number(transaction["timestamp"][:7])
+    status = budget_status(
+        transactions.aggregates, load_budgets(filename), month,
+        transaction["category"],
+    )
+    if status is None:
+        return None
+    budget, spent, remaining = status
+    name = f"{transaction['category']} budget for {month_key(month)}"
+    if remaining < 0:
+        return (
+            f"{name} overspent by {format_cents(-remaining)} "
+            f"(budget {format_cents(budget)}).",
+            True,
+        )
+    if spent * 100 >= budget * WARNING_PERCENT:
+        return (
+            f"{name}: {format_cents(remaining)} left of "
+            f"{format_cents(budget)}.",
+            False,
+        )
+    return None
+
+
+def budget_records(transactions, budgets, month=None):
+    """
+    Yields rows of BUDGET_FIELDS for every budgeted category in the given
+    month number (default: the current month).
+    """
+    if month is None:
+        month = month_number(datetime.now().strftime("%Y-%m"))
+    for category in sorted(budgets):
+        budget, spent, remaining = budget_status(
+            transactions.aggregates, budgets, month, category
+        )
+        yield (
+            month_key(month), category, format_cents(budget),
+            format_cents(spent), format_cents(remaining),
+        )
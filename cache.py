@@ -0,0 +1,81 @@
+# Money Track App - cached report results
+
+import weakref
+from collections import OrderedDict
+from metrics import count
+
+
+# Results kept per ledger; the least recently used are dropped first.
+CACHE_SIZE = 64
+
+
+class ResultCache:
+    """
+    Memoizes results computed from a TransactionStore.
+
+    Results are kept until the store changes: every entry belongs to the
+    store's 'version' at the time it was computed, and the whole cache is
+    emptied as soon as a different store or a new version is seen. Up to
+    'size' results are kept, the least recently used being evicted first,
+    so per-category and per-date-range lookups cannot grow it without
+    bound. The hit, miss, eviction and invalidation counters are returned
+    by stats().
+    """
+
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.store = None
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, transactions, key, compute):
+        """
+        Returns the result cached for 'key', or compute(transactions) if
+        there is none for the current version of 'transactions'.
+
+        Args:
+            transactions (TransactionStore): The ledger the result is
+                computed from.
+            key (tuple): Identifies the result, e.g. ("balance",).
+            compute (callable): Computes the result from 'transactions'.
+        """
+        store = self.store() if self.store is not None else None
+        if store is not transactions or self.version != transactions.version:
+            if self.entries:
+                self.invalidations += 1
+            self.entries.clear()
+            self.store = weakref.ref(transactions)
+            self.version = transactions.version
+        elif key in self.entries:
+            self.hits += 1
+            count("cache.hits")
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        self.misses += 1
+        count("cache.misses")
+        result = compute(transactions)
+        self.entries[key] = result
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+        return result
+
+    def stats(self):
+        """
+        Returns the cache counters and current size as a dictionary.
+        """
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+            "entries": len(self.entries),
+        }
+
+
+# The cache used by the interactive menu.
+report_cache = ResultCache()
@@ -0,0 +1,711 @@
+# Money Track App - non-interactive commands
+
+import os
+import sys
+import shlex
+import argparse
+from datetime import datetime
+from storage import load_transactions, delete_transactions, flush_storage
+from storage import append_transaction, refresh_transactions
+from storage import archive_transactions
+from importer import import_file, BATCH_SIZE
+from exporter import FORMATS, open_output, export_transactions, export_report
+from exporter import write_records, write_report
+from store import period_bounds, format_cents
+from validation import validate_transaction
+from metrics import timer
+from ledgers import LedgerSet, ledger_filename, consolidated_report
+from ledgers import CONSOLIDATED_FIELDS
+from recurring import RULE_FIELDS, add_rule, delete_rule, load_rules
+from recurring import rule_records, run_rules
+from budgets import BUDGET_FIELDS, budget_alert, budget_records
+from budgets import load_budgets, set_budget
+from aggregates import month_number
+from reports import PERIOD_FIELDS, period_totals, breakdown_report
+from archive import SEGMENT_FIELDS
+
+
+# Ledgers opened by this process, keyed by file name.
+_ledgers = {}
+
+
+def open_ledger(filename):
+    """
+    Returns the ledger stored in 'filename', loading it on first use.
+
+    Commands run in one process (see command_batch()) share the loaded
+    ledger; later uses only pick up what other processes have saved since.
+    """
+    transactions = _ledgers.get(filename)
+    if transactions is None:
+        transactions = _ledgers[filename] = load_transactions(filename)
+    else:
+        refresh_transactions(transactions, filename)
+    return transactions
+
+
+def date_range(args):
+    """
+    Returns the [start, end) epoch seconds selected by --from and --to,
+    either of which may be None. Raises ValueError for a bad date.
+    """
+    start = period_bounds(args.date_from)[0] if args.date_from else None
+    end = period_bounds(args.date_to)[1] if args.date_to else None
+    return start, end
+
+
+def command_add(args):
+    """
+    Adds one income or expense, checked like the Add Transaction menu.
+    """
+    try:
+        transaction = validate_transaction(
+            args.type, args.category, args.amount, args.timestamp
+        )
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        return 2
+    transactions = open_ledger(args.file)
+    transactions.append(transaction)
+    append_transaction(transactions, transactions[-1], args.file)
+    row = transactions[-1]
+    print(
+        f"Added {row['type']} {row.id} of {format_cents(abs(row.cents))} "
+        f"to {row['category']}."
+    )
+    alert = budget_alert(transactions, row, args.file)
+    if alert is not None:
+        print(alert[0])
+    return 0
+
+
+def command_balance(args):
+    """
+    Prints the current balance, or the balance at the end of --at DATE.
+    """
+    transactions = open_ledger(args.file)
+    if args.at is None:
+        print(format_cents(transactions.total_cents()))
+        return 0
+    try:
+        end = period_bounds(args.at)[1]
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        return 2
+    print(format_cents(transactions.totals_before(end)[0]))
+    return 0
+
+
+def command_totals(args):
+    """
+    Prints the net amount and number of transactions in a date range, or
+    per day, month or year with --by.
+    """
+    try:
+        start, end = date_range(args)
+        if args.last is not None:
+            end = period_bounds(datetime.now().strftime("%Y-%m-%d"))[1]
+            start = end - args.last * 86400
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        return 2
+    transactions = open_ledger(args.file)
+    if args.by is None:
+        cents, rows = transactions.range_totals(start, end)
+        records = [("all", str(rows), format_cents(cents))]
+    else:
+        records = (
+            (period, str(rows), format_cents(cents))
+            for period, cents, rows in period_totals(
+                transactions, args.by, start, end
+            )
+        )
+    return write_output(args, lambda out: write_records(
+        records, PERIOD_FIELDS, out, args.format
+    ))
+
+
+def command_import(args):
+    """
+    Imports CSV or NDJSON files into the ledger and prints a summary;
+    with --jobs the files are parsed in parallel.
+    """
+    transactions = open_ledger(args.file)
+    if args.jobs != 1 or len(args.paths) > 1:
+        from parallel import import_files
+
+        try:
+            result = import_files(
+                args.paths, transactions, args.file, args.jobs
+            )
+        except (OSError, ValueError) as error:
+            print(f"Import failed: {error}", file=sys.stderr)
+            return 1
+        print(f"Imported {result['imported']} transactions, "
+              f"rejected {result['rejected']}.")
+        for path in result["rejects_files"]:
+            print(f"Rejected rows written to {path}")
+        return 0
+    try:
+        result = import_file(
+            args.paths[0], transactions, args.file, args.batch_size
+        )
+    except (OSError, ValueError) as error:
+        print(f"Import failed: {error}", file=sys.stderr)
+        return 1
+    print(
+        f"Imported {result['imported']} transactions, "
+        f"rejected {result['rejected']} "
+        f"in {result['seconds']:.2f}s "
+        f"({result['rows_per_second']:.0f} rows/s)."
+    )
+    if result["rejects_file"]:
+        print(f"Rejected rows written to {result['rejects_file']}")
+    return 0
+
+
+def write_output(args, write):
+    """
+    Opens the requested output, calls write(out) and closes it again.
+    """
+    out = open_output(args.output)
+    try:
+        write(out)
+    except BrokenPipeError:
+        # The reader went away (e.g. piped into 'head'); stop quietly.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 1
+    finally:
+        if out is sys.stdout:
+            out.flush()
+        else:
+            out.close()
+    return 0
+
+
+def command_export(args):
+    """
+    Streams transactions as CSV, NDJSON or a table.
+    """
+    try:
+        start, end = date_range(args)
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        return 2
+    transactions = open_ledger(args.file)
+    return write_output(args, lambda out: export_transactions(
+        transactions, out, args.format, args.category, start, end,
+        getattr(args, "limit", None),
+    ))
+
+
+def command_report(args):
+    """
+    Streams the monthly report as CSV, NDJSON or a table; with --all the
+    consolidated report of every ledger, with --input that of the given
+    files, read in parallel.
+    """
+    if args.input:
+        from parallel import report_files
+
+        try:
+            breakdown, rejected = report_files(args.input, args.jobs)
+        except (OSError, ValueError) as error:
+            print(f"Report failed: {error}", file=sys.stderr)
+            return 1
+        if rejected:
+            print(f"Skipped {rejected} invalid rows.", file=sys.stderr)
+        return write_output(args, lambda out: write_report(
+            breakdown_report(breakdown), out, args.format, args.categories
+        ))
+    if args.all:
+        _, total = LedgerSet().consolidated()
+        records = (
+            (month, format_cents(net), format_cents(balance))
+            for month, net, balance in consolidated_report(total)
+        )
+        return write_output(args, lambda out: write_records(
+            records, CONSOLIDATED_FIELDS, out, args.format
+        ))
+    transactions = open_ledger(args.file)
+    return write_output(args, lambda out: export_report(
+        transactions, out, args.format, args.categories
+    ))
+
+
+def command_delete(args):
+    """
+    Deletes transactions by id and/or everything before a date.
+    """
+    if not args.ids and not args.before:
+        print("Nothing to delete: give --id and/or --before.",
+              file=sys.stderr)
+        return 2
+    transactions = open_ledger(args.file)
+    ids = [transaction_id for group in args.ids for transaction_id in group]
+    if args.before:
+        try:
+            ids.extend(transactions.ids_before(period_bounds(args.before)[0]))
+        except ValueError as error:
+            print(error, file=sys.stderr)
+            return 2
+    deleted = delete_transactions(transactions, ids, args.file)
+    print(f"Deleted {len(deleted)} transactions.")
+    return 0
+
+
+def command_ledgers(args):
+    """
+    Lists every ledger with its number of transactions and balance, and
+    the consolidated balance of all of them.
+    """
+    shards, total = LedgerSet().consolidated()
+    records = [
+        (name, str(aggregates.count), format_cents(aggregates.balance))
+        for name, aggregates in shards.items()
+    ]
+    records.append(("total", str(total.count), format_cents(total.balance)))
+    return write_output(args, lambda out: write_records(
+        records, ("ledger", "transactions", "balance"), out, args.format
+    ))
+
+
+def command_recurring(args):
+    """
+    Adds, lists, deletes and runs the ledger's recurring rules.
+    """
+    if args.action == "add":
+        try:
+            rule = add_rule(
+                args.type, args.category, args.amount, args.every,
+                args.start, args.file,
+            )
+        except ValueError as error:
+            print(error, file=sys.stderr)
+            return 2
+        print(f"Added rule {rule['id']}: {rule['type']} of "
+              f"{rule['amount'].lstrip('-')} to {rule['category']} "
+              f"{rule['every']}.")
+    elif args.action == "list":
+        rules = load_rules(args.file)
+        return write_output(args, lambda out: write_records(
+            rule_records(rules), RULE_FIELDS, out, args.format
+        ))
+    elif args.action == "delete":
+        if not delete_rule(args.id, args.file):
+            print(f"No rule with id {args.id}.", file=sys.stderr)
+            return 1
+        print(f"Deleted rule {args.id}.")
+    else:
+        until = None
+        if args.until:
+            try:
+                until = period_bounds(args.until)[1] - 1
+            except ValueError as error:
+                print(error, file=sys.stderr)
+                return 2
+        added = run_rules(open_ledger(args.file), args.file, until)
+        print(f"Added {len(added)} recurring transactions.")
+    return 0
+
+
+def command_budget(args):
+    """
+    Sets or removes a monthly budget, or shows how every budget stands.
+    """
+    if args.action == "show":
+        month = None
+        try:
+            if args.month:
+                if len(args.month.strip()) != 7:
+                    raise ValueError(args.month)
+                period_bounds(args.month)
+                month = month_number(args.month.strip())
+        except ValueError:
+            print(f"Invalid month: {args.month!r}", file=sys.stderr)
+            return 2
+        transactions = open_ledger(args.file)
+        budgets = load_budgets(args.file)
+        return write_output(args, lambda out: write_records(
+            budget_records(transactions, budgets, month), BUDGET_FIELDS,
+            out, args.format,
+        ))
+    try:
+        category = set_budget(args.category, args.amount, args.file)
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        return 2
+    if args.amount is None:
+        print(f"Removed the {category} budget.")
+    else:
+        print(f"Set the {category} budget to "
+              f"{format_cents(load_budgets(args.file)[category])} a month.")
+    return 0
+
+
+def command_archive(args):
+    """
+    Moves the months before a cutoff into the ledger's archive, or lists
+    the archived months.
+    """
+    transactions = open_ledger(args.file)
+    if args.action == "list":
+        segments = transactions.archive.records() if (
+            transactions.archive is not None
+        ) else ()
+        return write_output(args, lambda out: write_records(
+            segments, SEGMENT_FIELDS, out, args.format
+        ))
+    try:
+        if len(args.before.strip()) != 7:
+            raise ValueError(args.before)
+        before = period_bounds(args.before)[0]
+    except ValueError:
+        print(f"Invalid month: {args.before!r}", file=sys.stderr)
+        return 2
+    written = archive_transactions(transactions, before, args.file)
+    print(f"Archived {sum(segment['rows'] for segment in written)} "
+          f"transactions in {len(written)} segments.")
+    return 0
+
+
+def command_batch(args):
+    """
+    Runs commands read from standard input, one per line, in this
+    process.
+
+    Each line holds a command with its arguments as they would be given
+    on the command line, e.g. 'add expense Food 12.50'; blank lines and
+    lines starting with '#' are skipped. The ledger is loaded once and
+    changes are written together, so thousands of commands run per
+    second. A failing line is reported on standard error with its line
+    number and the batch carries on; the exit status is 1 if any line
+    failed.
+    """
+    parser = build_parser()
+    failed = 0
+    for line_number, line in enumerate(sys.stdin, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        try:
+            words = shlex.split(line)
+            if words[0] == "batch":
+                raise ValueError("batch cannot be nested")
+            if words[0] != "--file":
+                words = ["--file", args.file] + words
+            command = parser.parse_args(words)
+            select_ledger(command)
+            status = command.handler(command)
+        except SystemExit as exit:
+            # argparse has already printed what was wrong.
+            status = exit.code
+        except ValueError as error:
+            print(error, file=sys.stderr)
+            status = 2
+        if status:
+            failed += 1
+            print(f"Line {line_number} failed: {line}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+def command_serve(args):
+    """
+    Serves the ledger over a local HTTP/JSON API (see server.py).
+    """
+    from server import serve
+
+    serve(args.file, args.host, args.port)
+    return 0
+
+
+def select_ledger(args):
+    """
+    Points args.file at the ledger chosen with --ledger, if any, and
+    makes sure its directory exists.
+    """
+    if args.ledger is not None:
+        args.file = ledger_filename(args.ledger)
+        os.makedirs(os.path.dirname(args.file) or ".", exist_ok=True)
+
+
+def id_list(text):
+    """
+    Parses '3' or '3,4,5' into a list of transaction ids.
+    """
+    try:
+        return [int(part) for part in text.split(",") if part.strip()]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid transaction id: {text}")
+
+
+def add_filter_arguments(parser):
+    parser.add_argument("--category", help="only this category")
+    parser.add_argument(
+        "--from", dest="date_from", metavar="DATE",
+        help="first period to include (YYYY, YYYY-MM or YYYY-MM-DD)",
+    )
+    parser.add_argument(
+        "--to", dest="date_to", metavar="DATE",
+        help="last period to include (YYYY, YYYY-MM or YYYY-MM-DD)",
+    )
+
+
+def add_jobs_argument(parser, default):
+    parser.add_argument(
+        "--jobs", "-j", type=int, default=default, metavar="N",
+        help="worker processes reading the files (default: "
+             f"{default or 'one per CPU'})",
+    )
+
+
+def add_output_arguments(parser, default_format):
+    parser.add_argument(
+        "--format", choices=FORMATS, default=default_format,
+        help=f"output format (default: {default_format})",
+    )
+    parser.add_argument(
+        "--output", "-o", default="-",
+        help="file to write to (default: standard output)",
+    )
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="run.py",
+        description="The Money Track App. Run without arguments for the "
+                    "interactive menu.",
+    )
+    parser.add_argument(
+        "--file", default="transactions.json",
+        help="ledger file (default: transactions.json)",
+    )
+    parser.add_argument(
+        "--ledger", metavar="NAME",
+        help="use the named ledger (e.g. household) instead of --file",
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    parser_add = commands.add_parser(
+        "add", help="add an income or expense"
+    )
+    parser_add.add_argument("type", help="income or expense")
+    parser_add.add_argument("category", help="e.g. Salary, Rent, Food")
+    parser_add.add_argument("amount", help="e.g. 12.50")
+    parser_add.add_argument(
+        "--timestamp", metavar="DATE",
+        help="YYYY-MM-DD or 'YYYY-MM-DD HH:MM:SS' (default: now)",
+    )
+    parser_add.set_defaults(handler=command_add)
+
+    parser_balance = commands.add_parser(
+        "balance", help="print the current balance"
+    )
+    parser_balance.add_argument(
+        "--at", metavar="DATE",
+        help="balance at the end of DATE (YYYY, YYYY-MM or YYYY-MM-DD)",
+    )
+    parser_balance.set_defaults(handler=command_balance)
+
+    parser_totals = commands.add_parser(
+        "totals", help="net amount of a date range, or per day/month/year"
+    )
+    add_output_arguments(parser_totals, "table")
+    parser_totals.add_argument(
+        "--from", dest="date_from", metavar="DATE",
+        help="first period to include (YYYY, YYYY-MM or YYYY-MM-DD)",
+    )
+    parser_totals.add_argument(
+        "--to", dest="date_to", metavar="DATE",
+        help="last period to include (YYYY, YYYY-MM or YYYY-MM-DD)",
+    )
+    parser_totals.add_argument(
+        "--last", type=int, metavar="DAYS",
+        help="the last DAYS days, today included",
+    )
+    parser_totals.add_argument(
+        "--by", choices=("day", "month", "year"),
+        help="one line per day, month or year",
+    )
+    parser_totals.set_defaults(handler=command_totals)
+
+    parser_list = commands.add_parser(
+        "list", help="list transactions"
+    )
+    add_output_arguments(parser_list, "table")
+    add_filter_arguments(parser_list)
+    parser_list.add_argument(
+        "--limit", type=int, metavar="N",
+        help="show at most N transactions",
+    )
+    parser_list.set_defaults(handler=command_export)
+
+    parser_import = commands.add_parser(
+        "import", help="import transactions from a CSV or NDJSON file"
+    )
+    parser_import.add_argument(
+        "paths", nargs="+", metavar="path", help="file(s) to import"
+    )
+    parser_import.add_argument(
+        "--batch-size", type=int, default=BATCH_SIZE,
+        help=f"rows validated per batch (default: {BATCH_SIZE})",
+    )
+    add_jobs_argument(parser_import, 1)
+    parser_import.set_defaults(handler=command_import)
+
+    parser_export = commands.add_parser(
+        "export", help="export transactions"
+    )
+    add_output_arguments(parser_export, "csv")
+    add_filter_arguments(parser_export)
+    parser_export.set_defaults(handler=command_export)
+
+    parser_report = commands.add_parser(
+        "report", help="print the monthly report"
+    )
+    add_output_arguments(parser_report, "table")
+    parser_report.add_argument(
+        "--categories", action="store_true",
+        help="break each month down by category",
+    )
+    parser_report.add_argument(
+        "--all", action="store_true",
+        help="net amount and balance per month across every ledger",
+    )
+    parser_report.add_argument(
+        "--input", nargs="+", metavar="FILE",
+        help="report on CSV or NDJSON files instead of the ledger",
+    )
+    add_jobs_argument(parser_report, None)
+    parser_report.set_defaults(handler=command_report)
+
+    parser_delete = commands.add_parser(
+        "delete", help="delete transactions by id or date"
+    )
+    parser_delete.add_argument(
+        "--id", dest="ids", type=id_list, action="extend", nargs="+",
+        default=[], metavar="ID",
+        help="transaction id(s) to delete, e.g. --id 3 4 or --id 3,4",
+    )
+    parser_delete.add_argument(
+        "--before", metavar="DATE",
+        help="delete every transaction before DATE (YYYY, YYYY-MM or "
+             "YYYY-MM-DD)",
+    )
+    parser_delete.set_defaults(handler=command_delete)
+
+    parser_ledgers = commands.add_parser(
+        "ledgers", help="list the ledgers with their balances"
+    )
+    add_output_arguments(parser_ledgers, "table")
+    parser_ledgers.set_defaults(handler=command_ledgers)
+
+    parser_recurring = commands.add_parser(
+        "recurring", help="manage and run recurring transactions"
+    )
+    actions = parser_recurring.add_subparsers(dest="action", required=True)
+    parser_rule = actions.add_parser(
+        "add", help="add a rule, e.g. add expense Rent 800 --every monthly"
+    )
+    parser_rule.add_argument("type", help="income or expense")
+    parser_rule.add_argument("category", help="e.g. Salary, Rent, Food")
+    parser_rule.add_argument("amount", help="e.g. 12.50")
+    parser_rule.add_argument(
+        "--every", default="monthly",
+        help="daily, weekly, monthly, quarterly, yearly or e.g. '2 weeks' "
+             "(default: monthly)",
+    )
+    parser_rule.add_argument(
+        "--start", metavar="DATE",
+        help="first occurrence, YYYY-MM-DD or 'YYYY-MM-DD HH:MM:SS' "
+             "(default: now)",
+    )
+    parser_rules = actions.add_parser("list", help="list the rules")
+    add_output_arguments(parser_rules, "table")
+    parser_unrule = actions.add_parser("delete", help="delete a rule")
+    parser_unrule.add_argument("id", type=int, help="rule id")
+    parser_run = actions.add_parser(
+        "run", help="add every occurrence that is due"
+    )
+    parser_run.add_argument(
+        "--until", metavar="DATE",
+        help="add occurrences up to the end of DATE (YYYY, YYYY-MM or "
+             "YYYY-MM-DD) instead of now",
+    )
+    parser_recurring.set_defaults(handler=command_recurring)
+
+    parser_budget = commands.add_parser(
+        "budget", help="set monthly budgets and see how they stand"
+    )
+    actions = parser_budget.add_subparsers(dest="action", required=True)
+    parser_set = actions.add_parser(
+        "set", help="set the monthly budget of an expense category"
+    )
+    parser_set.add_argument("category", help="e.g. Food, Rent")
+    parser_set.add_argument("amount", help="e.g. 300")
+    parser_remove = actions.add_parser(
+        "remove", help="remove the budget of a category"
+    )
+    parser_remove.add_argument("category", help="e.g. Food, Rent")
+    parser_remove.set_defaults(amount=None)
+    parser_show = actions.add_parser(
+        "show", help="budget, spent and remaining per category"
+    )
+    add_output_arguments(parser_show, "table")
+    parser_show.add_argument(
+        "--month", metavar="YYYY-MM", help="month (default: this month)"
+    )
+    parser_budget.set_defaults(handler=command_budget)
+
+    parser_archive = commands.add_parser(
+        "archive", help="move old months into compressed archive segments"
+    )
+    actions = parser_archive.add_subparsers(dest="action", required=True)
+    parser_move = actions.add_parser(
+        "run", help="archive every month before --before"
+    )
+    parser_move.add_argument(
+        "--before", metavar="YYYY-MM", required=True,
+        help="first month to keep in the ledger",
+    )
+    parser_segments = actions.add_parser(
+        "list", help="list the archived months"
+    )
+    add_output_arguments(parser_segments, "table")
+    parser_archive.set_defaults(handler=command_archive)
+
+    parser_batch = commands.add_parser(
+        "batch", help="run commands read from standard input, one per line"
+    )
+    parser_batch.set_defaults(handler=command_batch)
+
+    parser_serve = commands.add_parser(
+        "serve", help="serve the ledger over a local HTTP/JSON API"
+    )
+    parser_serve.add_argument(
+        "--host", default="127.0.0.1",
+        help="address to listen on (default: 127.0.0.1)",
+    )
+    parser_serve.add_argument(
+        "--port", type=int, default=8000,
+        help="port to listen on (default: 8000)",
+    )
+    parser_serve.set_defaults(handler=command_serve)
+    return parser
+
+
+def main(argv=None):
+    """
+    Runs one non-interactive command and returns its exit status.
+    """
+    args = build_parser().parse_args(argv)
+    try:
+        select_ledger(args)
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        return 2
+    try:
+        with timer(f"command.{args.command}"):
+            return args.handler(args)
+    finally:
+        flush_storage()
@@ -0,0 +1,199 @@
+# Money Track App - streaming export and report output
+
+import sys
+import csv
+import json
+from itertools import islice
+from store import FIELDS, format_cents, format_timestamp
+from reports import REPORT_FIELDS, CATEGORY_FIELDS, monthly_report
+
+
+FORMATS = ("csv", "ndjson", "table")
+
+# Lines joined into one write() call.
+CHUNK_LINES = 4096
+
+# Buffer size for files opened by open_output().
+BUFFER_SIZE = 1 << 20
+
+# Column widths of plain tables.
+COLUMN_WIDTHS = {
+    "id": 8, "type": 10, "category": 14, "amount": 12, "timestamp": 19,
+    "month": 10, "start": 19, "next": 19, "file": 22, "first": 19,
+    "last": 19,
+}
+
+
+def timestamp_formatter():
+    """
+    Returns a function formatting epoch seconds as timestamps.
+
+    The date part is cached per day, which avoids a datetime conversion for
+    every row when exporting a ledger with many transactions per day.
+    """
+    dates = {}
+
+    def format_seconds(seconds):
+        day, rest = divmod(seconds, 86400)
+        date = dates.get(day)
+        if date is None:
+            date = dates[day] = format_timestamp(day * 86400)[:10]
+        hours, rest = divmod(rest, 3600)
+        minutes, secs = divmod(rest, 60)
+        return f"{date} {hours:02d}:{minutes:02d}:{secs:02d}"
+
+    return format_seconds
+
+
+def transaction_records(rows):
+    """
+    Yields (id, type, category, amount, timestamp) tuples for 'rows'.
+    """
+    format_seconds = timestamp_formatter()
+    for row in rows:
+        yield (
+            str(row.id), row["type"], row["category"],
+            format_cents(row.cents), format_seconds(row.epoch),
+        )
+
+
+def report_records(report):
+    """
+    Yields a monthly report (see monthly_report()) as string tuples in
+    REPORT_FIELDS order. The first month has no change.
+    """
+    for summary in report:
+        change = summary["change"]
+        yield (
+            summary["month"],
+            format_cents(summary["income"]),
+            format_cents(summary["expenses"]),
+            format_cents(summary["net"]),
+            "" if change is None else format_cents(change),
+            format_cents(summary["balance"]),
+        )
+
+
+def category_records(report):
+    """
+    Yields (month, category, net amount) string tuples for every month and
+    category with transactions in a monthly report.
+    """
+    for summary in report:
+        for category, cents in summary["categories"].items():
+            yield summary["month"], category, format_cents(cents)
+
+
+def ndjson_lines(records, fields):
+    for record in records:
+        yield json.dumps(dict(zip(fields, record))) + "\n"
+
+
+def table_lines(records, fields, colour=False):
+    """
+    Yields a plain fixed-width table, with a coloured header if 'colour'.
+    """
+    widths = [COLUMN_WIDTHS.get(name, 12) for name in fields]
+    header = "  ".join(
+        name.title().ljust(width) for name, width in zip(fields, widths)
+    ).rstrip()
+    if colour:
+        from colorama import Fore, Style
+
+        header = Fore.GREEN + header + Style.RESET_ALL
+    yield header + "\n"
+    for record in records:
+        yield "  ".join(
+            value.ljust(width) for value, width in zip(record, widths)
+        ).rstrip() + "\n"
+
+
+def write_lines(lines, out):
+    """
+    Writes 'lines' to 'out' in chunks of CHUNK_LINES, so output is
+    bounded in memory and issued in few large writes.
+    """
+    lines = iter(lines)
+    while True:
+        chunk = "".join(islice(lines, CHUNK_LINES))
+        if not chunk:
+            break
+        out.write(chunk)
+
+
+def write_records(records, fields, out, output_format):
+    """
+    Streams 'records' to 'out' as CSV, NDJSON or a plain table.
+
+    Colour is only used for tables written to a terminal.
+    """
+    if output_format == "csv":
+        writer = csv.writer(out, lineterminator="\n")
+        writer.writerow(fields)
+        writer.writerows(records)
+    elif output_format == "ndjson":
+        write_lines(ndjson_lines(records, fields), out)
+    elif output_format == "table":
+        colour = hasattr(out, "isatty") and out.isatty()
+        write_lines(table_lines(records, fields, colour), out)
+    else:
+        raise ValueError(
+            f"Unknown format {output_format!r}: "
+            f"expected one of {', '.join(FORMATS)}"
+        )
+
+
+def open_output(path):
+    """
+    Opens 'path' for buffered text output ('-' or None for stdout).
+    """
+    if path in (None, "-"):
+        return sys.stdout
+    return open(path, "w", buffering=BUFFER_SIZE, newline="")
+
+
+def export_transactions(
+    transactions, out, output_format="csv",
+    category=None, start=None, end=None, limit=None
+):
+    """
+    Streams transactions to 'out', optionally filtered by category and a
+    [start, end) range of epoch seconds (see TransactionStore.query()),
+    and stopping after 'limit' rows if it is given. Archived months are
+    listed too, in time order (see TransactionStore.iter_history()).
+    """
+    if (
+        category is None and start is None and end is None
+        and transactions.archive is None
+    ):
+        rows = iter(transactions)
+    else:
+        rows = transactions.iter_history(category, start, end)
+    if limit is not None:
+        rows = islice(rows, max(limit, 0))
+    write_records(transaction_records(rows), FIELDS, out, output_format)
+
+
+def export_report(
+    transactions, out, output_format="table", by_category=False
+):
+    """
+    Streams the monthly report to 'out': income, expenses, net amount,
+    change from the previous month and running balance per month, or with
+    'by_category' the net amount per month and category.
+    """
+    write_report(
+        monthly_report(transactions), out, output_format, by_category
+    )
+
+
+def write_report(report, out, output_format="table", by_category=False):
+    """
+    Streams a monthly report built by monthly_report() or
+    breakdown_report() to 'out' (see export_report()).
+    """
+    if by_category:
+        records, fields = category_records(report), CATEGORY_FIELDS
+    else:
+        records, fields = report_records(report), REPORT_FIELDS
+    write_records(records, fields, out, output_format)
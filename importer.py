@@ -0,0 +1,137 @@
+# Money Track App - bulk transaction import
+
+import os
+import csv
+import json
+import time
+from itertools import islice
+from storage import append_transactions
+from validation import validate_transaction
+
+
+BATCH_SIZE = 10000
+
+
+def read_rows(path):
+    """
+    Streams raw rows from a CSV or newline-delimited JSON file.
+
+    The format is chosen by extension: '.csv' files are read with a header
+    row, '.ndjson', '.jsonl' and '.json' files one JSON object per line.
+    Yields (line number, row dictionary) pairs; a line that is not valid
+    JSON is yielded with the error message instead of a dictionary.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, "r", newline="") as file:
+        if extension == ".csv":
+            reader = csv.DictReader(file)
+            for row in reader:
+                yield reader.line_num, row
+            return
+        if extension not in (".ndjson", ".jsonl", ".json"):
+            raise ValueError(
+                f"Unsupported import format {extension!r}: "
+                "expected .csv, .ndjson or .jsonl"
+            )
+        for line_number, line in enumerate(file, 1):
+            if not line.strip():
+                continue
+            try:
+                yield line_number, json.loads(line)
+            except ValueError as error:
+                yield line_number, str(error)
+
+
+def validate_batch(batch):
+    """
+    Validates a batch of (line number, row) pairs.
+
+    Returns a list of valid transactions and a list of rejects, each a
+    dictionary with the line number, the reason and the original row.
+    """
+    accepted = []
+    rejected = []
+    for line_number, row in batch:
+        try:
+            if not isinstance(row, dict):
+                raise ValueError(f"Invalid JSON: {row}")
+            accepted.append(validate_transaction(
+                row.get("type"), row.get("category"),
+                row.get("amount"), row.get("timestamp")
+            ))
+        except ValueError as error:
+            rejected.append({
+                "line": line_number,
+                "reason": str(error),
+                "row": row,
+            })
+    return accepted, rejected
+
+
+def rejects_path(path):
+    """
+    Returns the side file that rejected rows of 'path' are written to,
+    e.g. 'bank.csv' -> 'bank.rejects.ndjson'.
+    """
+    root, _ = os.path.splitext(path)
+    return root + ".rejects.ndjson"
+
+
+def import_file(
+    path, transactions, filename="transactions.json", batch_size=BATCH_SIZE
+):
+    """
+    Imports transactions from a CSV or NDJSON file in one commit.
+
+    Rows are streamed and validated in batches of 'batch_size' with the
+    same rules as the Add Transaction menu. Valid rows are added to
+    'transactions'; rejected rows are written with their reason to a side
+    file next to the input (see rejects_path()), which is removed if every
+    row is valid. The accepted rows are written to storage in one batch at
+    the end.
+
+    Returns a dictionary with the number of rows imported and rejected,
+    the rejects file (or None), the elapsed seconds and rows per second.
+    """
+    started = time.perf_counter()
+    imported = 0
+    rejected = 0
+    reject_file = None
+    first_new = len(transactions)
+    rows = read_rows(path)
+    try:
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            accepted, rejects = validate_batch(batch)
+            transactions.extend(accepted)
+            imported += len(accepted)
+            if rejects:
+                if reject_file is None:
+                    reject_file = open(rejects_path(path), "w")
+                for reject in rejects:
+                    reject_file.write(json.dumps(reject) + "\n")
+                rejected += len(rejects)
+    finally:
+        if reject_file is not None:
+            reject_file.close()
+    if not rejected:
+        # Do not leave the rejects of an earlier run looking like ours.
+        try:
+            os.remove(rejects_path(path))
+        except FileNotFoundError:
+            pass
+
+    if imported:
+        append_transactions(transactions, transactions[first_new:], filename)
+
+    elapsed = time.perf_counter() - started
+    total = imported + rejected
+    return {
+        "imported": imported,
+        "rejected": rejected,
+        "rejects_file": rejects_path(path) if rejected else None,
+        "seconds": elapsed,
+        "rows_per_second": total / elapsed if elapsed > 0 else 0.0,
+    }
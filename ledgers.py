@@ -0,0 +1,136 @@
+# Money Track App - named ledgers
+
+import os
+import re
+from aggregates import LedgerAggregates, month_key
+from storage import get_storage, load_transactions
+
+
+# Named ledgers are kept in this directory, one shard of files each
+# ('ledgers/household.json' with its journal, binary snapshot, ...). The
+# default ledger stays in 'transactions.json'.
+LEDGER_DIRECTORY = "ledgers"
+DEFAULT_LEDGER = "default"
+DEFAULT_FILE = "transactions.json"
+
+NAME_PATTERN = re.compile(r"[A-Za-z0-9][A-Za-z0-9_-]{0,63}")
+
+# Columns of the consolidated monthly report.
+CONSOLIDATED_FIELDS = ("month", "net", "balance")
+
+
+def ledger_filename(name=None, root="."):
+    """
+    Returns the snapshot file of the ledger 'name', e.g. 'household' ->
+    'ledgers/household.json'; the default ledger (None or 'default') is
+    'transactions.json'. Raises ValueError for a name that is not letters,
+    digits, '-' and '_'.
+    """
+    if name in (None, "", DEFAULT_LEDGER):
+        return os.path.normpath(os.path.join(root, DEFAULT_FILE))
+    if not NAME_PATTERN.fullmatch(name):
+        raise ValueError(
+            f"Invalid ledger name {name!r}: use letters, digits, '-' and '_'"
+        )
+    return os.path.normpath(
+        os.path.join(root, LEDGER_DIRECTORY, name + ".json")
+    )
+
+
+def ledger_names(root="."):
+    """
+    Returns the names of the ledgers that exist under 'root', the default
+    ledger first.
+    """
+    names = []
+    default = os.path.join(root, DEFAULT_FILE)
+    if any(
+        os.path.exists(os.path.splitext(default)[0] + extension)
+        for extension in (".json", ".journal", ".db")
+    ):
+        names.append(DEFAULT_LEDGER)
+    try:
+        files = os.listdir(os.path.join(root, LEDGER_DIRECTORY))
+    except FileNotFoundError:
+        files = []
+    shards = set()
+    for file in files:
+        name, extension = os.path.splitext(file)
+        if extension in (".json", ".journal", ".db") and (
+            NAME_PATTERN.fullmatch(name)
+        ):
+            shards.add(name)
+    return names + sorted(shards - {DEFAULT_LEDGER})
+
+
+class LedgerSet:
+    """
+    The named ledgers under one directory.
+
+    Each ledger is its own shard: its own snapshot, journal and side files,
+    and once loaded its own TransactionStore with its own indexes and
+    aggregates. A ledger is only loaded when it is selected with get().
+    Consolidated totals across ledgers are built from each shard's saved
+    aggregates (see JsonStorage.summary()), so shards that were never
+    selected are not loaded for them.
+    """
+
+    def __init__(self, root="."):
+        self.root = root
+        self.loaded = {}
+
+    def filename(self, name):
+        return ledger_filename(name, self.root)
+
+    def names(self):
+        return ledger_names(self.root)
+
+    def get(self, name):
+        """
+        Returns the TransactionStore of the ledger 'name', loading it on
+        first use. A new ledger's directory is created as needed.
+        """
+        name = name or DEFAULT_LEDGER
+        transactions = self.loaded.get(name)
+        if transactions is None:
+            filename = self.filename(name)
+            os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+            transactions = self.loaded[name] = load_transactions(filename)
+        return transactions
+
+    def aggregates(self, name):
+        """
+        Returns the aggregates of the ledger 'name': from the loaded store
+        if it was selected, otherwise from its saved aggregates, loading
+        the shard only if they cannot be brought up to date without it.
+        """
+        name = name or DEFAULT_LEDGER
+        if name in self.loaded:
+            return self.loaded[name].aggregates
+        summary = get_storage(self.filename(name)).summary()
+        if summary is None:
+            summary = self.get(name).aggregates
+        return summary
+
+    def consolidated(self):
+        """
+        Returns ({ledger name: its aggregates}, the merged aggregates) for
+        every ledger.
+        """
+        shards = {name: self.aggregates(name) for name in self.names()}
+        total = LedgerAggregates()
+        for aggregates in shards.values():
+            total.merge(aggregates)
+        return shards, total
+
+
+def consolidated_report(total):
+    """
+    Yields (month, net amount, running balance) in cents per month from
+    consolidated aggregates (see LedgerSet.consolidated()).
+    """
+    balance = 0
+    for month in sorted(total.months):
+        net = total.months[month][0]
+        balance += net
+        yield month_key(month), net, balance
@@ -0,0 +1,133 @@
+# Money Track App - timers and counters for the hot paths
+
+import os
+import sys
+import json
+import time
+import atexit
+import functools
+import contextlib
+
+
+# Where dump_on_exit() writes the metrics: unset for nowhere, '1' or '-'
+# for standard error, anything else is a file the JSON line is appended to.
+METRICS_DESTINATION = os.environ.get("MONEY_TRACK_METRICS")
+
+# Counters by name, e.g. "storage.bytes_written".
+counters = {}
+
+# [calls, total seconds, slowest call in seconds] by timer name.
+timers = {}
+
+
+def count(name, amount=1):
+    """
+    Adds 'amount' to the counter 'name'.
+    """
+    counters[name] = counters.get(name, 0) + amount
+
+
+def record(name, seconds):
+    """
+    Records one call of 'seconds' under the timer 'name'.
+    """
+    entry = timers.get(name)
+    if entry is None:
+        timers[name] = [1, seconds, seconds]
+        return
+    entry[0] += 1
+    entry[1] += seconds
+    if seconds > entry[2]:
+        entry[2] = seconds
+
+
+@contextlib.contextmanager
+def timer(name):
+    """
+    Times the block under the timer 'name'.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record(name, time.perf_counter() - started)
+
+
+def timed(name):
+    """
+    Decorator timing every call of the function under the timer 'name'.
+    """
+    def decorate(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                record(name, time.perf_counter() - started)
+        return wrapper
+    return decorate
+
+
+def snapshot():
+    """
+    Returns the timers and counters as a dictionary, ready for JSON.
+    """
+    return {
+        "timers": {
+            name: {
+                "calls": calls,
+                "seconds": round(total, 6),
+                "max_seconds": round(slowest, 6),
+            }
+            for name, (calls, total, slowest) in sorted(timers.items())
+        },
+        "counters": dict(sorted(counters.items())),
+    }
+
+
+def dump(destination=None):
+    """
+    Writes snapshot() as one JSON line, with the time and process id, to
+    'destination' (see METRICS_DESTINATION).
+    """
+    destination = destination or METRICS_DESTINATION
+    if not destination:
+        return
+    line = json.dumps(
+        dict(time=round(time.time(), 3), pid=os.getpid(), **snapshot())
+    ) + "\n"
+    if destination in ("1", "-"):
+        sys.stderr.write(line)
+    else:
+        with open(destination, "a") as file:
+            file.write(line)
+
+
+def dump_on_exit():
+    """
+    Arranges for the metrics to be dumped when the process exits, if
+    MONEY_TRACK_METRICS is set.
+    """
+    if METRICS_DESTINATION:
+        atexit.register(dump)
+
+
+def profile(function, output="money_track.prof", top=20):
+    """
+    Runs function() under cProfile and returns its result.
+
+    The raw statistics are saved to 'output' (for pstats or snakeviz) and
+    the 'top' functions by cumulative time are printed to standard error.
+    """
+    import cProfile
+    import pstats
+
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(function)
+    finally:
+        profiler.dump_stats(output)
+        stats = pstats.Stats(profiler, stream=sys.stderr)
+        stats.sort_stats("cumulative").print_stats(top)
+        print(f"Profile saved to {output}", file=sys.stderr)
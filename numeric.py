@@ -0,0 +1,175 @@
+# Money Track App - column arithmetic (uses NumPy when installed)
+
+from array import array
+from itertools import compress
+
+
+# Columns shorter than this are summed in Python; NumPy only pays off
+# (and is only imported) for longer ones.
+NUMPY_MIN_ROWS = 10000
+
+# Largest magnitude an int64 sum can reach.
+INT64_LIMIT = 2 ** 63 - 1
+
+_numpy = False
+
+
+def numpy_module():
+    """
+    Returns the numpy module, or None if it is not installed.
+
+    NumPy is imported on first use rather than at startup, so commands that
+    never sum a large column do not pay for importing it.
+    """
+    global _numpy
+    if _numpy is False:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+        _numpy = numpy
+    return _numpy
+
+
+def _vectors(values, keys=(), live=None):
+    """
+    Returns NumPy views of the 'values' (int64) and 'keys' columns, with
+    rows whose 'live' flag is 0 left out, or None if NumPy should not be
+    used for them.
+    """
+    if len(values) < NUMPY_MIN_ROWS or not isinstance(values, array):
+        return None
+    numpy = numpy_module()
+    if numpy is None or values.typecode != "q":
+        return None
+    amounts = numpy.frombuffer(values, dtype=numpy.int64)
+    codes = [
+        numpy.frombuffer(column, dtype=column.typecode) for column in keys
+    ]
+    if live is not None:
+        mask = numpy.frombuffer(live, dtype=numpy.uint8).astype(bool)
+        amounts = amounts[mask]
+        codes = [column[mask] for column in codes]
+    if len(amounts) and (
+        int(numpy.abs(amounts).max()) > INT64_LIMIT // len(amounts)
+    ):
+        # The sum might overflow int64; Python integers cannot.
+        return None
+    return amounts, codes
+
+
+def sum_cents(values, live=None):
+    """
+    Returns the exact sum of a column of integer cents.
+
+    'values' is an array('q') (or any sequence of integers); 'live', if
+    given, is a bytearray flagging which rows to include. Long columns
+    are summed by NumPy as int64 without copying them, whenever the sum
+    cannot overflow; otherwise Python's arbitrary-precision integers are
+    used.
+    """
+    vectors = _vectors(values, live=live)
+    if vectors is not None:
+        return int(vectors[0].sum())
+    if live is not None:
+        values = compress(values, live)
+    return sum(values)
+
+
+def day_numbers(times):
+    """
+    Returns an array('q') of the day numbers (days since 1970-01-01,
+    rounded down) of a column of epoch seconds; with NumPy for long
+    columns.
+    """
+    numpy = numpy_module() if len(times) >= NUMPY_MIN_ROWS else None
+    days = array("q")
+    if numpy is not None and isinstance(times, array):
+        seconds = numpy.frombuffer(times, dtype=numpy.int64)
+        days.frombytes((seconds // 86400).tobytes())
+    else:
+        days.extend(seconds // 86400 for seconds in times)
+    return days
+
+
+def _combined_codes(numpy, codes):
+    """
+    Folds several non-negative key columns into one int64 column, and
+    returns it with the radix of each column, or None if the combined
+    keys would not fit.
+    """
+    combined = numpy.zeros(len(codes[0]), dtype=numpy.int64)
+    radixes = []
+    span = 1
+    for column in codes:
+        if len(column) and int(column.min()) < 0:
+            return None
+        radix = int(column.max()) + 1 if len(column) else 1
+        span *= radix
+        if span > INT64_LIMIT:
+            return None
+        combined *= radix
+        combined += column
+        radixes.append(radix)
+    return combined, radixes
+
+
+def _split_code(code, radixes):
+    parts = []
+    for radix in reversed(radixes):
+        code, part = divmod(code, radix)
+        parts.append(part)
+    return tuple(reversed(parts))
+
+
+def group_sums(keys, values, live=None):
+    """
+    Groups a column of integer cents by a column of integer keys.
+
+    Returns a dictionary mapping each key to [total cents, row count].
+    'keys' may also be a tuple of key columns, to group by several at
+    once; the dictionary is then keyed by tuples. With NumPy the key
+    columns are folded into one, the rows are grouped by one stable sort
+    of it and summed per group with add.reduceat(), all in int64, instead
+    of one dictionary update per row.
+    """
+    several = isinstance(keys, tuple)
+    columns = keys if several else (keys,)
+    vectors = _vectors(values, columns, live)
+    folded = None
+    if vectors is not None:
+        numpy = numpy_module()
+        amounts, codes = vectors
+        if not len(amounts):
+            return {}
+        folded = _combined_codes(numpy, codes) if several else (
+            codes[0], None
+        )
+    if folded is not None:
+        codes, radixes = folded
+        order = numpy.argsort(codes, kind="stable")
+        codes = codes[order]
+        starts = numpy.flatnonzero(
+            numpy.concatenate(([True], codes[1:] != codes[:-1]))
+        )
+        sums = numpy.add.reduceat(amounts[order], starts)
+        counts = numpy.diff(numpy.append(starts, len(codes)))
+        return {
+            (_split_code(key, radixes) if several else key):
+                [total, count]
+            for key, total, count in zip(
+                codes[starts].tolist(), sums.tolist(), counts.tolist()
+            )
+        }
+    rows = zip(zip(*columns), values) if several else zip(keys, values)
+    if live is not None:
+        rows = compress(rows, live)
+    groups = {}
+    for key, cents in rows:
+        entry = groups.get(key)
+        if entry is None:
+            groups[key] = [cents, 1]
+        else:
+            entry[0] += cents
+            entry[1] += 1
+    return groups
@@ -0,0 +1,78 @@
+# Money Track App - paginated transaction listing
+
+# Session-wide listing settings; changed with the page size command.
+settings = {"page_size": 20}
+
+
+class TransactionPager:
+    """
+    Cursor over a TransactionStore that shows one page at a time.
+
+    Only the rows on the current page are materialized and formatted, so
+    browsing stays fast however many transactions there are. Rows are
+    numbered by their position in the ledger (1-based), the same numbers
+    delete_transaction() asks for.
+    """
+
+    def __init__(self, transactions, page_size=None):
+        self.transactions = transactions
+        self.page_size = page_size or settings["page_size"]
+        self.page = 0
+
+    @property
+    def page_count(self):
+        return max(1, -(-len(self.transactions) // self.page_size))
+
+    def rows(self):
+        """
+        Returns (number, row) pairs for the current page.
+        """
+        self.page = min(self.page, self.page_count - 1)
+        start = self.page * self.page_size
+        end = min(start + self.page_size, len(self.transactions))
+        return [
+            (index + 1, self.transactions[index])
+            for index in range(start, end)
+        ]
+
+    def next_page(self):
+        """Moves to the next page; returns False on the last page."""
+        if self.page + 1 >= self.page_count:
+            return False
+        self.page += 1
+        return True
+
+    def previous_page(self):
+        """Moves to the previous page; returns False on the first page."""
+        if self.page == 0:
+            return False
+        self.page -= 1
+        return True
+
+    def go_to_page(self, page):
+        """Moves to the 1-based 'page', clamped to the valid range."""
+        self.page = max(0, min(page - 1, self.page_count - 1))
+
+    def last_page(self):
+        self.page = self.page_count - 1
+
+    def jump_to_time(self, seconds):
+        """
+        Moves to the page holding the first transaction at or after
+        'seconds' (epoch), found through the store's time index. Returns
+        False if there is no such transaction.
+        """
+        index = self.transactions.position_at_or_after(seconds)
+        if index is None:
+            return False
+        self.page = index // self.page_size
+        return True
+
+    def set_page_size(self, size):
+        """
+        Changes the page size for this and later listings, keeping the
+        first row of the current page visible.
+        """
+        first = self.page * self.page_size
+        self.page_size = settings["page_size"] = size
+        self.page = first // size
@@ -0,0 +1,249 @@
+# Money Track App - parallel ingestion and reports over many files
+
+import os
+import json
+from concurrent.futures import ProcessPoolExecutor
+from importer import read_rows, validate_batch, rejects_path
+from storage import append_transactions
+from store import parse_cents, parse_timestamp
+from aggregates import month_number
+from metrics import count, timed
+
+
+# Largest piece of one NDJSON file given to a worker, in bytes. Smaller
+# pieces are used when there are more workers than pieces.
+CHUNK_BYTES = 64 << 20
+
+# Files smaller than this are never split.
+MIN_CHUNK_BYTES = 1 << 20
+
+# Rows validated at a time within a piece.
+BATCH_ROWS = 10000
+
+# Extensions of the files that can be split at line boundaries; CSV files
+# may have line breaks inside quoted fields, so they are read whole.
+SPLITTABLE = (".ndjson", ".jsonl", ".json")
+
+
+def plan_chunks(paths, jobs, chunk_bytes=CHUNK_BYTES):
+    """
+    Splits the input files into (path, start, end) pieces of work.
+
+    NDJSON files are cut into byte ranges of at most 'chunk_bytes', and
+    into at least 'jobs' ranges when they are large enough, so a single
+    large file still keeps every worker busy; 'end' is None for the rest
+    of the file. Other files are one piece each.
+    """
+    chunks = []
+    for path in paths:
+        size = os.path.getsize(path)
+        extension = os.path.splitext(path)[1].lower()
+        if extension not in SPLITTABLE or size <= MIN_CHUNK_BYTES:
+            chunks.append((path, 0, None))
+            continue
+        step = max(MIN_CHUNK_BYTES, min(chunk_bytes, -(-size // jobs)))
+        for start in range(0, size, step):
+            end = start + step
+            chunks.append((path, start, end if end < size else None))
+    return chunks
+
+
+def chunk_rows(path, start, end):
+    """
+    Yields (line number within the piece, row dictionary) for every line
+    of an NDJSON file that starts in the byte range [start, end), like
+    read_rows(); a line that is not valid JSON comes with the error
+    message instead, and a blank line with None.
+    """
+    with open(path, "rb") as file:
+        if start:
+            # Skip the line the previous piece ends with, unless 'start'
+            # is exactly where a line begins.
+            file.seek(start - 1)
+            file.readline()
+        position = file.tell()
+        line_number = 0
+        while end is None or position < end:
+            line = file.readline()
+            if not line:
+                break
+            position += len(line)
+            line_number += 1
+            if not line.strip():
+                # Counted, so the pieces after this one number their
+                # lines right.
+                yield line_number, None
+                continue
+            try:
+                yield line_number, json.loads(line)
+            except ValueError as error:
+                yield line_number, str(error)
+
+
+def scan_chunk(chunk, keep_rows=False):
+    """
+    Parses, validates and pre-aggregates one piece of work.
+
+    Runs in a worker process. Returns a dictionary with:
+    'breakdown', the totals per (month number, type, category) as
+    [cents, count] (see TransactionStore.monthly_breakdown());
+    'rejects', the rejected rows (see validate_batch()) with line numbers
+    counted from the start of the piece; 'lines', the number of lines the
+    piece covers; and with 'keep_rows' also 'rows', the accepted
+    transactions as (type, category, cents, epoch seconds) tuples.
+    """
+    path, start, end = chunk
+    if start == 0 and end is None:
+        rows = read_rows(path)
+    else:
+        rows = chunk_rows(path, start, end)
+    breakdown = {}
+    rejects = []
+    kept = [] if keep_rows else None
+    lines = 0
+    batch = []
+    for line_number, row in rows:
+        lines = line_number
+        if row is None:
+            continue
+        batch.append((line_number, row))
+        if len(batch) < BATCH_ROWS:
+            continue
+        _scan_batch(batch, breakdown, rejects, kept)
+        batch = []
+    _scan_batch(batch, breakdown, rejects, kept)
+    result = {"breakdown": breakdown, "rejects": rejects, "lines": lines}
+    if keep_rows:
+        result["rows"] = kept
+    return result
+
+
+def _scan_batch(batch, breakdown, rejects, kept):
+    accepted, rejected = validate_batch(batch)
+    rejects.extend(rejected)
+    for transaction in accepted:
+        cents = parse_cents(transaction["amount"])
+        timestamp = transaction["timestamp"]
+        key = (
+            month_number(timestamp[:7]), transaction["type"],
+            transaction["category"],
+        )
+        entry = breakdown.get(key)
+        if entry is None:
+            breakdown[key] = [cents, 1]
+        else:
+            entry[0] += cents
+            entry[1] += 1
+        if kept is not None:
+            kept.append((
+                transaction["type"], transaction["category"], cents,
+                parse_timestamp(timestamp),
+            ))
+
+
+def _scan_keeping_rows(chunk):
+    return scan_chunk(chunk, keep_rows=True)
+
+
+def scan_files(paths, jobs=None, keep_rows=False, chunk_bytes=CHUNK_BYTES):
+    """
+    Runs scan_chunk() over every piece of the input files (see
+    plan_chunks()) in a pool of 'jobs' worker processes (default: one per
+    CPU) and yields (chunk, result) in input order. With one job, or one
+    piece, everything runs in this process.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    chunks = plan_chunks(paths, jobs, chunk_bytes)
+    worker = _scan_keeping_rows if keep_rows else scan_chunk
+    if jobs == 1 or len(chunks) == 1:
+        for chunk in chunks:
+            yield chunk, worker(chunk)
+        return
+    with ProcessPoolExecutor(min(jobs, len(chunks))) as pool:
+        yield from zip(chunks, pool.map(worker, chunks))
+
+
+def merge_breakdowns(total, breakdown):
+    """
+    Adds the [cents, count] totals of 'breakdown' to 'total'.
+    """
+    for key, (cents, rows) in breakdown.items():
+        entry = total.get(key)
+        if entry is None:
+            total[key] = [cents, rows]
+        else:
+            entry[0] += cents
+            entry[1] += rows
+
+
+@timed("report.files")
+def report_files(paths, jobs=None):
+    """
+    Totals the transactions of CSV and NDJSON files without loading them
+    into a ledger, for a report over an archive.
+
+    The files are parsed, validated and grouped by month, type and
+    category in parallel (see scan_files()), and the partial totals are
+    merged. Returns (breakdown, number of rejected rows); build the report
+    with reports.breakdown_report().
+    """
+    total = {}
+    rejected = 0
+    for _, result in scan_files(paths, jobs):
+        merge_breakdowns(total, result["breakdown"])
+        rejected += len(result["rejects"])
+    count("rows_scanned", sum(entry[1] for entry in total.values()))
+    return total, rejected
+
+
+@timed("import.files")
+def import_files(
+    paths, transactions, filename="transactions.json", jobs=None
+):
+    """
+    Imports CSV and NDJSON files into the ledger, parsing and validating
+    them in parallel (see scan_files()).
+
+    Rows are added in file and line order and written to storage in one
+    batch at the end, as import_file() does for one file. Rejected rows
+    are written, with their line numbers in the file, to each file's
+    rejects file (see rejects_path()), which is removed for a file
+    without rejects. Returns a dictionary with the number of rows
+    imported and rejected and the rejects files written.
+    """
+    first_new = len(transactions)
+    imported = 0
+    rejected = 0
+    reject_files = {}
+    lines = {}
+    try:
+        for (path, _, _), result in scan_files(paths, jobs, keep_rows=True):
+            for t_type, category, cents, seconds in result["rows"]:
+                transactions.append_values(t_type, category, cents, seconds)
+            imported += len(result["rows"])
+            offset = lines.get(path, 0)
+            lines[path] = offset + result["lines"]
+            if not result["rejects"]:
+                continue
+            if path not in reject_files:
+                reject_files[path] = open(rejects_path(path), "w")
+            for reject in result["rejects"]:
+                reject["line"] += offset
+                reject_files[path].write(json.dumps(reject) + "\n")
+            rejected += len(result["rejects"])
+    finally:
+        for file in reject_files.values():
+            file.close()
+    for path in set(paths) - set(reject_files):
+        # Do not leave the rejects of an earlier run looking like ours.
+        try:
+            os.remove(rejects_path(path))
+        except FileNotFoundError:
+            pass
+    if imported:
+        append_transactions(transactions, transactions[first_new:], filename)
+    return {
+        "imported": imported,
+        "rejected": rejected,
+        "rejects_files": sorted(rejects_path(path) for path in reject_files),
+    }
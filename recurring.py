@@ -0,0 +1,222 @@
+# Money Track App - recurring transactions
+
+import os
+import re
+import json
+import calendar
+from datetime import datetime
+from storage import ledger_lock, atomic_write, get_storage
+from storage import append_transactions, refresh_transactions
+from store import parse_timestamp, format_timestamp
+from validation import validate_transaction
+
+
+# How often a rule repeats: a name, or 'N days', 'N weeks' or 'N months'.
+FREQUENCIES = {
+    "daily": (1, "days"),
+    "weekly": (7, "days"),
+    "monthly": (1, "months"),
+    "quarterly": (3, "months"),
+    "yearly": (12, "months"),
+}
+INTERVAL_PATTERN = re.compile(r"(\d+)\s*(day|week|month|year)s?")
+
+# Columns of the rule listing, in order.
+RULE_FIELDS = ("id", "type", "category", "amount", "every", "start", "next")
+
+_EPOCH_ORDINAL = datetime(1970, 1, 1).toordinal()
+
+
+def rules_path(filename):
+    """
+    Returns the file the recurring rules of a ledger are kept in,
+    e.g. 'transactions.json' -> 'transactions.recurring.json'.
+    """
+    root, _ = os.path.splitext(filename)
+    return root + ".recurring.json"
+
+
+def parse_interval(every):
+    """
+    Converts how often a rule repeats to (count, 'days' or 'months'),
+    e.g. 'monthly' -> (1, 'months'), '2 weeks' -> (14, 'days').
+
+    Raises ValueError for anything that is not a name in FREQUENCIES or
+    'N days', 'N weeks', 'N months' or 'N years' with N > 0.
+    """
+    text = str(every).strip().lower()
+    if text in FREQUENCIES:
+        return FREQUENCIES[text]
+    match = INTERVAL_PATTERN.fullmatch(text)
+    if match is None or int(match.group(1)) == 0:
+        raise ValueError(
+            f"Invalid frequency {every!r}: expected "
+            f"{', '.join(FREQUENCIES)} or e.g. '2 weeks', '3 months'"
+        )
+    number, unit = int(match.group(1)), match.group(2)
+    if unit == "week":
+        return number * 7, "days"
+    if unit == "year":
+        return number * 12, "months"
+    return number, unit + "s"
+
+
+def occurrence(rule, index):
+    """
+    Returns the epoch seconds of occurrence 'index' (0 for the first) of
+    'rule'.
+
+    Each occurrence is worked out from the start, not from the previous
+    one, so a rule starting on the 31st falls on the last day of shorter
+    months and is back on the 31st afterwards.
+    """
+    start = parse_timestamp(rule["start"])
+    number, unit = parse_interval(rule["every"])
+    if unit == "days":
+        return start + index * number * 86400
+    day, seconds = divmod(start, 86400)
+    moment = datetime.fromordinal(day + _EPOCH_ORDINAL)
+    months = moment.year * 12 + moment.month - 1 + index * number
+    year, month = divmod(months, 12)
+    day = min(moment.day, calendar.monthrange(year, month + 1)[1])
+    moved = datetime(year, month + 1, day).toordinal() - _EPOCH_ORDINAL
+    return moved * 86400 + seconds
+
+
+def due_occurrences(rule, until):
+    """
+    Yields (index, epoch seconds) for every occurrence of 'rule' that has
+    not been added to the ledger yet and is due by 'until'.
+    """
+    index = rule.get("done", 0)
+    while True:
+        seconds = occurrence(rule, index)
+        if seconds > until:
+            return
+        yield index, seconds
+        index += 1
+
+
+def load_rules(filename="transactions.json"):
+    """
+    Returns the recurring rules saved for the ledger 'filename', oldest
+    first, or an empty list if there are none.
+    """
+    try:
+        with open(rules_path(filename), "r") as file:
+            return json.load(file)["rules"]
+    except FileNotFoundError:
+        return []
+
+
+def save_rules(rules, filename="transactions.json"):
+    """
+    Saves the recurring rules of the ledger 'filename'.
+    """
+    with atomic_write(rules_path(filename)) as file:
+        json.dump({"rules": rules}, file, indent=4)
+
+
+def add_rule(
+    transaction_type, category, amount, every="monthly", start=None,
+    filename="transactions.json",
+):
+    """
+    Adds a recurring rule to the ledger 'filename' and returns it.
+
+    The type, category and amount follow the same rules as the Add
+    Transaction menu. 'start' is the first occurrence ('YYYY-MM-DD' or
+    'YYYY-MM-DD HH:MM:SS', default now); occurrences before today are
+    added by the next run_rules(), so a rule can be back-dated.
+
+    Raises:
+        ValueError: With a message describing the first invalid field.
+    """
+    transaction = validate_transaction(
+        transaction_type, category, amount, start
+    )
+    parse_interval(every)
+    with ledger_lock(rules_path(filename)):
+        rules = load_rules(filename)
+        rule = {
+            "id": max((rule["id"] for rule in rules), default=0) + 1,
+            "type": transaction["type"],
+            "category": transaction["category"],
+            "amount": transaction["amount"],
+            "every": str(every).strip().lower(),
+            "start": transaction["timestamp"],
+            "done": 0,
+        }
+        rules.append(rule)
+        save_rules(rules, filename)
+    return rule
+
+
+def delete_rule(rule_id, filename="transactions.json"):
+    """
+    Deletes the recurring rule 'rule_id' of the ledger 'filename'; the
+    transactions it already added are kept. Returns False if there is no
+    such rule.
+    """
+    with ledger_lock(rules_path(filename)):
+        rules = load_rules(filename)
+        kept = [rule for rule in rules if rule["id"] != rule_id]
+        if len(kept) == len(rules):
+            return False
+        save_rules(kept, filename)
+    return True
+
+
+def rule_records(rules):
+    """
+    Yields the rules as rows of RULE_FIELDS, with the next occurrence.
+    """
+    for rule in rules:
+        yield (
+            str(rule["id"]), rule["type"], rule["category"], rule["amount"],
+            rule["every"], rule["start"],
+            format_timestamp(occurrence(rule, rule.get("done", 0))),
+        )
+
+
+def run_rules(transactions, filename="transactions.json", until=None):
+    """
+    Adds every occurrence of the ledger's recurring rules that is due by
+    'until' (epoch seconds, default now) and was not added yet.
+
+    All due occurrences, however many months they span, are added to
+    'transactions' and its aggregates in time order and written to
+    storage in one batch, then each rule records how far it got. The
+    transactions are saved first, so a crash in between can repeat
+    occurrences on the next run but never lose them. Returns the rows
+    added.
+    """
+    if until is None:
+        until = parse_timestamp(
+            datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        )
+    if not os.path.exists(rules_path(filename)):
+        return []
+    with ledger_lock(rules_path(filename)):
+        rules = load_rules(filename)
+        due = []
+        for rule in rules:
+            for index, seconds in due_occurrences(rule, until):
+                due.append((seconds, rule["id"], {
+                    "type": rule["type"],
+                    "category": rule["category"],
+                    "amount": rule["amount"],
+                    "timestamp": format_timestamp(seconds),
+                }))
+                rule["done"] = index + 1
+        if not due:
+            return []
+        due.sort(key=lambda item: item[:2])
+        refresh_transactions(transactions, filename)
+        first_new = len(transactions)
+        transactions.extend(transaction for _, _, transaction in due)
+        added = transactions[first_new:]
+        append_transactions(transactions, added, filename)
+        get_storage(filename).flush()
+        save_rules(rules, filename)
+    return added
@@ -0,0 +1,134 @@
+# Money Track App - monthly report engine
+
+from aggregates import month_key
+from metrics import timed
+from store import period_bounds, format_timestamp
+
+
+# Columns of the monthly report, in order.
+REPORT_FIELDS = ("month", "income", "expenses", "net", "change", "balance")
+
+# Columns of the per-category breakdown.
+CATEGORY_FIELDS = ("month", "category", "total")
+
+# Columns of the totals per day, month or year.
+PERIOD_FIELDS = ("period", "transactions", "net")
+
+
+@timed("report.monthly")
+def monthly_report(transactions):
+    """
+    Builds the detailed monthly report for a ledger.
+
+    Returns one dictionary per month that has transactions, oldest first,
+    with the amounts in cents:
+    'month' ('YYYY-MM'), 'income', 'expenses' (negative), 'net',
+    'change' (net minus the previous month's net, None for the first
+    month), 'balance' (the running balance at the end of the month) and
+    'categories' (net amount per category, by name).
+
+    The rows are read once, grouped by month, type and category (see
+    TransactionStore.monthly_breakdown()); the running balance and the
+    changes are then worked out per month, not per row.
+
+    Args:
+        transactions (TransactionStore): The ledger to report on.
+    """
+    return breakdown_report(transactions.monthly_breakdown())
+
+
+def breakdown_report(breakdown):
+    """
+    Builds the monthly report (see monthly_report()) from totals grouped
+    by month, type and category: a dictionary mapping (month number, type,
+    category) to [total cents, transaction count], as returned by
+    TransactionStore.monthly_breakdown() or merged from several files by
+    parallel.py.
+    """
+    months = {}
+    for (month, t_type, category), (cents, _) in breakdown.items():
+        summary = months.get(month)
+        if summary is None:
+            summary = months[month] = {
+                "income": 0, "expenses": 0, "categories": {}
+            }
+        summary["income" if t_type == "income" else "expenses"] += cents
+        categories = summary["categories"]
+        categories[category] = categories.get(category, 0) + cents
+
+    report = []
+    balance = 0
+    previous = None
+    for month in sorted(months):
+        summary = months[month]
+        net = summary["income"] + summary["expenses"]
+        balance += net
+        report.append({
+            "month": month_key(month),
+            "income": summary["income"],
+            "expenses": summary["expenses"],
+            "net": net,
+            "change": None if previous is None else net - previous,
+            "balance": balance,
+            "categories": dict(sorted(summary["categories"].items())),
+        })
+        previous = net
+    return report
+
+
+def periods(transactions, by):
+    """
+    Yields (period, key, start, end) for every day, month or year ('by')
+    with transactions, oldest first: its name, its key in the ledger's
+    totals table and its [start, end) epoch seconds.
+    """
+    aggregates = transactions.aggregates
+    if by == "day":
+        for day in sorted(aggregates.days):
+            yield (
+                format_timestamp(day * 86400)[:10], day,
+                day * 86400, (day + 1) * 86400,
+            )
+    elif by == "month":
+        for month in sorted(aggregates.months):
+            yield (month_key(month), month) + period_bounds(month_key(month))
+    elif by == "year":
+        for year in sorted(aggregates.years):
+            yield (f"{year:04d}", year) + period_bounds(f"{year:04d}")
+    else:
+        raise ValueError(
+            f"Unknown period {by!r}: expected day, month or year"
+        )
+
+
+@timed("report.periods")
+def period_totals(transactions, by="month", start=None, end=None):
+    """
+    Yields (period, cents, count) per day, month or year ('by') with
+    transactions in the [start, end) range of epoch seconds (None leaves
+    that end open).
+
+    Periods inside the range are read from the daily, monthly and yearly
+    totals the ledger keeps up to date; the one or two cut by the range
+    are totalled with TransactionStore.range_totals(), in O(log n). No
+    transactions are scanned either way.
+    """
+    aggregates = transactions.aggregates
+    table = {
+        "day": aggregates.days, "month": aggregates.months,
+        "year": aggregates.years,
+    }.get(by)
+    for period, key, low, high in periods(transactions, by):
+        if start is not None and high <= start:
+            continue
+        if end is not None and low >= end:
+            break
+        if (start is None or start <= low) and (end is None or high <= end):
+            cents, count = table[key]
+        else:
+            cents, count = transactions.range_totals(
+                low if start is None else max(low, start),
+                high if end is None else min(high, end),
+            )
+        if count:
+            yield period, cents, count
@@ -1,13 +1,50 @@
 # Money Track App (Income and Expense Tracker)
 
 import os
-import json
+import sys
+import time
 from datetime import datetime
-from colorama import Fore, Back, Style, init
+import storage
+from storage import load_transactions, append_transaction, delete_transactions
+from storage import flush_storage, refresh_transactions
+from store import period_bounds, parse_cents, format_cents
+from pager import TransactionPager
+from reports import monthly_report
+from cache import report_cache
+from ledgers import ledger_filename
+from recurring import run_rules
+from budgets import budget_alert
+import metrics
+from validation import VALID_INCOME_CATEGORIES, VALID_EXPENSE_CATEGORIES
+
+
+class LazyColour:
+    """
+    Stands in for one of colorama's Fore, Back and Style objects.
+
+    colorama is only imported when a colour is first used, so commands
+    that never print in colour (see cli.py) start without loading it.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __getattr__(self, attribute):
+        import colorama
+
+        value = getattr(getattr(colorama, self.name), attribute)
+        setattr(self, attribute, value)
+        return value
+
 
+Fore = LazyColour("Fore")
+Back = LazyColour("Back")
+Style = LazyColour("Style")
 
-#  Initialise colorama
-init(autoreset=True)
+PAGE_HELP = (
+    "Browse with 'n' (next), 'p' (previous), 'l' (last), 'g N' (page N), "
+    "'d YYYY-MM-DD' (jump to date) or 's N' (page size)"
+)
 
 
 def clear():
@@ -67,49 +104,22 @@ def get_user_choice():
             ))
 
 
-def save_transactions(transactions, filename="transactions.json"):
-    """
-    Saves transaction data to JSON file.
-
-    Serializes the provided 'transactions' list as a JSON object and
-    writes it to the specified 'filename' (defaults to 'transactions.json').
-    """
-    with open(filename, "w") as file:
-        json.dump(transactions, file, indent=4)
-
-
-def load_transactions(filename="transactions.json"):
-    """
-    Loads transaction data from a JSON file.
-
-    Attempts to read a JSON object from the specified 'filename'
-    (defaults to 'transactions.json') and returns the deserialized transaction
-    data as a list. Returns an empty list if the file is not found.
-    """
-    try:
-        with open(filename, "r") as file:
-            return json.load(file)
-    except FileNotFoundError:
-        return []
-
-
-def add_transaction(transactions):
+def add_transaction(transactions, filename="transactions.json"):
     """
     Prompts user for transaction details (type, category, amount) and
     adds it to the transaction list.
 
     Guides the user through the process of adding a new income or expense
     transaction. Validates user input (transaction type, category, and amount)
-    and handles errors. Saves the updated transaction list to a JSON file.
+    and handles errors. Appends the new transaction to the ledger's storage.
 
     Args:
-        transactions (list): List of existing transaction to be updated.
+        transactions (TransactionStore): Existing transactions to be updated.
+        filename (str): The ledger file the transaction is saved to.
     """
     clear()  # Clear the screen before displaying the Add Transaction Menu
-    valid_income_categories = ["Salary", "Bonus"]
-    valid_expense_categories = [
-        "Rent", "Food", "Transport", "Utilities", "Miscellanous"
-    ]
+    valid_income_categories = VALID_INCOME_CATEGORIES
+    valid_expense_categories = VALID_EXPENSE_CATEGORIES
 
     # Loop to stay in "Add transaction" menu
     while True:
@@ -162,8 +172,8 @@ def add_transaction(transactions):
 
             while True:
                 try:
-                    amount = float(input("\nEnter the amount:\n"))
-                    if amount <= 0:
+                    cents = parse_cents(input("\nEnter the amount:\n"))
+                    if cents <= 0:
                         print(
                             Back.RED + Fore.WHITE +
                             "Amount must be greater than 0." + Style.RESET_ALL
@@ -177,29 +187,40 @@ def add_transaction(transactions):
 
             # Negative value for expenses
             if transaction_type == "expense":
-                amount = -amount
+                cents = -cents
 
             # Format amount to 2 decimal places
-            formatted_amount = "{:.2f}".format(amount)
+            formatted_amount = format_cents(cents)
 
             # Append the new transaction with all fields
-            transactions.append({
+            transaction = {
                 "type": transaction_type,
                 "category": category,
                 "amount": formatted_amount,
                 "timestamp": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            })
-            save_transactions(transactions)
+            }
+            transactions.append(transaction)
+            append_transaction(transactions, transactions[-1], filename)
+            # Written out (and visible to other instances) before it is
+            # reported; only imports and scripts coalesce their writes.
+            flush_storage()
 
             # Print success message in colors with details and pause
             print(
                 Back.GREEN + Fore.WHITE +
                 f"\n{transaction_type.capitalize()} of "
-                f"${abs(float(formatted_amount)):.2f} "
+                f"${format_cents(abs(cents))} "
                 f"added successfully to category! "
                 f"'{category}'." +
                 Style.RESET_ALL
             )
+            alert = budget_alert(transactions, transaction, filename)
+            if alert is not None:
+                message, overspent = alert
+                print(
+                    (Back.RED if overspent else Back.YELLOW) + Fore.WHITE +
+                    f"\n{message}" + Style.RESET_ALL
+                )
             input("\nPress Enter to continue...")
             clear()  # Clear the screen after exiting the Add Transaction
 
@@ -214,15 +235,84 @@ def add_transaction(transactions):
             )
 
 
+def show_page(pager):
+    """
+    Prints the current page of a TransactionPager.
+
+    Args:
+        pager (TransactionPager): Cursor over the recorded transactions.
+    """
+    rows = pager.rows()
+    print(Back.GREEN + Fore.WHITE + (
+        f"\nRecorded Transactions (page {pager.page + 1} "
+        f"of {pager.page_count}):" +
+        Style.RESET_ALL
+    ))
+    for i, transaction in rows:
+        t_type = transaction["type"].capitalize()
+        print(f"{i}. {t_type}: Category: {transaction['category']} - "
+              f"${format_cents(abs(transaction.cents))}")
+
+
+def page_command(pager, command):
+    """
+    Applies a page navigation command to a TransactionPager.
+
+    Understands 'n' (next page), 'p' (previous page), 'g N' (go to page N),
+    'l' (last page), 'd DATE' (jump to the first transaction on or after
+    DATE) and 's N' (show N transactions per page). Invalid arguments are
+    reported to the user.
+
+    Returns True if 'command' was a navigation command, False otherwise.
+    """
+    parts = command.strip().lower().split()
+    if not parts or parts[0] not in ("n", "p", "g", "l", "d", "s"):
+        return False
+    action, argument = parts[0], " ".join(parts[1:])
+    try:
+        if action == "n" and not pager.next_page():
+            print(Back.BLUE + Fore.WHITE + (
+                "\nThis is the last page." + Style.RESET_ALL
+            ))
+        elif action == "p" and not pager.previous_page():
+            print(Back.BLUE + Fore.WHITE + (
+                "\nThis is the first page." + Style.RESET_ALL
+            ))
+        elif action == "l":
+            pager.last_page()
+        elif action == "g":
+            pager.go_to_page(int(argument))
+        elif action == "d":
+            if not pager.jump_to_time(period_bounds(argument)[0]):
+                print(Back.BLUE + Fore.WHITE + (
+                    f"\nNo transactions on or after {argument}." +
+                    Style.RESET_ALL
+                ))
+        elif action == "s":
+            size = int(argument)
+            if size <= 0:
+                raise ValueError(size)
+            pager.set_page_size(size)
+    except ValueError:
+        print(Back.RED + Fore.WHITE + (
+            "\nInvalid input. Use 'g 2' for page 2, 'd 2024-01-15' "
+            "for a date or 's 50' for 50 transactions per page." +
+            Style.RESET_ALL
+        ))
+    return True
+
+
 def view_transactions(transactions):
     """
-    Display all recorded transactions.
+    Display recorded transactions one page at a time.
 
-    Prints a list of all transactions in the provided 'transactions' list,
-    including transaction type, category, and amount.
+    Prints the first page of transactions in the provided 'transactions'
+    store, including transaction type, category, and amount. When there
+    is more than one page, the user can move between pages, jump to a
+    date or change the page size until they press Enter to return.
 
     Args:
-        transactions (list): List of transaction records.
+        transactions (TransactionStore): Transaction records.
     """
     if not transactions:
         print(Back.BLUE + Fore.WHITE + (
@@ -230,51 +320,86 @@ def view_transactions(transactions):
             Style.RESET_ALL
         ))
         return
-    print(Back.GREEN + Fore.WHITE + (
-        "\nRecorded Transactions:" +
-        Style.RESET_ALL
-    ))
-    for i, transaction in enumerate(transactions, 1):
-        t_type = transaction["type"].capitalize()
-        print(f"{i}. {t_type}: Category: {transaction['category']} - "
-              f"${abs(float(transaction['amount'])):.2f}")
+    pager = TransactionPager(transactions)
+    while True:
+        show_page(pager)
+        if pager.page_count == 1:
+            return
+        command = input(
+            f"\n{PAGE_HELP}\n"
+            "Press Enter to return to the main menu:\n"
+        ).strip()
+        if not command or command.lower() == "back":
+            return
+        if not page_command(pager, command):
+            print(Back.RED + Fore.WHITE + (
+                "\nInvalid input. " + PAGE_HELP + Style.RESET_ALL
+            ))
 
 
 def check_balance(transactions):
     """
     Calculate and displays the current balance.
 
-    Iterates through the provided 'transactions' list, sums the amounts
+    Sums the integer cent amounts held by the transaction store
     (considering income and expenses), and presents the total balance
-    in a visually appealing format using colorama.
+    in a visually appealing format using colorama. The result is cached
+    until the ledger changes (see cache.py).
 
     Args:
-        transactions (list): Lists of transactions to calculate
+        transactions (TransactionStore): Transactions to calculate
         the balance from.
     """
-    balance = sum(
-        float(transaction["amount"])
-        for transaction in transactions
-    )
+    balance = format_cents(report_cache.get(
+        transactions, ("balance",), lambda ledger: ledger.total_cents()
+    ))
     print(Back.GREEN + Fore.WHITE + (
         "\nCurrent Balance:" +
         Style.RESET_ALL
     ))
-    print(f"${balance:.2f}\n" + Style.RESET_ALL)
+    print(f"${balance}\n" + Style.RESET_ALL)
+
+
+def get_date_range():
+    """
+    Prompts the user for an optional date range.
+
+    Accepts a single period ('2024', '2024-01', '2024-01-15') or two
+    periods separated by 'to' (e.g. '2024-01 to 2024-03'), repeating the
+    prompt until the input is valid. Returns a (start, end) tuple of epoch
+    seconds, or (None, None) if the user pressed Enter for all dates.
+    """
+    while True:
+        text = input(
+            "\nEnter a date range, e.g. '2024-01 to 2024-03' "
+            "(or press Enter for all dates):\n"
+        ).strip().lower()
+        if not text:
+            return None, None
+        try:
+            first, _, last = text.partition(" to ")
+            start = period_bounds(first)[0]
+            end = period_bounds(last or first)[1]
+            return start, end
+        except ValueError:
+            print(Back.RED + Fore.WHITE + (
+                "\nInvalid date range. Please use YYYY, YYYY-MM or "
+                "YYYY-MM-DD, e.g. '2024-01 to 2024-03'." + Style.RESET_ALL
+            ))
 
 
 def view_transactions_by_category(transactions):
     """
     Display transactions filtered by a specific category.
 
-    This functions prompts users to enter a category and then filters the
-    provided transactions list to include only those transactions that
-    match the specified category.
+    This functions lists the categories that have transactions, prompts
+    users to enter a category and an optional date range, and looks up the
+    matching transactions through the store's category and time indexes.
     If no matching transactions are found, an appropriate message is displayed.
-    Otherwise, the filtered transactions are displayed with their details.
+    Otherwise, only the filtered transactions are displayed with their details.
 
     Args:
-        transactions (list): List of transaction dictionaries.
+        transactions (TransactionStore): Recorded transactions.
     """
     if not transactions:
         print(Back.BLUE + Fore.WHITE + (
@@ -283,26 +408,17 @@ def view_transactions_by_category(transactions):
         ))
         return
 
-    # Display all recorded transactions for context
+    # Display the recorded categories for context
     print(Back.BLUE + Fore.WHITE + (
-        "\n--- All Recorded Transactions ---\n" +
+        "\n--- Recorded Categories ---\n" +
         Style.RESET_ALL
     ))
-    for i, transaction in enumerate(transactions, 1):
-        t_type = transaction["type"].capitalize()
-        print(f"{i}. {t_type}: {transaction['category']} - "
-              f"${abs(float(transaction['amount'])):.2f} - "
-              f"Date: {transaction['timestamp']}")
+    print(", ".join(transactions.categories()))
 
     # Filter transactions by category
     while True:
         category = input("\nEnter the category to filter by:\n").strip()
-        filtered_transactions = [
-            t for t in transactions
-            if t["category"].title() == category.title()
-        ]
-
-        if not filtered_transactions:
+        if not transactions.has_category(category):
             print(
                 Back.RED + Fore.WHITE +
                 f"\nNo transactions found for category: {category}"
@@ -312,6 +428,18 @@ def view_transactions_by_category(transactions):
             )
             continue  # Stay in the loop if input is invalid
 
+        start, end = get_date_range()
+        filtered_transactions = report_cache.get(
+            transactions, ("category", category.title(), start, end),
+            lambda ledger: ledger.query(category, start, end),
+        )
+        if not filtered_transactions:
+            print(Back.BLUE + Fore.WHITE + (
+                f"\nNo transactions found for category '{category}' "
+                "in that date range." + Style.RESET_ALL
+            ))
+            break
+
         # Display filtered transactions if found
         print(
             Back.BLUE + Fore.WHITE +
@@ -320,9 +448,8 @@ def view_transactions_by_category(transactions):
             )
         for i, transaction in enumerate(filtered_transactions, 1):
             t_type = transaction["type"].capitalize()
-            amount = float(transaction["amount"])
-            # Ensure amount is a float
-            print(f"{i}. {t_type}: ${abs(amount):.2f} - "
+            amount = format_cents(abs(transaction.cents))
+            print(f"{i}. {t_type}: ${amount} - "
                   f"Date: {transaction['timestamp']}")
         break  # Exit the loop after displaying valid results
 
@@ -332,14 +459,16 @@ def generate_monthly_report(transactions):
     Generates a monthly summary of income and expenses.
 
     This function calculates and displays the total income and expenses
-    for each month recorded in the transactions history.
-    It iterates through the transactions, groups then by month
-    (YYYY-MM), and calculates the sum of amounts for each month.
+    for each month recorded in the transactions history, with the net
+    amount, the change from the previous month, the running balance and
+    the net amount per category.
+    The report is built by monthly_report() in one grouped pass over the
+    transaction store, in integer cents.
     Finally, it displays the monthly summary in a user-friendly format.
     If no transactions are recorded, the user will be notified accordingly.
 
     Args:
-        transactions list: List of transaction dictionaries.
+        transactions (TransactionStore): Recorded transactions.
     """
     if not transactions:
         print(Back.BLUE + Fore.WHITE + (
@@ -348,33 +477,42 @@ def generate_monthly_report(transactions):
         ))
         return
 
-    monthly_summary = {}
-    for transaction in transactions:
-        month = transaction["timestamp"][:7]
-        # Extract YYYY-MM
-        if month not in monthly_summary:
-            monthly_summary[month] = 0
-        monthly_summary[month] += float(transaction["amount"])
-        # Convert to float
     print(Back.GREEN + Fore.WHITE + "\nMonthly Report:")
-    for month, total in sorted(monthly_summary.items()):
-        print(f"{month}: ${total:.2f}")
+    report = report_cache.get(
+        transactions, ("monthly_report",), monthly_report
+    )
+    for summary in report:
+        change = summary["change"]
+        change = "" if change is None else (
+            f" | Change: {'+' if change > 0 else ''}${format_cents(change)}"
+        )
+        print(
+            f"{summary['month']}: ${format_cents(summary['net'])} "
+            f"(Income: ${format_cents(summary['income'])} | "
+            f"Expenses: ${format_cents(summary['expenses'])}{change} | "
+            f"Balance: ${format_cents(summary['balance'])})"
+        )
+        print("    " + ", ".join(
+            f"{category}: ${format_cents(cents)}"
+            for category, cents in summary["categories"].items()
+        ))
 
 
-def delete_transaction(transactions):
+def delete_transaction(transactions, filename="transactions.json"):
     """
     Deletes a specified transaction from the list of transactions.
 
-    This functions first displays the list of transactions to the user.
+    This functions first displays a page of transactions to the user.
     Then, it prompts the user to enter the number of the transaction
     they wish to delete.
     If a valid transaction number is provided, the corresponding
-    transaction is removed from the list.
+    transaction is deleted from the ledger by its stable id.
     The function includes input validation and error handling
     to ensure a smooth and safe deletion process.
 
     Args:
-        transactions (list): List of transaction dictionaries.
+        transactions (TransactionStore): Recorded transactions.
+        filename (str): The ledger file the deletion is saved to.
     """
     if not transactions:
         print(Back.BLUE + Fore.WHITE + (
@@ -387,18 +525,26 @@ def delete_transaction(transactions):
     Iteratively prompts user to delete transactions until valid
     input is provided.
 
-    Displays transactions and prompts user for transaction numbers to delete.
-    Continues to loop until the user enters valid input (a number or
-    comma-separated numbers).
+    Displays a page of transactions and prompts user for transaction numbers
+    to delete, or for page navigation commands. Continues to loop until the
+    user enters valid input (a number or comma-separated numbers).
     """
+    pager = TransactionPager(transactions)
+    show_page(pager)
     while True:
-        view_transactions(transactions)
         try:
             choices = input(
                 "\nEnter the number of the transaction to delete "
-                "(seperate multiple numbers with commas):\n"
+                "(seperate multiple numbers with commas)"
+                + (f".\n{PAGE_HELP}" if pager.page_count > 1 else "")
+                + ":\n"
             ).strip()
 
+            # Browse to another page without re-listing on invalid input
+            if page_command(pager, choices):
+                show_page(pager)
+                continue
+
             # Check for empty input or non-numeric values
             if not choices:
                 print(Back.RED + Fore.WHITE + (
@@ -461,7 +607,7 @@ def delete_transaction(transactions):
                 transaction = transactions[i]
                 print(f"- {transaction['type'].capitalize()} | "
                       f"Category: {transaction['category']} | "
-                      f"Amount: ${abs(float(transaction['amount'])):.2f} | "
+                      f"Amount: ${format_cents(abs(transaction.cents))} | "
                       f"Date: {transaction['timestamp']}")
 
             while True:  # Repeat until a valid confirmation is given
@@ -484,11 +630,10 @@ def delete_transaction(transactions):
                 ))
                 return
 
-            # Delete transactions in reverse order to avoid index shifting
-            for i in sorted(indices, reverse=True):
-                transactions.pop(i)
-
-            save_transactions(transactions)
+            delete_transactions(
+                transactions, [transactions[i].id for i in indices], filename
+            )
+            flush_storage()
             print(Back.GREEN + Fore.WHITE + (
                 "Selected transactions deleted successfully." +
                 Style.RESET_ALL
@@ -503,32 +648,117 @@ def delete_transaction(transactions):
             ))
 
 
-def main():
+def startup_timing(load_seconds, transactions):
+    """
+    Prints how long startup took to standard error.
+
+    Shown when the MONEY_TRACK_TIMING environment variable is set: the
+    time spent loading the ledger, and the CPU time the process had used
+    by the time the first menu appears (imports included).
+
+    Args:
+        load_seconds (float): Seconds spent in load_transactions().
+        transactions (TransactionStore): The loaded ledger.
+    """
+    print(
+        f"Startup timing: loaded {len(transactions)} transactions "
+        f"({storage.STORAGE_MODE} storage) in {load_seconds * 1000:.1f} ms, "
+        f"first menu after {time.process_time() * 1000:.1f} ms CPU",
+        file=sys.stderr,
+    )
+
+
+def main(filename=None):
     """
     Main function to run the income and expense tracker.
     Chains other functions to provide functionality.
+
+    Args:
+        filename (str): The ledger file; defaults to the ledger named by
+            the MONEY_TRACK_LEDGER environment variable, or
+            'transactions.json' (see ledgers.py).
     """
+    if filename is None:
+        filename = ledger_filename(os.environ.get("MONEY_TRACK_LEDGER"))
+        os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+    #  Initialise colorama
+    from colorama import init
+
+    init(autoreset=True)
     introduction()
-    transactions = load_transactions()
-    while True:
-        choice = get_user_choice()
-        if choice == 1:
-            add_transaction(transactions)
-        elif choice == 2:
-            view_transactions(transactions)
-        elif choice == 3:
-            check_balance(transactions)
-        elif choice == 4:
-            view_transactions_by_category(transactions)
-        elif choice == 5:
-            generate_monthly_report(transactions)
-        elif choice == 6:
-            delete_transaction(transactions)
-        elif choice == 7:
-            print("\nExiting The Money Track.\nGoodbye!\n")
-            break
+    started = time.perf_counter()
+    transactions = load_transactions(filename)
+    if os.environ.get("MONEY_TRACK_TIMING"):
+        startup_timing(time.perf_counter() - started, transactions)
+    # Catch up on recurring transactions that fell due since the last run.
+    added = run_rules(transactions, filename)
+    if added:
+        print(Back.GREEN + Fore.WHITE + (
+            f"Added {len(added)} recurring transactions.\n"
+        ))
+    try:
+        while True:
+            choice = get_user_choice()
+            if choice == 7:
+                print("\nExiting The Money Track.\nGoodbye!\n")
+                break
+            # Time each option, user input included.
+            with metrics.timer(f"menu.option_{choice}"):
+                # Pick up changes made by other instances in the meantime.
+                refresh_transactions(transactions, filename)
+                if choice == 1:
+                    add_transaction(transactions, filename)
+                elif choice == 2:
+                    view_transactions(transactions)
+                elif choice == 3:
+                    check_balance(transactions)
+                elif choice == 4:
+                    view_transactions_by_category(transactions)
+                elif choice == 5:
+                    generate_monthly_report(transactions)
+                elif choice == 6:
+                    delete_transaction(transactions, filename)
+    finally:
+        # Write out changes still waiting to be coalesced.
+        flush_storage()
+        if os.environ.get("MONEY_TRACK_TIMING"):
+            stats = report_cache.stats()
+            print(
+                f"Report cache: {stats['hits']} hits, "
+                f"{stats['misses']} misses, {stats['evictions']} evictions, "
+                f"{stats['invalidations']} invalidations",
+                file=sys.stderr,
+            )
+
+
+def run_app(args):
+    """
+    Runs a command if 'args' holds one (see cli.py), or the interactive
+    menu otherwise ('--ledger NAME' on its own opens it on that ledger).
+    Returns the exit status.
+    """
+    if len(args) == 2 and args[0] == "--ledger":
+        try:
+            filename = ledger_filename(args[1])
+        except ValueError as error:
+            print(error, file=sys.stderr)
+            return 2
+        os.makedirs(os.path.dirname(filename) or ".", exist_ok=True)
+        main(filename)
+        return 0
+    if args:
+        import cli
+        return cli.main(args)
+    main()
+    return 0
 
 
 # Run program
 if __name__ == "__main__":
-    main()
+    metrics.dump_on_exit()
+    arguments = sys.argv[1:]
+    if arguments and arguments[0].partition("=")[0] == "--profile":
+        # --profile[=FILE]: run the session under cProfile.
+        output = arguments[0].partition("=")[2] or "money_track.prof"
+        sys.exit(metrics.profile(lambda: run_app(arguments[1:]), output))
+    sys.exit(run_app(arguments))
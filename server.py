@@ -0,0 +1,316 @@
+# Money Track App - local HTTP/JSON API
+#
+# Usage: python3 run.py serve [--host 127.0.0.1] [--port 8000]
+#
+# Endpoints (JSON in and out, amounts as strings like "12.50"):
+#   GET    /balance[?at=2024-03-31]
+#   GET    /transactions?category=Food&from=2024-01&to=2024-03&limit=50
+#   POST   /transactions        {"type", "category", "amount", "timestamp"}
+#   DELETE /transactions/<id>
+#   GET    /report[?categories=1]
+
+import json
+import asyncio
+from itertools import islice
+from urllib.parse import urlsplit, parse_qs
+from storage import load_transactions, append_transactions
+from storage import delete_transactions, flush_storage, refresh_transactions
+from store import format_cents, period_bounds
+from validation import validate_transaction
+from reports import monthly_report
+from cache import ResultCache
+
+
+# Largest request body accepted, in bytes.
+MAX_BODY = 1 << 20
+
+# Transactions returned by GET /transactions when no limit is given.
+DEFAULT_LIMIT = 100
+
+REASONS = {
+    200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found",
+    405: "Method Not Allowed", 413: "Payload Too Large",
+    500: "Internal Server Error",
+}
+
+
+class ApiError(Exception):
+    """
+    An error reported to the client with an HTTP status.
+    """
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def transaction_json(row):
+    return {
+        "id": row.id,
+        "type": row["type"],
+        "category": row["category"],
+        "amount": format_cents(row.cents),
+        "timestamp": row["timestamp"],
+    }
+
+
+class LedgerServer:
+    """
+    Serves one ledger over HTTP from a single process.
+
+    The ledger is loaded once and kept in memory. Reads are answered
+    directly from it, through a ResultCache, so any number of clients can
+    read at once. Adds and deletes are queued for one writer task, which
+    applies everything waiting in the queue in order and then writes the
+    batch to storage with a single flush before answering; mutations
+    never interleave, and a reply means the change is saved.
+    """
+
+    def __init__(self, filename="transactions.json"):
+        self.filename = filename
+        self.transactions = load_transactions(filename)
+        self.cache = ResultCache()
+        self.queue = asyncio.Queue()
+        self.writer = None
+
+    # Reads
+
+    def balance(self, query):
+        if "at" in query:
+            try:
+                end = period_bounds(query["at"])[1]
+            except ValueError as error:
+                raise ApiError(400, str(error))
+            cents, count = self.transactions.totals_before(end)
+            return 200, {"balance": format_cents(cents), "count": count}
+        cents = self.cache.get(
+            self.transactions, ("balance",),
+            lambda ledger: ledger.total_cents(),
+        )
+        count = len(self.transactions)
+        return 200, {"balance": format_cents(cents), "count": count}
+
+    def list_transactions(self, query):
+        try:
+            start = end = None
+            if "from" in query:
+                start = period_bounds(query["from"])[0]
+            if "to" in query:
+                end = period_bounds(query["to"])[1]
+            limit = int(query.get("limit", DEFAULT_LIMIT))
+            offset = int(query.get("offset", 0))
+        except ValueError as error:
+            raise ApiError(400, str(error))
+        category = query.get("category")
+        if (
+            category is None and start is None and end is None
+            and self.transactions.archive is None
+        ):
+            rows = iter(self.transactions)
+        else:
+            rows = self.transactions.iter_history(category, start, end)
+        rows = islice(rows, max(offset, 0), max(offset, 0) + max(limit, 0))
+        return 200, {"transactions": [transaction_json(row) for row in rows]}
+
+    def report(self, query):
+        report = self.cache.get(
+            self.transactions, ("monthly_report",), monthly_report
+        )
+        categories = query.get("categories") not in (None, "", "0")
+        months = []
+        for summary in report:
+            month = {
+                key: summary[key] if key == "month" or summary[key] is None
+                else format_cents(summary[key])
+                for key in (
+                    "month", "income", "expenses", "net", "change", "balance"
+                )
+            }
+            if categories:
+                month["categories"] = {
+                    name: format_cents(cents)
+                    for name, cents in summary["categories"].items()
+                }
+            months.append(month)
+        return 200, {"months": months}
+
+    # Writes
+
+    def add(self, body):
+        if not isinstance(body, dict):
+            raise ApiError(400, "Expected a JSON object")
+        try:
+            transaction = validate_transaction(
+                body.get("type"), body.get("category"),
+                body.get("amount"), body.get("timestamp"),
+            )
+        except ValueError as error:
+            raise ApiError(400, str(error))
+        self.transactions.append(transaction)
+        row = self.transactions[-1]
+        append_transactions(self.transactions, [row], self.filename)
+        return 201, {"transaction": transaction_json(row)}
+
+    def delete(self, transaction_id):
+        deleted = delete_transactions(
+            self.transactions, [transaction_id], self.filename
+        )
+        if not deleted:
+            raise ApiError(404, f"No transaction with id {transaction_id}")
+        return 200, {"deleted": deleted}
+
+    async def write(self, operation, *args):
+        """
+        Queues a mutation for the writer task and waits for its result.
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((future, operation, args))
+        return await future
+
+    async def run_writer(self):
+        """
+        Applies queued mutations one at a time; each batch of mutations
+        that queued up meanwhile is saved with one flush.
+        """
+        while True:
+            batch = [await self.queue.get()]
+            while not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            refresh_transactions(self.transactions, self.filename)
+            results = []
+            for future, operation, args in batch:
+                try:
+                    results.append((future, operation(*args), None))
+                except Exception as error:
+                    results.append((future, None, error))
+            try:
+                flush_storage()
+            except Exception as error:
+                results = [(future, None, error) for future, _, _ in results]
+            for future, result, error in results:
+                if future.cancelled():
+                    continue
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+
+    # HTTP
+
+    async def dispatch(self, method, target, body):
+        url = urlsplit(target)
+        query = {
+            key: values[-1] for key, values in parse_qs(url.query).items()
+        }
+        parts = [part for part in url.path.split("/") if part]
+        if method == "GET":
+            # Pick up what other processes have saved to the ledger.
+            refresh_transactions(self.transactions, self.filename)
+        if parts == ["balance"]:
+            if method == "GET":
+                return self.balance(query)
+        elif parts == ["report"]:
+            if method == "GET":
+                return self.report(query)
+        elif parts == ["transactions"]:
+            if method == "GET":
+                return self.list_transactions(query)
+            if method == "POST":
+                return await self.write(self.add, body)
+        elif len(parts) == 2 and parts[0] == "transactions":
+            if method == "DELETE":
+                try:
+                    transaction_id = int(parts[1])
+                except ValueError:
+                    raise ApiError(404, f"No transaction with id {parts[1]}")
+                return await self.write(self.delete, transaction_id)
+        else:
+            raise ApiError(404, f"Not found: {url.path}")
+        raise ApiError(405, f"{method} is not allowed on {url.path}")
+
+    async def handle(self, reader, writer):
+        """
+        Serves the requests of one connection (HTTP/1.1, keep-alive).
+        """
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                try:
+                    method, target, _ = request_line.decode("latin-1").split()
+                    length = int(headers.get("content-length", 0))
+                    if length > MAX_BODY:
+                        raise ApiError(413, "Request body too large")
+                    data = await reader.readexactly(length) if length else b""
+                    body = json.loads(data) if data else None
+                    status, payload = await self.dispatch(
+                        method.upper(), target, body
+                    )
+                except ApiError as error:
+                    status, payload = error.status, {"error": str(error)}
+                except ValueError as error:
+                    status, payload = 400, {"error": str(error)}
+                except Exception as error:
+                    status, payload = 500, {"error": str(error)}
+                keep_alive = (
+                    headers.get("connection", "").lower() != "close"
+                    and request_line.rstrip().endswith(b"HTTP/1.1")
+                    and status not in (413, 500)
+                )
+                content = json.dumps(payload).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+                    "Content-Type: application/json\r\n"
+                    f"Content-Length: {len(content)}\r\n"
+                    f"Connection: {'keep-alive' if keep_alive else 'close'}"
+                    "\r\n\r\n".encode() + content
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host="127.0.0.1", port=8000, ready=None):
+        """
+        Runs the server until it is cancelled. 'ready', if given, is called
+        with the listening server once it accepts connections.
+        """
+        self.writer = asyncio.create_task(self.run_writer())
+        server = await asyncio.start_server(self.handle, host, port)
+        if ready is not None:
+            ready(server)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self.writer.cancel()
+            flush_storage()
+
+
+def serve(filename="transactions.json", host="127.0.0.1", port=8000):
+    """
+    Serves the ledger 'filename' on host:port until interrupted.
+    """
+    def ready(server):
+        address = server.sockets[0].getsockname()
+        print(f"Serving {filename} on http://{address[0]}:{address[1]}/",
+              flush=True)
+
+    async def main():
+        await LedgerServer(filename).serve(host, port, ready)
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,1213 @@
+# Money Track App - transaction storage
+
+import os
+import sys
+import json
+import time
+import mmap
+import struct
+import contextlib
+from array import array
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory file locks
+    fcntl = None
+from aggregates import LedgerAggregates, month_number, day_year
+from metrics import count, timed, timer
+from store import TransactionStore, TransactionRow, COLUMN_NAMES
+from store import parse_cents, parse_timestamp
+from archive import Archive, archive_directory, index_path, segment_name
+from archive import write_segment, read_segment, write_index, read_index
+from archive import segment_summary, unlisted_segments, is_archived
+from archive import load_archive, archived_aggregates, group_by_month
+
+
+# Storage mode:
+# - "journal" appends one record per change to a journal file next to the
+#   JSON snapshot and compacts it periodically (default),
+# - "json" rewrites the whole JSON file on every change,
+# - "sqlite" keeps the transactions in an SQLite database next to the
+#   JSON file (e.g. 'transactions.db').
+STORAGE_MODE = os.environ.get("MONEY_TRACK_STORAGE", "journal")
+
+# Number of journal records after which the journal is folded back into
+# the snapshot file.
+COMPACT_EVERY = 1000
+
+# Changes are written out once this many are pending, or when a change
+# is made after the oldest pending one has waited FLUSH_SECONDS (this is
+# checked per change, not by a timer). Callers that report a change to
+# the user flush it themselves (see flush_storage()); whatever is left is
+# flushed when the app exits.
+FLUSH_EVERY = 100
+FLUSH_SECONDS = 5.0
+
+# Binary snapshots start with this magic, followed by the length of a JSON
+# header (little-endian uint32), the header, and the raw column bytes.
+# A binary snapshot is a cache of the JSON snapshot, which stays the
+# ledger every storage mode reads.
+BINARY_MAGIC = b"MTLEDGR1"
+BINARY_HEADER = struct.Struct("<8sI")
+
+
+def journal_path(filename):
+    """
+    Returns the journal file path belonging to a snapshot file.
+
+    The journal lives next to the snapshot with the same name and a
+    '.journal' extension, e.g. 'transactions.json' -> 'transactions.journal'.
+    """
+    root, _ = os.path.splitext(filename)
+    return root + ".journal"
+
+
+def binary_path(filename):
+    """
+    Returns the binary snapshot cached for a JSON snapshot,
+    e.g. 'transactions.json' -> 'transactions.bin'.
+    """
+    root, _ = os.path.splitext(filename)
+    return root + ".bin"
+
+
+def aggregates_path(filename):
+    """
+    Returns the path of the aggregates file saved next to a snapshot,
+    e.g. 'transactions.json' -> 'transactions.aggregates.json'.
+    """
+    root, _ = os.path.splitext(filename)
+    return root + ".aggregates.json"
+
+
+def lock_path(filename):
+    """
+    Returns the lock file used for a ledger file,
+    e.g. 'transactions.json' -> 'transactions.lock'.
+    """
+    root, _ = os.path.splitext(filename)
+    return root + ".lock"
+
+
+@contextlib.contextmanager
+def ledger_lock(filename):
+    """
+    Holds an exclusive lock on the ledger 'filename' for the duration of
+    the block, so only one process reads or writes its files at a time.
+
+    The lock is an advisory flock() on a side file (see lock_path()) and
+    is released when the process exits, however it exits. Where flock()
+    is not available the block runs unlocked.
+    """
+    if fcntl is None:
+        yield
+        return
+    with open(lock_path(filename), "a") as file:
+        fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+
+def database_path(filename):
+    """
+    Returns the SQLite database used for a ledger file,
+    e.g. 'transactions.json' -> 'transactions.db'.
+    """
+    root, _ = os.path.splitext(filename)
+    return root + ".db"
+
+
+def sync_directory(directory):
+    """
+    Flushes a directory entry to disk, so a file just renamed into it
+    survives a crash. Not supported (and not needed) on every platform.
+    """
+    try:
+        descriptor = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(descriptor)
+    except OSError:
+        pass
+    finally:
+        os.close(descriptor)
+
+
+@contextlib.contextmanager
+def atomic_write(path, mode="w", sync=True):
+    """
+    Opens a temporary file to be renamed over 'path' once it is written.
+
+    Readers see either the old file or the complete new one, never a
+    truncated one. With 'sync' the data and the rename are flushed to disk
+    (fsync) first, so the new file survives a crash or power loss. If
+    writing fails the temporary file is removed and 'path' is left as it
+    was.
+    """
+    temporary = path + ".tmp"
+    try:
+        with open(temporary, mode) as file:
+            yield file
+            if sync:
+                file.flush()
+                os.fsync(file.fileno())
+        os.replace(temporary, path)
+    except BaseException:
+        try:
+            os.remove(temporary)
+        except OSError:
+            pass
+        raise
+    if sync:
+        sync_directory(os.path.dirname(os.path.abspath(path)))
+
+
+def save_aggregates(transactions, filename="transactions.json"):
+    """
+    Saves the running totals of 'transactions' next to its snapshot.
+
+    The file records the number of rows and the signature (size and
+    modification time, see snapshot_signature()) of the snapshot it
+    belongs to, so a stale or mismatched file is ignored on load, even
+    after an edit that leaves the snapshot the same size. Archived months
+    are not included (see TransactionStore.hot_aggregates()).
+    """
+    if getattr(transactions, "aggregates", None) is None:
+        try:
+            os.remove(aggregates_path(filename))
+        except FileNotFoundError:
+            pass
+        return
+    data = transactions.hot_aggregates().to_dict()
+    data["next_id"] = transactions.next_id
+    data["rows"] = len(transactions)
+    data["snapshot"] = snapshot_signature(filename)
+    with atomic_write(aggregates_path(filename)) as file:
+        json.dump(data, file)
+
+
+def load_aggregates(filename, rows):
+    """
+    Loads the aggregates saved for the snapshot 'filename'.
+
+    Returns None if there are none, or if they do not match the 'rows'
+    just read from the snapshot.
+    """
+    try:
+        with open(aggregates_path(filename), "r") as file:
+            data = json.load(file)
+        if (
+            data.get("rows") != len(rows)
+            or data.get("snapshot") != snapshot_signature(filename)
+        ):
+            return None
+        return LedgerAggregates.from_dict(data)
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def load_next_id(filename):
+    """
+    Returns the next transaction id saved with the snapshot 'filename'
+    (see save_aggregates()), or 1 if none was saved.
+
+    Unlike the totals this is used even when the aggregates file is out of
+    date: it only ever moves the next id forward.
+    """
+    try:
+        with open(aggregates_path(filename), "r") as file:
+            return int(json.load(file).get("next_id", 1))
+    except (OSError, ValueError, TypeError, AttributeError):
+        return 1
+
+
+def stored_aggregates(filename):
+    """
+    Returns the aggregates and next id saved for the current version of
+    the snapshot 'filename', without reading its rows, or None if none are
+    saved for it.
+
+    They are taken from the aggregates file (see save_aggregates()) or,
+    failing that, from the header of the binary snapshot.
+    """
+    try:
+        signature = snapshot_signature(filename)
+    except FileNotFoundError:
+        return LedgerAggregates(), 1
+    try:
+        with open(aggregates_path(filename), "r") as file:
+            data = json.load(file)
+        if data.get("snapshot") == signature:
+            return LedgerAggregates.from_dict(data), data["next_id"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    try:
+        with open(binary_path(filename), "rb") as file:
+            magic, length = BINARY_HEADER.unpack(
+                file.read(BINARY_HEADER.size)
+            )
+            if magic != BINARY_MAGIC:
+                return None
+            header = json.loads(file.read(length))
+        if header["source"] != signature:
+            return None
+        return (
+            LedgerAggregates.from_dict(header["aggregates"]),
+            header["next_id"],
+        )
+    except (OSError, ValueError, KeyError, TypeError, struct.error):
+        return None
+
+
+def write_snapshot(file, transactions):
+    """
+    Writes 'transactions' to an open file as an indented JSON list.
+
+    Rows are serialized one at a time, so the output matches
+    json.dump(..., indent=4) without first building a list of dictionaries
+    for the whole ledger.
+    """
+    encode = json.dumps
+    file.write("[")
+    separator = "\n    {\n"
+    for transaction in transactions:
+        fields = ",\n".join(
+            f"        {encode(key)}: {encode(transaction[key])}"
+            for key in transaction.keys()
+        )
+        file.write(separator + fields + "\n    }")
+        separator = ",\n    {\n"
+    file.write("\n]" if separator != "\n    {\n" else "]")
+
+
+def read_journal(path, offset=0):
+    """
+    Reads the records of the journal file 'path' from byte 'offset' on.
+
+    Returns the list of decoded records and the offset to continue from
+    next time. Only complete lines are read, so a record still being
+    written is picked up by the next call. Lines that cannot be decoded,
+    such as a record left partially written when the app was
+    interrupted, are skipped.
+    """
+    try:
+        with open(path, "rb") as file:
+            file.seek(offset)
+            data = file.read()
+    except FileNotFoundError:
+        return [], 0
+    end = data.rfind(b"\n") + 1
+    records = []
+    for line in data[:end].splitlines():
+        if not line.strip():
+            continue
+        try:
+            records.append(json.loads(line))
+        except ValueError:
+            continue
+    return records, offset + end
+
+
+def read_snapshot(filename):
+    """
+    Reads the JSON snapshot 'filename' into a new TransactionStore.
+
+    If the binary snapshot cached for the file (see binary_path()) is
+    current it is loaded instead, without parsing any rows. Otherwise the
+    JSON is parsed, reusing saved aggregates when they match, and the
+    binary snapshot is written for the next start. Returns an empty store
+    if the file is not found.
+    """
+    try:
+        return read_binary_snapshot(binary_path(filename), filename)
+    except (OSError, ValueError, KeyError, TypeError, struct.error):
+        pass
+    transactions = TransactionStore()
+    try:
+        with open(filename, "r") as file:
+            rows = json.load(file)
+    except FileNotFoundError:
+        return transactions
+    aggregates = load_aggregates(filename, rows) if rows else None
+    transactions.load(rows, aggregates)
+    transactions.next_id = load_next_id(filename)
+    try:
+        write_binary_snapshot(binary_path(filename), transactions, filename)
+    except OSError:
+        pass
+    return transactions
+
+
+def snapshot_signature(filename):
+    """
+    Returns the size and modification time identifying the current
+    version of 'filename'.
+    """
+    status = os.stat(filename)
+    return [status.st_size, status.st_mtime_ns]
+
+
+def file_signature(filename):
+    """
+    Like snapshot_signature(), but returns None if 'filename' does not
+    exist.
+    """
+    try:
+        return snapshot_signature(filename)
+    except FileNotFoundError:
+        return None
+
+
+def write_binary_snapshot(path, transactions, source):
+    """
+    Writes 'transactions', just saved to or read from the JSON snapshot
+    'source', to 'path' as a binary column snapshot.
+
+    The JSON header holds the row count, the next id, the type and
+    category name tables, the aggregates, the layout of each column and
+    the signature of 'source'; the columns follow as raw machine values.
+    The file is written with atomic_write(), so it is never seen half
+    written; it is not synced to disk, as it can always be rebuilt.
+    """
+    columns = transactions.columns()
+    layout = []
+    offset = 0
+    for name in COLUMN_NAMES:
+        column = columns[name]
+        size = len(column) * column.itemsize
+        layout.append([name, column.typecode, column.itemsize, offset, size])
+        offset += size
+    header = json.dumps({
+        "rows": len(columns["ids"]),
+        "next_id": columns["next_id"],
+        "ids_sorted": columns["ids_sorted"],
+        "byteorder": sys.byteorder,
+        "types": columns["type_names"],
+        "categories": columns["category_names"],
+        "aggregates": transactions.hot_aggregates().to_dict(),
+        "columns": layout,
+        "source": snapshot_signature(source),
+    }).encode("utf-8")
+    with atomic_write(path, "wb", sync=False) as file:
+        file.write(BINARY_HEADER.pack(BINARY_MAGIC, len(header)))
+        file.write(header)
+        for name in COLUMN_NAMES:
+            columns[name].tofile(file)
+
+
+def read_binary_snapshot(path, source):
+    """
+    Reads a snapshot written by write_binary_snapshot() into a new
+    TransactionStore.
+
+    The file is memory-mapped and each column is copied into its array in
+    one step, so loading costs about as much as reading the file. Raises
+    ValueError if the file is not a snapshot this build can read, is
+    incomplete, or no longer matches the JSON snapshot 'source'.
+    """
+    signature = snapshot_signature(source)
+    with open(path, "rb") as file:
+        file_size = os.fstat(file.fileno()).st_size
+        if file_size < BINARY_HEADER.size:
+            raise ValueError(f"{path} is not a binary ledger snapshot")
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            magic, length = BINARY_HEADER.unpack_from(data)
+            if magic != BINARY_MAGIC:
+                raise ValueError(f"{path} is not a binary ledger snapshot")
+            start = BINARY_HEADER.size + length
+            header = json.loads(data[BINARY_HEADER.size:start])
+            if header["source"] != signature:
+                raise ValueError(f"{path} is out of date")
+            columns = {
+                "type_names": header["types"],
+                "category_names": header["categories"],
+                "next_id": header["next_id"],
+                "ids_sorted": header["ids_sorted"],
+            }
+            with memoryview(data) as view:
+                for name, typecode, itemsize, offset, size in (
+                    header["columns"]
+                ):
+                    column = array(typecode)
+                    if column.itemsize != itemsize:
+                        raise ValueError(
+                            f"{path}: column {name!r} has {itemsize}-byte "
+                            "values, which this platform cannot read"
+                        )
+                    if (
+                        size != header["rows"] * itemsize
+                        or start + offset + size > file_size
+                    ):
+                        raise ValueError(f"{path} is incomplete")
+                    column.frombytes(
+                        view[start + offset:start + offset + size]
+                    )
+                    if header["byteorder"] != sys.byteorder:
+                        column.byteswap()
+                    columns[name] = column
+    return TransactionStore.from_columns(
+        columns, LedgerAggregates.from_dict(header["aggregates"])
+    )
+
+
+def ends_with_newline(path):
+    """
+    Returns False if the file 'path' exists, is not empty and does not end
+    with a newline, i.e. its last line was only partially written.
+    """
+    try:
+        with open(path, "rb") as file:
+            file.seek(0, os.SEEK_END)
+            if file.tell() == 0:
+                return True
+            file.seek(-1, os.SEEK_END)
+            return file.read(1) == b"\n"
+    except FileNotFoundError:
+        return True
+
+
+def replay_journal(transactions, records):
+    """
+    Applies journal records ("add" and "delete") to 'transactions'.
+
+    An "add" record whose id is already in 'transactions' is skipped: the
+    snapshot was written but the app stopped before removing the journal,
+    so the row has already been folded in.
+    """
+    for record in records:
+        op = record.get("op")
+        if op == "add":
+            transaction_id = record["transaction"].get("id")
+            if (
+                transaction_id is not None
+                and transactions.slot_of(transaction_id) is not None
+            ):
+                continue
+            transactions.append(record["transaction"])
+        elif op == "delete":
+            transactions.delete_ids(record["ids"])
+            if record["ids"]:
+                transactions.next_id = max(record["ids"]) + 1
+
+
+class JsonStorage:
+    """
+    Stores the ledger in a single JSON file, rewritten when changes are
+    flushed.
+
+    This is the interface every storage backend provides: load() returns
+    a TransactionStore, and the other methods persist changes that were
+    just made to it. Adds and deletes are coalesced: they are written out
+    together by flush(), which runs once FLUSH_EVERY changes are pending or
+    a change arrives after the oldest has waited FLUSH_SECONDS, and on
+    close(). The interactive menu flushes after every add and delete;
+    coalescing is for imports and scripts. save() writes immediately.
+
+    Several processes can share a ledger. Reads and writes hold the
+    ledger's lock (see ledger_lock()), and refresh() applies what other
+    processes have saved since this one last read or wrote the files:
+    new journal records are read from where this process stopped, and
+    only a rewritten snapshot means loading the ledger again. Pending
+    changes are rebased onto the external ones before they are written.
+    """
+
+    def __init__(self, filename="transactions.json"):
+        self.filename = filename
+        self.pending_records = []
+        self.pending_since = None
+        self.pending_transactions = None
+        self.snapshot_signature = None
+        self.journal_offset = 0
+        self.journal_records = 0
+        self._lock_depth = 0
+        self._lock_file = None
+
+    @contextlib.contextmanager
+    def locked(self):
+        """
+        Holds the ledger lock for the duration of the block. Nested uses by
+        the same backend do not lock again.
+        """
+        if self._lock_depth:
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+            return
+        with ledger_lock(self.filename):
+            self._lock_depth = 1
+            try:
+                yield
+            finally:
+                self._lock_depth = 0
+
+    def _read(self):
+        """
+        Reads the snapshot and the whole journal, remembering how far they
+        have been read, and attaches the ledger's archive. Called with the
+        lock held.
+        """
+        transactions = read_snapshot(self.filename)
+        records, self.journal_offset = read_journal(
+            journal_path(self.filename)
+        )
+        replay_journal(transactions, records)
+        transactions.attach_archive(load_archive(self.filename, transactions))
+        self.journal_records = len(records)
+        self.snapshot_signature = file_signature(self.filename)
+        return transactions
+
+    def load(self):
+        """
+        Loads the ledger from the JSON file, replaying any journal written
+        after it, so a ledger last used in journal mode loads completely.
+        """
+        self.flush()
+        with self.locked():
+            return self._read()
+
+    def refresh(self, transactions):
+        """
+        Applies changes saved by other processes to 'transactions'.
+
+        Costs two stat() calls when nothing has changed, and reads only the
+        new journal records when something has; 'transactions' is reloaded
+        in place only if another process rewrote the snapshot.
+        """
+        with self.locked():
+            self._refresh(transactions)
+
+    def _refresh(self, transactions):
+        path = journal_path(self.filename)
+        try:
+            journal_size = os.path.getsize(path)
+        except FileNotFoundError:
+            journal_size = 0
+        if (
+            file_signature(self.filename) != self.snapshot_signature
+            or journal_size < self.journal_offset
+        ):
+            current = self._read()
+            self._rebase(current, None)
+            transactions.assign(current)
+        elif journal_size > self.journal_offset:
+            records, self.journal_offset = read_journal(
+                path, self.journal_offset
+            )
+            self._rebase(transactions, records)
+            self.journal_records += len(records)
+
+    def _rebase(self, transactions, records):
+        """
+        Applies external journal 'records' to 'transactions', or with None
+        applies the pending records to a freshly read 'transactions'.
+
+        Transactions added here but not yet written may have ids another
+        process has used meanwhile, so they are renumbered past every id
+        the external changes use.
+        """
+        added = [
+            record["transaction"]["id"] for record in self.pending_records
+            if record.get("op") == "add"
+        ]
+        if records is None:
+            first_id = transactions.next_id
+            mapping = {
+                old_id: first_id + offset
+                for offset, old_id in enumerate(added)
+            }
+        else:
+            used = [0]
+            for record in records:
+                if record.get("op") == "add":
+                    used.append(record["transaction"].get("id") or 0)
+                elif record.get("op") == "delete":
+                    used.extend(record["ids"])
+            first_id = max(max(used) + 1, transactions.next_id)
+            mapping = transactions.renumber(added, first_id) if (
+                added and min(added) <= max(used)
+            ) else {}
+        for record in self.pending_records:
+            if record.get("op") == "add":
+                transaction = record["transaction"]
+                transaction["id"] = mapping.get(
+                    transaction["id"], transaction["id"]
+                )
+            elif record.get("op") == "delete":
+                record["ids"] = [
+                    mapping.get(transaction_id, transaction_id)
+                    for transaction_id in record["ids"]
+                ]
+        replay_journal(
+            transactions,
+            self.pending_records if records is None else records,
+        )
+
+    def _write_records(self, transactions, records):
+        """
+        Queues journal 'records' describing changes just made to
+        'transactions', and flushes them if enough are pending or they have
+        waited long enough.
+        """
+        if not self.pending_records:
+            self.pending_since = time.monotonic()
+        self.pending_records.extend(records)
+        self.pending_transactions = transactions
+        if (
+            len(self.pending_records) >= FLUSH_EVERY
+            or time.monotonic() - self.pending_since >= FLUSH_SECONDS
+        ):
+            self.flush()
+
+    def _clear_pending(self):
+        self.pending_records = []
+        self.pending_since = None
+        self.pending_transactions = None
+
+    def flush(self):
+        """
+        Writes out any pending changes, after applying changes other
+        processes saved in the meantime.
+        """
+        if not self.pending_records:
+            return
+        with timer("storage.flush"), self.locked():
+            self._refresh(self.pending_transactions)
+            self.save(self.pending_transactions)
+
+    def save(self, transactions):
+        """
+        Writes the full ledger to the JSON file, with its aggregates and
+        binary snapshot.
+
+        The snapshot is replaced atomically (see atomic_write()). Any
+        journal belonging to the file is folded into it, so it is removed
+        once the snapshot has been written.
+        """
+        with self.locked():
+            with atomic_write(self.filename) as file:
+                write_snapshot(file, transactions)
+                count("storage.bytes_written", file.tell())
+            save_aggregates(transactions, self.filename)
+            write_binary_snapshot(
+                binary_path(self.filename), transactions, self.filename
+            )
+            try:
+                os.remove(journal_path(self.filename))
+            except FileNotFoundError:
+                pass
+            self.snapshot_signature = file_signature(self.filename)
+            self.journal_offset = 0
+            self.journal_records = 0
+        self._clear_pending()
+
+    def append(self, transactions, new_transactions):
+        """
+        Persists 'new_transactions', which were just appended to
+        'transactions'.
+        """
+        self._write_records(transactions, [
+            {"op": "add", "transaction": dict(transaction)}
+            for transaction in new_transactions
+        ])
+
+    def delete(self, transactions, ids):
+        """
+        Deletes the transactions with the given ids and persists the
+        change. Returns the ids that were deleted.
+        """
+        deleted = transactions.delete_ids(ids)
+        if deleted:
+            self._write_records(
+                transactions, [{"op": "delete", "ids": deleted}]
+            )
+        return deleted
+
+    def summary(self):
+        """
+        Returns the ledger's aggregates without loading its rows, or None
+        if they cannot be worked out that way.
+
+        The aggregates saved with the snapshot (see stored_aggregates())
+        are brought up to date with the journal: added transactions are
+        counted in, and deleted ones taken out again if they were added
+        in the journal. Deleting a row of the snapshot itself needs its
+        amount, so then None is returned and the ledger has to be loaded.
+        The archived months are added from the archive's index (see
+        archived_aggregates()).
+        """
+        self.flush()
+        with self.locked():
+            stored = stored_aggregates(self.filename)
+            if stored is None:
+                return None
+            aggregates, next_id = stored
+            records, _ = read_journal(journal_path(self.filename))
+            archived = archived_aggregates(self.filename)
+        if archived is None:
+            return None
+        aggregates.merge(archived)
+        added = {}
+        for record in records:
+            if record.get("op") == "add":
+                transaction = record["transaction"]
+                if transaction.get("id", next_id) < next_id:
+                    # Already folded into the snapshot.
+                    continue
+                key = (
+                    month_number(transaction["timestamp"][:7]),
+                    transaction["type"], transaction["category"],
+                    parse_cents(transaction["amount"]),
+                    parse_timestamp(transaction["timestamp"]) // 86400,
+                )
+                aggregates.add(*key)
+                added[transaction.get("id")] = key
+            elif record.get("op") == "delete":
+                for transaction_id in record["ids"]:
+                    key = added.pop(transaction_id, None)
+                    if key is None:
+                        return None
+                    aggregates.remove(*key)
+        return aggregates
+
+    def finish_archiving(self, transactions):
+        """
+        Rewrites the snapshot after archived rows were deleted from
+        'transactions', so the next start reads only the months kept.
+        """
+        self.save(transactions)
+
+    def close(self):
+        self.flush()
+
+
+class JournalStorage(JsonStorage):
+    """
+    JSON snapshot plus an append-only journal of changes.
+
+    Each added transaction, and each batch of deleted ids, becomes one
+    NDJSON record, so the cost does not grow with the size of the ledger.
+    Pending records are appended together and synced to disk in one write
+    when they are flushed. Once COMPACT_EVERY records have accumulated the
+    journal is compacted into the snapshot.
+    """
+
+    def flush(self):
+        records = self.pending_records
+        if not records:
+            return
+        with timer("storage.flush"), self.locked():
+            self._refresh(self.pending_transactions)
+            if self.journal_records + len(records) >= COMPACT_EVERY:
+                self.save(self.pending_transactions)
+                return
+            path = journal_path(self.filename)
+            # Start on a fresh line if the last record was cut off.
+            prefix = "" if ends_with_newline(path) else "\n"
+            with open(path, "a") as file:
+                start = file.tell()
+                file.write(prefix)
+                file.writelines(
+                    json.dumps(record) + "\n" for record in records
+                )
+                file.flush()
+                os.fsync(file.fileno())
+                count("storage.bytes_written", file.tell() - start)
+                self.journal_offset = file.tell()
+            self.journal_records += len(records)
+        self._clear_pending()
+
+
+class SqliteStorage:
+    """
+    Stores the ledger in an SQLite database.
+
+    The table is indexed on timestamp and category and the database runs in
+    WAL mode. Adds and deletes insert or delete only the affected rows
+    inside one transaction, and on load the balance and monthly, category
+    and type totals are computed with SQL aggregates instead of a Python
+    pass over the rows. The next transaction id is kept in a 'meta' table,
+    so ids of deleted transactions are not handed out again. A ledger that
+    only exists as a JSON file is copied into the database the first time
+    it is opened.
+
+    SQLite serializes writers from several processes itself. Each write
+    starts with BEGIN IMMEDIATE and gives transactions added here new ids
+    if another process has used theirs meanwhile; refresh() reloads the
+    ledger when the database's data_version shows another connection has
+    committed.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY,
+            type TEXT NOT NULL,
+            category TEXT NOT NULL,
+            amount_cents INTEGER NOT NULL,
+            timestamp INTEGER NOT NULL,
+            month INTEGER NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS transactions_timestamp
+            ON transactions (timestamp);
+        CREATE INDEX IF NOT EXISTS transactions_category
+            ON transactions (category);
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+    """
+
+    def __init__(self, filename="transactions.json"):
+        import sqlite3
+
+        self.filename = filename
+        self.path = database_path(filename)
+        created = not os.path.exists(self.path)
+        self.connection = sqlite3.connect(self.path, timeout=30)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(self.SCHEMA)
+        self.data_version = None
+        if created and os.path.exists(filename):
+            self.save(JsonStorage(filename).load())
+
+    def _data_version(self):
+        return self.connection.execute("PRAGMA data_version").fetchone()[0]
+
+    @staticmethod
+    def _values(transaction):
+        if isinstance(transaction, TransactionRow):
+            cents = transaction.cents
+        else:
+            cents = parse_cents(transaction["amount"])
+        timestamp = transaction["timestamp"]
+        return (
+            transaction["id"],
+            transaction["type"],
+            transaction["category"],
+            cents,
+            parse_timestamp(timestamp),
+            month_number(timestamp[:7]),
+        )
+
+    def _insert(self, transactions):
+        self.connection.executemany(
+            "INSERT INTO transactions "
+            "(id, type, category, amount_cents, timestamp, month) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            map(self._values, transactions),
+        )
+
+    def _save_next_id(self, transactions):
+        self.connection.execute(
+            "INSERT INTO meta (key, value) VALUES ('next_id', ?) "
+            "ON CONFLICT (key) DO UPDATE SET "
+            "value = MAX(value, excluded.value)",
+            (transactions.next_id,),
+        )
+
+    def _claim_ids(self, transactions, new_transactions):
+        """
+        Renumbers 'new_transactions' if another process has used their
+        ids. Called inside the write transaction.
+        """
+        ids = [transaction["id"] for transaction in new_transactions]
+        if not ids:
+            return
+        used = self.connection.execute(
+            "SELECT MAX(COALESCE((SELECT MAX(id) FROM transactions), 0), "
+            "COALESCE((SELECT value - 1 FROM meta "
+            "WHERE key = 'next_id'), 0))"
+        ).fetchone()[0]
+        if min(ids) <= used:
+            transactions.renumber(ids, used + 1)
+
+    def query_aggregates(self):
+        """
+        Computes the ledger's aggregates with SQL GROUP BY queries.
+        """
+        aggregates = LedgerAggregates()
+        execute = self.connection.execute
+        aggregates.balance, aggregates.count = execute(
+            "SELECT COALESCE(SUM(amount_cents), 0), COUNT(*) "
+            "FROM transactions"
+        ).fetchone()
+        for column, table in (
+            ("month", aggregates.months),
+            ("category", aggregates.categories),
+            ("type", aggregates.types),
+        ):
+            for key, cents, count in execute(
+                f"SELECT {column}, SUM(amount_cents), COUNT(*) "
+                f"FROM transactions GROUP BY {column}"
+            ):
+                table[key] = [cents, count]
+        for month, category, cents, count in execute(
+            "SELECT month, category, SUM(amount_cents), COUNT(*) "
+            "FROM transactions GROUP BY month, category"
+        ):
+            aggregates.month_categories[(month, category)] = [cents, count]
+        # Days since 1970-01-01, rounded down for times before it too.
+        for day, cents, count in execute(
+            "SELECT (timestamp - ((timestamp % 86400) + 86400) % 86400) "
+            "/ 86400 AS day, SUM(amount_cents), COUNT(*) "
+            "FROM transactions GROUP BY day"
+        ):
+            aggregates.days[day] = [cents, count]
+            entry = aggregates.years.setdefault(day_year(day), [0, 0])
+            entry[0] += cents
+            entry[1] += count
+        return aggregates
+
+    def load(self):
+        transactions = TransactionStore()
+        cursor = self.connection.execute(
+            "SELECT id, type, category, amount_cents, timestamp "
+            "FROM transactions ORDER BY id"
+        )
+        transactions.load_values(cursor, self.query_aggregates())
+        row = self.connection.execute(
+            "SELECT value FROM meta WHERE key = 'next_id'"
+        ).fetchone()
+        if row:
+            transactions.next_id = row[0]
+        transactions.attach_archive(load_archive(self.filename, transactions))
+        self.data_version = self._data_version()
+        return transactions
+
+    def summary(self):
+        """
+        Returns the ledger's aggregates, computed by SQL without loading
+        the rows, with the archived months from the archive's index; None
+        if the archive needs the ledger loaded (see archived_aggregates()).
+        """
+        archived = archived_aggregates(self.filename)
+        if archived is None:
+            return None
+        aggregates = self.query_aggregates()
+        aggregates.merge(archived)
+        return aggregates
+
+    def locked(self):
+        """
+        Holds the ledger lock for the duration of the block. SQLite locks
+        its own writes; this keeps two archiving runs (see
+        archive_transactions()) apart.
+        """
+        return ledger_lock(self.filename)
+
+    def finish_archiving(self, transactions):
+        # The deleted rows are already gone from the database.
+        pass
+
+    def refresh(self, transactions):
+        """
+        Reloads 'transactions' in place if another process has committed
+        changes since it was loaded.
+        """
+        if self._data_version() != self.data_version:
+            transactions.assign(self.load())
+
+    def save(self, transactions):
+        with self.connection:
+            self.connection.execute("BEGIN IMMEDIATE")
+            self.connection.execute("DELETE FROM transactions")
+            self._insert(transactions)
+            self._save_next_id(transactions)
+
+    def append(self, transactions, new_transactions):
+        with self.connection:
+            self.connection.execute("BEGIN IMMEDIATE")
+            self._claim_ids(transactions, new_transactions)
+            self._insert(new_transactions)
+            self._save_next_id(transactions)
+
+    def delete(self, transactions, ids):
+        deleted = transactions.delete_ids(ids)
+        with self.connection:
+            self.connection.execute("BEGIN IMMEDIATE")
+            self.connection.executemany(
+                "DELETE FROM transactions WHERE id = ?",
+                [(transaction_id,) for transaction_id in deleted],
+            )
+            self._save_next_id(transactions)
+        return deleted
+
+    def flush(self):
+        # Every change is committed in its own SQLite transaction.
+        pass
+
+    def close(self):
+        self.connection.close()
+
+
+BACKENDS = {
+    "json": JsonStorage,
+    "journal": JournalStorage,
+    "sqlite": SqliteStorage,
+}
+
+# Open storage backends, keyed by (mode, filename).
+_storages = {}
+
+
+def get_storage(filename="transactions.json", mode=None):
+    """
+    Returns the storage backend for 'filename'.
+
+    'mode' defaults to STORAGE_MODE. Backends are created once per file
+    and mode and reused afterwards.
+    """
+    mode = mode or STORAGE_MODE
+    if mode not in BACKENDS:
+        raise ValueError(
+            f"Unknown storage mode {mode!r}: "
+            f"expected one of {', '.join(BACKENDS)}"
+        )
+    key = (mode, filename)
+    if key not in _storages:
+        _storages[key] = BACKENDS[mode](filename)
+    return _storages[key]
+
+
+def flush_storage():
+    """
+    Writes out the pending changes of every open storage backend.
+    """
+    for backend in _storages.values():
+        backend.flush()
+
+
+def refresh_transactions(transactions, filename="transactions.json"):
+    """
+    Applies changes other processes have saved to the ledger 'filename'
+    since 'transactions' was loaded or last written.
+
+    Cheap when nothing has changed, so it can be called before every
+    operation.
+    """
+    get_storage(filename).refresh(transactions)
+
+
+@timed("storage.save")
+def save_transactions(transactions, filename="transactions.json"):
+    """
+    Saves transaction data to the ledger's storage.
+
+    Writes the complete 'transactions' ledger to the storage backend
+    selected by STORAGE_MODE for 'filename' (defaults to
+    'transactions.json').
+    """
+    get_storage(filename).save(transactions)
+
+
+@timed("storage.load")
+def load_transactions(filename="transactions.json"):
+    """
+    Loads transaction data from the ledger's storage.
+
+    Reads the ledger for 'filename' (defaults to 'transactions.json') from
+    the storage backend selected by STORAGE_MODE and returns it as a
+    TransactionStore. Returns an empty store if nothing has been saved.
+    """
+    transactions = get_storage(filename).load()
+    count("storage.rows_loaded", len(transactions))
+    return transactions
+
+
+@timed("storage.append")
+def append_transaction(
+    transactions, transaction, filename="transactions.json"
+):
+    """
+    Persists a single transaction that was just added to 'transactions'.
+
+    Args:
+        transactions (TransactionStore): All transactions, including the
+            new one.
+        transaction (dict): The transaction that was added.
+        filename (str): The ledger file.
+    """
+    get_storage(filename).append(transactions, [transaction])
+
+
+@timed("storage.append")
+def append_transactions(
+    transactions, new_transactions, filename="transactions.json"
+):
+    """
+    Persists a batch of transactions just appended to 'transactions' in
+    one write.
+    """
+    get_storage(filename).append(transactions, new_transactions)
+
+
+@timed("storage.delete")
+def delete_transactions(transactions, ids, filename="transactions.json"):
+    """
+    Deletes the transactions with the given ids from 'transactions' and
+    from the ledger's storage. Returns the ids that were deleted.
+    """
+    return get_storage(filename).delete(transactions, ids)
+
+
+@timed("storage.archive")
+def archive_transactions(transactions, before, filename="transactions.json"):
+    """
+    Moves the transactions before 'before' (epoch seconds, normally the
+    start of a month) out of the ledger into its archive (see archive.py).
+
+    Each month becomes a compressed segment file that is never changed
+    again, and its summary goes into the archive's index. The rows are
+    then deleted from the ledger, whose snapshot is rewritten without
+    them, and last the index is written: a run that stops before that
+    leaves segments the index does not list, which load_archive() counts
+    only once their rows are gone from the ledger, and which the next
+    run adds to the index or removes. The ledger lock is held
+    throughout. Returns the summaries of the segments written.
+    """
+    storage = get_storage(filename)
+    directory = archive_directory(filename)
+    with storage.locked():
+        storage.refresh(transactions)
+        segments = read_index(filename)
+        unlisted = unlisted_segments(filename, segments)
+        for name in unlisted:
+            path = os.path.join(directory, name)
+            rows = list(read_segment(path))
+            if is_archived(transactions, rows):
+                segments.append(segment_summary(name, rows))
+            else:
+                os.remove(path)
+        months = group_by_month(
+            (row.id, row["type"], row["category"], row.cents, row.epoch)
+            for row in transactions.iter_query(end=before)
+        )
+        if not months and not unlisted:
+            return []
+        os.makedirs(directory, exist_ok=True)
+        used = {segment["file"] for segment in segments}
+        written = []
+        for month, rows in sorted(months.items()):
+            name = segment_name(month, used)
+            used.add(name)
+            with atomic_write(os.path.join(directory, name), "wb") as file:
+                write_segment(file, rows)
+            written.append(segment_summary(name, rows))
+        if written:
+            storage.delete(transactions, [
+                row[0] for rows in months.values() for row in rows
+            ])
+            storage.finish_archiving(transactions)
+        segments.extend(written)
+        with atomic_write(index_path(filename)) as file:
+            write_index(file, segments)
+        transactions.attach_archive(Archive(directory, segments))
+    count("storage.rows_archived", sum(
+        segment["rows"] for segment in written
+    ))
+    return written
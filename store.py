@@ -0,0 +1,885 @@
+# Money Track App - in-memory transaction store
+
+import heapq
+from array import array
+from operator import attrgetter
+from itertools import compress
+from bisect import bisect_left
+from datetime import datetime, timezone
+from aggregates import LedgerAggregates, day_year
+from numeric import sum_cents, group_sums, day_numbers
+from metrics import count
+
+
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S"
+FIELDS = ("id", "type", "category", "amount", "timestamp")
+
+# Names of the columns returned by TransactionStore.columns().
+COLUMN_NAMES = ("ids", "amounts", "times", "months", "types", "categories")
+
+# Largest amount, in cents, that fits the int64 amounts column.
+MAX_CENTS = 2 ** 63 - 1
+
+# Share of tombstoned rows at which the store compacts its columns.
+TOMBSTONE_RATIO = 0.25
+
+_EPOCH_ORDINAL = datetime(1970, 1, 1).toordinal()
+
+
+def parse_cents(amount):
+    """
+    Converts an amount ('-12.50', 12.5, ...) to integer cents, exactly.
+
+    Amounts are read as decimals, never through a float, so '0.29' is 29
+    cents however large the totals built from it grow. Anything finer
+    than a cent is rounded half away from zero. Raises ValueError if the
+    amount is not a finite number or does not fit the amounts column.
+    """
+    if isinstance(amount, int) and not isinstance(amount, bool):
+        return check_cents(amount * 100, amount)
+    text = str(amount).strip()
+    whole, _, part = text.partition(".")
+    digits = whole.lstrip("+-")
+    if (
+        digits.isdigit() and len(whole) - len(digits) <= 1
+        and len(part) <= 2 and (not part or part.isdigit())
+    ):
+        # The common 'D+.DD' form, without going through Decimal.
+        cents = int(digits) * 100 + int(part.ljust(2, "0") or 0)
+        return check_cents(-cents if whole.startswith("-") else cents, amount)
+    from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+    try:
+        value = Decimal(text)
+        if not value.is_finite():
+            raise ValueError(f"Invalid amount {amount!r}: not a number")
+        # Checked before scaling: quantize() cannot hold '1e30' in cents.
+        if abs(value) > MAX_CENTS:
+            return check_cents(MAX_CENTS + 1, amount)
+        cents = (value * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP)
+    except InvalidOperation:
+        raise ValueError(f"Invalid amount {amount!r}: not a number")
+    return check_cents(int(cents), amount)
+
+
+def check_cents(cents, amount):
+    """
+    Returns 'cents' if it fits the int64 amounts column, otherwise raises
+    ValueError naming the original 'amount'.
+    """
+    if -MAX_CENTS <= cents <= MAX_CENTS:
+        return cents
+    raise ValueError(f"Invalid amount {amount!r}: too large")
+
+
+def format_cents(cents):
+    """
+    Formats integer cents the way amounts are stored, e.g. -1250 -> '-12.50'.
+    """
+    sign = "-" if cents < 0 else ""
+    whole, part = divmod(abs(cents), 100)
+    return f"{sign}{whole}.{part:02d}"
+
+
+def parse_timestamp(timestamp):
+    """
+    Converts a 'YYYY-MM-DD HH:MM:SS' timestamp to epoch seconds.
+
+    Timestamps are naive local times; they are treated as UTC so that
+    converting back with format_timestamp() gives the same text.
+    """
+    days = datetime(
+        int(timestamp[0:4]), int(timestamp[5:7]), int(timestamp[8:10])
+    ).toordinal() - _EPOCH_ORDINAL
+    return (
+        days * 86400
+        + int(timestamp[11:13]) * 3600
+        + int(timestamp[14:16]) * 60
+        + int(timestamp[17:19])
+    )
+
+
+def format_timestamp(seconds):
+    """
+    Formats epoch seconds as a 'YYYY-MM-DD HH:MM:SS' timestamp.
+    """
+    moment = datetime.fromtimestamp(seconds, timezone.utc)
+    return moment.strftime(TIMESTAMP_FORMAT)
+
+
+def period_bounds(text):
+    """
+    Returns the (start, end) epoch seconds covered by a date string.
+
+    Accepts 'YYYY', 'YYYY-MM' or 'YYYY-MM-DD'; 'end' is the first second
+    after the period. Raises ValueError for anything else.
+    """
+    parts = [int(part) for part in text.strip().split("-")]
+    if not 1 <= len(parts) <= 3 or len(text.strip().split("-")[0]) != 4:
+        raise ValueError(f"Invalid date: {text!r}")
+    year, month, day = (parts + [1, 1])[:3]
+    start = datetime(year, month, day)
+    if len(parts) == 1:
+        end = datetime(year + 1, 1, 1)
+    elif len(parts) == 2:
+        end = datetime(year + month // 12, month % 12 + 1, 1)
+    else:
+        end = datetime.fromordinal(start.toordinal() + 1)
+    return (
+        (start.toordinal() - _EPOCH_ORDINAL) * 86400,
+        (end.toordinal() - _EPOCH_ORDINAL) * 86400,
+    )
+
+
+class TransactionRow:
+    """
+    Read-only view of one transaction in a TransactionStore.
+
+    Behaves like the transaction dictionaries the app used to keep in a
+    list: row["amount"], row["timestamp"] etc. return the same strings, and
+    dict(row) gives a plain dictionary for saving. A view refers to a
+    physical slot in the store, so it stays valid when other rows are
+    deleted, until the store is next compacted.
+    """
+
+    __slots__ = ("_store", "_slot")
+
+    def __init__(self, store, slot):
+        self._store = store
+        self._slot = slot
+
+    def __getitem__(self, key):
+        store = self._store
+        i = self._slot
+        if key == "id":
+            return store._ids[i]
+        if key == "type":
+            return store._type_names[store._types[i]]
+        if key == "category":
+            return store._category_names[store._categories[i]]
+        if key == "amount":
+            return format_cents(store._amounts[i])
+        if key == "timestamp":
+            return format_timestamp(store._times[i])
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return FIELDS
+
+    def __iter__(self):
+        return iter(FIELDS)
+
+    def __len__(self):
+        return len(FIELDS)
+
+    @property
+    def id(self):
+        """Stable transaction id."""
+        return self._store._ids[self._slot]
+
+    @property
+    def cents(self):
+        """Amount in integer cents (negative for expenses)."""
+        return self._store._amounts[self._slot]
+
+    @property
+    def epoch(self):
+        """Timestamp in epoch seconds."""
+        return self._store._times[self._slot]
+
+    def to_dict(self):
+        return {key: self[key] for key in FIELDS}
+
+    def __eq__(self, other):
+        if isinstance(other, (TransactionRow, dict)):
+            return self.to_dict() == dict(other)
+        return NotImplemented
+
+    def __repr__(self):
+        return f"TransactionRow({self.to_dict()!r})"
+
+
+class TransactionStore:
+    """
+    Compact, column-based store for the transaction ledger.
+
+    Each field is held in a typed array instead of one dictionary per
+    transaction: amounts as integer cents, timestamps as epoch seconds and
+    the month they fall in, and type/category as small codes into interned
+    name tables. The store supports the list operations the app uses
+    (len, indexing, iteration, append, pop, del), handing out
+    TransactionRow views, so existing code keeps working while sums and
+    groupings read the integer columns directly. Balance and per-month,
+    per-category and per-type totals are kept in 'aggregates' and updated
+    as transactions are appended or deleted.
+
+    Every transaction has a stable integer id, assigned in increasing order
+    on append unless the transaction already has one. Deleting marks rows
+    as tombstones instead of shifting the columns; once tombstones make up
+    TOMBSTONE_RATIO of the slots the columns are compacted in one pass, so
+    deleting k rows costs O(k log n) amortized. Positions (as used by
+    len() and indexing) only count live rows.
+
+    Two secondary indexes answer filtered views without a scan: one
+    time-sorted (times, slots) pair per category and one for the whole
+    ledger. Appends in time order extend them in O(1), queries skip
+    tombstones, and an out-of-order append or a compaction makes the next
+    query rebuild them with one sort.
+
+    'version' goes up on every change (append, delete, renumbering,
+    compaction or reload), so results computed from the store can be
+    cached until it moves (see cache.py).
+
+    Months moved to the ledger's archive (see archive.py) are not rows of
+    the store; once the archive is attached its totals are part of the
+    aggregates and the monthly breakdown, and iter_history() lists its
+    rows along with the store's.
+    """
+
+    def __init__(self, transactions=()):
+        self._ids = array("q")
+        self._amounts = array("q")
+        self._times = array("q")
+        self._months = array("i")
+        self._types = array("B")
+        self._categories = array("H")
+        self._type_names = []
+        self._type_codes = {}
+        self._category_names = []
+        self._category_codes = {}
+        self.version = 0
+        self._reset_state()
+        self.extend(transactions)
+
+    def _reset_state(self):
+        self.version += 1
+        self._live = bytearray()
+        self._dead = 0
+        self._positions = None
+        self._next_id = 1
+        self._ids_sorted = True
+        self._slot_by_id = None
+        self.aggregates = LedgerAggregates()
+        self._by_time = (array("q"), array("l"))
+        self._by_category = {}
+        self._indexed = True
+        self.archive = None
+
+    @staticmethod
+    def _intern(names, codes, value):
+        code = codes.get(value)
+        if code is None:
+            code = codes[value] = len(names)
+            names.append(value)
+        return code
+
+    def _columns(self):
+        return (
+            self._ids, self._amounts, self._times, self._months,
+            self._types, self._categories
+        )
+
+    def __len__(self):
+        return len(self._ids) - self._dead
+
+    @property
+    def next_id(self):
+        """
+        The id the next appended transaction gets. Ids of deleted
+        transactions are never handed out again, so storage backends save
+        this and restore it on load; it can only be moved forward.
+        """
+        return self._next_id
+
+    @next_id.setter
+    def next_id(self, value):
+        self._next_id = max(self._next_id, value)
+
+    def _live_positions(self):
+        # Slots of the live rows, by position; only used with tombstones.
+        if self._positions is None:
+            self._positions = array(
+                "l", compress(range(len(self._live)), self._live)
+            )
+        return self._positions
+
+    def _slot(self, position):
+        if not self._dead:
+            return position
+        return self._live_positions()[position]
+
+    def _live_slots(self):
+        if not self._dead:
+            return range(len(self._ids))
+        return compress(range(len(self._live)), self._live)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [
+                TransactionRow(self, self._slot(i))
+                for i in range(*index.indices(len(self)))
+            ]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("transaction index out of range")
+        return TransactionRow(self, self._slot(index))
+
+    def __iter__(self):
+        for slot in self._live_slots():
+            yield TransactionRow(self, slot)
+
+    def __delitem__(self, index):
+        self.pop(index)
+
+    def __repr__(self):
+        return f"TransactionStore({len(self)} transactions)"
+
+    def _append_values(
+        self, t_type, category, cents, seconds, transaction_id=None
+    ):
+        # Every value is worked out and range-checked before any column is
+        # touched, so a bad row raises without leaving the columns with
+        # different lengths.
+        if transaction_id is None:
+            transaction_id = self._next_id
+        else:
+            transaction_id = int(transaction_id)
+        if not 0 < transaction_id <= MAX_CENTS:
+            raise ValueError(f"Invalid transaction id {transaction_id!r}")
+        check_cents(cents, format_cents(cents))
+        day = seconds // 86400
+        moment = datetime.fromordinal(day + _EPOCH_ORDINAL)
+        type_code = self._intern(self._type_names, self._type_codes, t_type)
+        category_code = self._intern(
+            self._category_names, self._category_codes, category
+        )
+
+        if self._ids and transaction_id <= self._ids[-1]:
+            self._ids_sorted = False
+        self._next_id = max(self._next_id, transaction_id + 1)
+        slot = len(self._ids)
+        if self._slot_by_id is not None:
+            self._slot_by_id[transaction_id] = slot
+        if self._positions is not None:
+            self._positions.append(slot)
+        self._ids.append(transaction_id)
+        self._amounts.append(cents)
+        self._times.append(seconds)
+        self._months.append(moment.year * 12 + moment.month - 1)
+        self._types.append(type_code)
+        self._categories.append(category_code)
+        self._live.append(1)
+        self.version += 1
+        if self._indexed:
+            times = self._by_time[0]
+            if not times or seconds >= times[-1]:
+                self._index_row(slot)
+            else:
+                self._indexed = False
+
+    def _append_row(self, transaction):
+        self._append_values(
+            transaction["type"], transaction["category"],
+            parse_cents(transaction["amount"]),
+            parse_timestamp(transaction["timestamp"]),
+            transaction.get("id"),
+        )
+
+    def _index_row(self, slot):
+        seconds = self._times[slot]
+        code = self._categories[slot]
+        pair = self._by_category.get(code)
+        if pair is None:
+            pair = self._by_category[code] = (array("q"), array("l"))
+        for times, slots in (pair, self._by_time):
+            times.append(seconds)
+            slots.append(slot)
+
+    def _ensure_indexes(self):
+        if self._indexed:
+            return
+        self._by_time = (array("q"), array("l"))
+        self._by_category = {}
+        for slot in sorted(self._live_slots(), key=self._times.__getitem__):
+            self._index_row(slot)
+        self._indexed = True
+
+    def _row_key(self, slot):
+        return (
+            self._months[slot],
+            self._type_names[self._types[slot]],
+            self._category_names[self._categories[slot]],
+            self._amounts[slot],
+            self._times[slot] // 86400,
+        )
+
+    def append(self, transaction):
+        """
+        Adds a transaction given as a dictionary (or TransactionRow).
+
+        The transaction keeps its "id" if it has one, otherwise it is given
+        the next free id.
+        """
+        self._append_row(transaction)
+        self.aggregates.add(*self._row_key(len(self._ids) - 1))
+
+    def append_values(
+        self, t_type, category, cents, seconds, transaction_id=None
+    ):
+        """
+        Adds a transaction from already typed values: amount in integer
+        cents and timestamp in epoch seconds.
+        """
+        self._append_values(t_type, category, cents, seconds, transaction_id)
+        self.aggregates.add(*self._row_key(len(self._ids) - 1))
+
+    def extend(self, transactions):
+        for transaction in transactions:
+            self.append(transaction)
+
+    def load(self, transactions, aggregates=None):
+        """
+        Bulk-loads saved transactions.
+
+        The per-row aggregate updates are skipped: the totals are taken
+        from 'aggregates' when they were persisted alongside the data, and
+        otherwise computed from the columns in one pass afterwards.
+        """
+        for transaction in transactions:
+            self._append_row(transaction)
+        if aggregates is None:
+            self.recompute_aggregates()
+        else:
+            self.aggregates = aggregates
+
+    def load_values(self, values, aggregates):
+        """
+        Like load(), but for (id, type, category, cents, seconds) tuples.
+        """
+        for transaction_id, t_type, category, cents, seconds in values:
+            self._append_values(
+                t_type, category, cents, seconds, transaction_id
+            )
+        self.aggregates = aggregates
+
+    def slot_of(self, transaction_id):
+        """
+        Returns the slot holding 'transaction_id', or None.
+
+        Ids are normally in increasing order, so this is a binary search;
+        otherwise an id -> slot map is built once and kept up to date.
+        """
+        if self._ids_sorted:
+            slot = bisect_left(self._ids, transaction_id)
+            if slot < len(self._ids) and self._ids[slot] == transaction_id:
+                return slot
+            return None
+        if self._slot_by_id is None:
+            self._slot_by_id = {
+                transaction_id: slot
+                for slot, transaction_id in enumerate(self._ids)
+            }
+        return self._slot_by_id.get(transaction_id)
+
+    def get_by_id(self, transaction_id):
+        """
+        Returns the live row with 'transaction_id', or None.
+        """
+        slot = self.slot_of(transaction_id)
+        if slot is None or not self._live[slot]:
+            return None
+        return TransactionRow(self, slot)
+
+    def delete_ids(self, transaction_ids):
+        """
+        Deletes the transactions with the given ids.
+
+        Each row is tombstoned and its amount removed from the aggregates;
+        the columns are compacted once enough tombstones have built up.
+        Unknown or already deleted ids are ignored. Returns the list of ids
+        that were deleted.
+        """
+        deleted = []
+        for transaction_id in transaction_ids:
+            slot = self.slot_of(transaction_id)
+            if slot is None or not self._live[slot]:
+                continue
+            self._live[slot] = 0
+            self._dead += 1
+            self.aggregates.remove(*self._row_key(slot))
+            deleted.append(transaction_id)
+        if deleted:
+            self.version += 1
+            self._positions = None
+            if self._dead >= TOMBSTONE_RATIO * len(self._ids):
+                self.compact()
+        return deleted
+
+    def renumber(self, transaction_ids, first_id):
+        """
+        Gives the transactions with the given ids new consecutive ids
+        starting at 'first_id', in the order given.
+
+        Used when another process has used the same ids for its own
+        transactions in the meantime. Ids no longer in the store are still
+        mapped. Returns a dictionary mapping each old id to its new one.
+        """
+        mapping = {
+            old_id: first_id + offset
+            for offset, old_id in enumerate(transaction_ids)
+        }
+        slots = [(self.slot_of(old_id), old_id) for old_id in mapping]
+        last = len(self._ids) - 1
+        for slot, old_id in reversed(slots):
+            if slot is None:
+                # Deleted and compacted away already.
+                continue
+            new_id = mapping[old_id]
+            self._ids[slot] = new_id
+            if self._ids_sorted and not (
+                (slot == 0 or self._ids[slot - 1] < new_id)
+                and (slot == last or new_id < self._ids[slot + 1])
+            ):
+                self._ids_sorted = False
+        self._slot_by_id = None
+        self._next_id = max(self._next_id, first_id + len(mapping))
+        self.version += 1
+        return mapping
+
+    def assign(self, other):
+        """
+        Replaces the contents of this store with those of 'other', which
+        must not be used afterwards. Row views handed out earlier must not
+        be used either.
+        """
+        version = max(self.version, other.version) + 1
+        vars(self).update(vars(other))
+        self.version = version
+
+    def compact(self):
+        """
+        Drops tombstoned rows from the columns.
+
+        Row views handed out earlier refer to old slots and must not be
+        used afterwards.
+        """
+        if not self._dead:
+            return
+        live = self._live
+        for column in self._columns():
+            column[:] = array(column.typecode, compress(column, live))
+        self._live = bytearray(b"\x01") * len(self._ids)
+        self._dead = 0
+        self._positions = None
+        self._slot_by_id = None
+        self._indexed = False
+        self.version += 1
+
+    def columns(self):
+        """
+        Returns the live rows as fixed-width columns.
+
+        Gives a dictionary of arrays ("ids", "amounts", "times", "months",
+        "types", "categories") without tombstoned rows, plus the name
+        tables the "types" and "categories" codes refer to, the next id to
+        assign and whether the ids are ascending. Used to write binary
+        snapshots.
+        """
+        arrays = self._columns()
+        if self._dead:
+            arrays = [
+                array(column.typecode, compress(column, self._live))
+                for column in arrays
+            ]
+        columns = dict(zip(COLUMN_NAMES, arrays))
+        columns["type_names"] = list(self._type_names)
+        columns["category_names"] = list(self._category_names)
+        columns["next_id"] = self._next_id
+        columns["ids_sorted"] = self._ids_sorted
+        return columns
+
+    @classmethod
+    def from_columns(cls, columns, aggregates):
+        """
+        Creates a store directly from columns returned by columns().
+
+        Nothing is parsed row by row: the arrays are used as they are, the
+        aggregates are taken as given and the indexes are built on the
+        first query.
+        """
+        store = cls()
+        for name, column in zip(COLUMN_NAMES, store._columns()):
+            column[:] = columns[name]
+        store._type_names = list(columns["type_names"])
+        store._type_codes = {
+            name: code for code, name in enumerate(store._type_names)
+        }
+        store._category_names = list(columns["category_names"])
+        store._category_codes = {
+            name: code for code, name in enumerate(store._category_names)
+        }
+        ids = store._ids
+        store._live = bytearray(b"\x01") * len(ids)
+        store._ids_sorted = columns["ids_sorted"]
+        store._next_id = columns["next_id"]
+        store.aggregates = aggregates
+        store._indexed = not ids
+        return store
+
+    def pop(self, index=-1):
+        """
+        Removes the transaction at 'index' and returns it as a dictionary.
+        """
+        row = self[index]
+        removed = row.to_dict()
+        self.delete_ids([row.id])
+        return removed
+
+    def clear(self):
+        next_id = self._next_id
+        for column in self._columns():
+            del column[:]
+        self._reset_state()
+        self._next_id = next_id
+
+    def to_dicts(self):
+        """
+        Yields every transaction as a plain dictionary.
+        """
+        for row in self:
+            yield row.to_dict()
+
+    def total_cents(self):
+        """
+        Sum of all amounts in cents.
+        """
+        return self.aggregates.balance
+
+    def monthly_totals(self):
+        """
+        Net amount in cents per month, keyed by 'YYYY-MM'.
+        """
+        return self.aggregates.monthly_totals()
+
+    def attach_archive(self, archive):
+        """
+        Counts the archived months of 'archive' (an archive.Archive, or
+        None) in the aggregates, in place of any archive attached before.
+        """
+        if self.archive is not None:
+            self.aggregates.merge(self.archive.aggregates, -1)
+        self.archive = archive
+        if archive is not None:
+            self.aggregates.merge(archive.aggregates)
+            self.next_id = archive.next_id
+        self.version += 1
+
+    def hot_aggregates(self):
+        """
+        Returns the aggregates of the store's own rows, without the
+        archive's totals; this is what storage backends save.
+        """
+        if self.archive is None:
+            return self.aggregates
+        aggregates = LedgerAggregates.from_dict(self.aggregates.to_dict())
+        aggregates.merge(self.archive.aggregates, -1)
+        return aggregates
+
+    def totals_before(self, seconds):
+        """
+        Returns the total (cents, count) of the transactions before
+        'seconds' (epoch), e.g. the balance at that moment.
+
+        Whole days come from the aggregates' cumulative daily totals (see
+        LedgerAggregates.before()), in O(log d) for a ledger spanning d
+        days; only the rows earlier on the day of 'seconds' itself are
+        read, through the time index (and the archive's segment for that
+        day, if it is archived).
+        """
+        day, into_day = divmod(seconds, 86400)
+        cents, rows = self.aggregates.before(day)
+        if into_day:
+            for row in self.iter_history(
+                start=seconds - into_day, end=seconds
+            ):
+                cents += row.cents
+                rows += 1
+        return cents, rows
+
+    def range_totals(self, start=None, end=None):
+        """
+        Returns the total (cents, count) of the transactions in a
+        [start, end) range of epoch seconds; None leaves that end open.
+        """
+        if end is None:
+            cents, rows = self.aggregates.balance, self.aggregates.count
+        else:
+            cents, rows = self.totals_before(end)
+        if start is not None:
+            before = self.totals_before(start)
+            cents, rows = cents - before[0], rows - before[1]
+        return cents, rows
+
+    def monthly_breakdown(self):
+        """
+        Totals per month, type and category, computed from the columns.
+
+        Returns a dictionary mapping (month number, type, category) to
+        [total cents, transaction count]. The rows are grouped in one
+        pass over the columns with group_sums() (with NumPy when it is
+        installed); the totals of archived months come from the archive's
+        summaries.
+        """
+        live = self._live if self._dead else None
+        count("rows_scanned", len(self._ids))
+        groups = group_sums(
+            (self._months, self._types, self._categories),
+            self._amounts, live,
+        )
+        types = self._type_names
+        categories = self._category_names
+        breakdown = {
+            (month, types[t_type], categories[category]): entry
+            for (month, t_type, category), entry in groups.items()
+        }
+        if self.archive is not None:
+            for key, (cents, rows) in self.archive.breakdown.items():
+                entry = breakdown.setdefault(key, [0, 0])
+                entry[0] += cents
+                entry[1] += rows
+        return breakdown
+
+    def recompute_aggregates(self):
+        """
+        Rebuilds the aggregates from the stored columns.
+
+        The amounts column is summed and grouped by month, type, category
+        code, (month, category code) and day with sum_cents() and
+        group_sums(), which work on the whole column at once (with NumPy
+        when it is installed), then the codes are turned back into names;
+        the yearly totals are summed from the daily ones. The totals of an
+        attached archive are added back.
+        """
+        aggregates = LedgerAggregates()
+        live = self._live if self._dead else None
+        count("rows_scanned", len(self._ids))
+        aggregates.balance = sum_cents(self._amounts, live)
+        aggregates.count = len(self)
+        for table, keys, names in (
+            (aggregates.months, self._months, None),
+            (aggregates.types, self._types, self._type_names),
+            (aggregates.categories, self._categories, self._category_names),
+        ):
+            for key, entry in group_sums(keys, self._amounts, live).items():
+                table[names[key] if names else key] = entry
+        for (month, category), entry in group_sums(
+            (self._months, self._categories), self._amounts, live
+        ).items():
+            aggregates.month_categories[
+                (month, self._category_names[category])
+            ] = entry
+        aggregates.days = group_sums(
+            day_numbers(self._times), self._amounts, live
+        )
+        for day, (cents, rows) in aggregates.days.items():
+            entry = aggregates.years.setdefault(day_year(day), [0, 0])
+            entry[0] += cents
+            entry[1] += rows
+        if self.archive is not None:
+            aggregates.merge(self.archive.aggregates)
+        self.aggregates = aggregates
+
+    def categories(self):
+        """
+        Names of the categories that currently have transactions.
+        """
+        return sorted(self.aggregates.categories)
+
+    def has_category(self, category):
+        """
+        True if any transaction has category 'category' (any case).
+        """
+        wanted = category.title()
+        return any(
+            name.title() == wanted for name in self.aggregates.categories
+        )
+
+    def query(self, category=None, start=None, end=None):
+        """
+        Returns rows in time order, optionally filtered by category
+        (any case) and by a [start, end) range of epoch seconds.
+
+        Uses the category and time indexes, so the cost is a binary
+        search plus the number of rows returned.
+        """
+        return list(self.iter_query(category, start, end))
+
+    def iter_query(self, category=None, start=None, end=None):
+        """
+        Like query(), but yields the rows one at a time.
+        """
+        self._ensure_indexes()
+        if category is None:
+            pairs = [self._by_time]
+        else:
+            wanted = category.title()
+            pairs = [
+                self._by_category[code]
+                for name, code in self._category_codes.items()
+                if name.title() == wanted and code in self._by_category
+            ]
+        ranges = []
+        for times, slots in pairs:
+            low = 0 if start is None else bisect_left(times, start)
+            high = len(times) if end is None else bisect_left(times, end)
+            count("rows_scanned", high - low)
+            ranges.append(zip(times[low:high], slots[low:high]))
+        matches = ranges[0] if len(ranges) == 1 else heapq.merge(*ranges)
+        live = self._live
+        for _, slot in matches:
+            if live[slot]:
+                yield TransactionRow(self, slot)
+
+    def iter_history(self, category=None, start=None, end=None):
+        """
+        Like iter_query(), but with the archived rows in the range too,
+        opening only the archive segments it spans.
+        """
+        rows = self.iter_query(category, start, end)
+        if self.archive is None:
+            return rows
+        return heapq.merge(
+            self.archive.iter_query(category, start, end), rows,
+            key=attrgetter("epoch"),
+        )
+
+    def ids_before(self, seconds):
+        """
+        Returns the ids of all transactions before 'seconds' (epoch).
+        """
+        return [row.id for row in self.iter_query(end=seconds)]
+
+    def position_at_or_after(self, seconds):
+        """
+        Returns the position of the earliest transaction at or after
+        'seconds' (epoch), or None if there is none.
+        """
+        row = next(self.iter_query(start=seconds), None)
+        if row is None:
+            return None
+        if not self._dead:
+            return row._slot
+        return bisect_left(self._live_positions(), row._slot)
+
+    def category_rows(self, category):
+        """
+        Returns the rows whose category matches 'category' (any case).
+        """
+        return self.query(category=category)
@@ -0,0 +1,82 @@
+# Money Track App - transaction validation rules
+
+from datetime import datetime
+from store import format_cents, parse_cents, format_timestamp
+from store import parse_timestamp
+
+
+VALID_INCOME_CATEGORIES = ["Salary", "Bonus"]
+VALID_EXPENSE_CATEGORIES = [
+    "Rent", "Food", "Transport", "Utilities", "Miscellanous"
+]
+
+
+def valid_categories(transaction_type):
+    """
+    Returns the categories allowed for 'income' or 'expense'.
+    """
+    if transaction_type == "income":
+        return VALID_INCOME_CATEGORIES
+    return VALID_EXPENSE_CATEGORIES
+
+
+def validate_transaction(transaction_type, category, amount, timestamp=None):
+    """
+    Validates transaction fields and returns the transaction to store.
+
+    Applies the same rules as the Add Transaction menu: the type must be
+    'income' or 'expense', the category one of the valid categories for
+    that type (any case) and the amount a number greater than zero that
+    fits the amounts column (see parse_cents()). An expense may also be
+    given as a negative amount, the way expenses are stored and exported,
+    so both '12.50' and '-12.50' are accepted for an expense; a negative
+    income is rejected. 'timestamp' defaults to now.
+
+    Raises:
+        ValueError: With a message describing the first invalid field.
+    """
+    transaction_type = str(transaction_type).strip().lower()
+    if transaction_type not in ["income", "expense"]:
+        raise ValueError(
+            f"Invalid type {transaction_type!r}: "
+            "expected 'income' or 'expense'"
+        )
+
+    categories = valid_categories(transaction_type)
+    category = str(category).strip().title()
+    if category not in categories:
+        raise ValueError(
+            f"Invalid {transaction_type} category {category!r}: "
+            f"expected one of {', '.join(categories)}"
+        )
+
+    cents = parse_cents(amount)
+    if cents < 0 and transaction_type == "income":
+        raise ValueError(
+            f"Invalid amount {amount!r}: an income must be positive"
+        )
+    if cents == 0:
+        raise ValueError("Amount must be greater than 0")
+    if transaction_type == "expense":
+        cents = -abs(cents)
+
+    if timestamp in (None, ""):
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    else:
+        timestamp = str(timestamp).strip()
+        if len(timestamp) == 10:
+            timestamp += " 00:00:00"
+        try:
+            timestamp = format_timestamp(parse_timestamp(timestamp))
+        except (ValueError, IndexError):
+            raise ValueError(
+                f"Invalid timestamp {timestamp!r}: "
+                "expected 'YYYY-MM-DD HH:MM:SS'"
+            )
+
+    return {
+        "type": transaction_type,
+        "category": category,
+        "amount": format_cents(cents),
+        "timestamp": timestamp,
+    }